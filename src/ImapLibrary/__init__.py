@@ -19,19 +19,49 @@
 IMAP Library - a IMAP email testing library.
 """
 
-from email import message_from_string
-from imaplib import IMAP4, IMAP4_SSL
-from re import findall
+from collections import OrderedDict
+from hashlib import new as new_hash
+from imaplib import Commands, IMAP4, IMAP4_SSL
+from multiprocessing.pool import ThreadPool
+from os.path import basename, isdir, join
+from re import IGNORECASE, compile as re_compile
+from select import select
+from threading import local
 from time import sleep, time
+from builtins import str as ustr
+from robot.api import logger
+try:
+    from ImapLibrary.engine import ENGINE
+except (ImportError, SyntaxError):
+    ENGINE = None
+from ImapLibrary.cache import CachedMessage, MessageCache, message_from_bytes
+from ImapLibrary.criteria import any_criteria, build_criteria, is_arrival_criteria, quote, \
+    search_arguments
+from ImapLibrary.extract import compile_pattern, decode_part, decode_payload, decode_text, \
+    find_links
+from ImapLibrary.pipeline import Pipeline
+from ImapLibrary.index import IndexQuery
+from ImapLibrary.parts import LazyMessage, Part, PartIndex, TransferDecoder, decode_transfer, \
+    parse_bodystructure
+from ImapLibrary.pool import POOL
+from ImapLibrary.response import parse, parse_fetch, to_int, to_str
+from ImapLibrary.schedule import PollSchedule
+from ImapLibrary.session import MailboxSession, session_state
+from ImapLibrary.stats import ImapStatistics, StatisticsListener, instrument
 try:
-    from urllib.request import urlopen
+    from ImapLibrary.store import DiskStore
 except ImportError:
-    from urllib2 import urlopen
-from builtins import str as ustr
+    DiskStore = None
 from ImapLibrary.version import get_version
+from ImapLibrary.web import POOL as HTTP_POOL
 
 __version__ = get_version()
 
+Commands.setdefault('ENABLE', ('AUTH',))
+Commands.setdefault('MOVE', ('SELECTED',))
+CRLF = b'\r\n'
+IDLE_EVENT = re_compile(br'^\* (\d+) (EXISTS|EXPUNGE|RECENT)\b', IGNORECASE)
+
 
 class ImapLibrary(object):
     """ImapLibrary is an email testing library for [http://goo.gl/lES6WM|Robot Framework].
@@ -66,11 +96,41 @@ class ImapLibrary(object):
     | `Close Mailbox`  |                        |                              |                 |
     """
 
+    ATTACHMENT_CHUNK_SIZE = 1024 * 1024
+    FETCH_CHUNK_SIZE = 50
+    FETCH_INDEX_ITEMS = '(UID FLAGS RFC822.SIZE ENVELOPE BODYSTRUCTURE)'
+    IDLE_TIMEOUT = 29 * 60
+    LINK_MAX_BYTES = 10 * 1024 * 1024
+    LINK_TIMEOUT = 30
     PORT = 143
     PORT_SECURE = 993
+    PROVIDER_PROFILES = {'gmail': {'change_detection': 'select'}}
+    SESSION_KEYWORDS = ('close_all_mailboxes', 'close_mailbox', 'open_mailbox',
+                        'run_keyword_in_mailboxes', 'switch_mailbox')
+    STORE_CHUNK_SIZE = 1000
+    WORKER_THREADS = 8
     ROBOT_LIBRARY_SCOPE = 'GLOBAL'
     ROBOT_LIBRARY_VERSION = __version__
 
+    _account = session_state('account')
+    _change_detection = session_state('change_detection')
+    _email_index = session_state('email_index')
+    _exists = session_state('exists')
+    _extensions = session_state('extensions')
+    _imap = session_state('imap')
+    _index = session_state('index')
+    _mailbox = session_state('mailbox')
+    _mails = session_state('mails')
+    _mp_iter = session_state('mp_iter')
+    _mp_msg = session_state('mp_msg')
+    _part = session_state('part')
+    _pipelining = session_state('pipelining')
+    _pool_key = session_state('pool_key')
+    _uidnext = session_state('uidnext')
+    _uids = session_state('uids')
+    _uidvalidity = session_state('uidvalidity')
+    _wait_statistics = session_state('wait_statistics')
+
     def __init__(self):
         """ImapLibrary can be imported without argument.
 
@@ -78,42 +138,171 @@ class ImapLibrary(object):
         | = Keyword Definition =  | = Description =       |
         | Library `|` ImapLibrary | Initiate Imap library |
         """
-        self._email_index = None
-        self._imap = None
-        self._mails = []
-        self._mp_iter = None
-        self._mp_msg = None
-        self._part = None
+        self._alias = None
+        self._cache = MessageCache()
+        self._current = MailboxSession()
+        self._local = local()
+        self._sessions = OrderedDict()
+        self._statistics = ImapStatistics()
+        self.ROBOT_LIBRARY_LISTENER = StatisticsListener(self._statistics, [
+            name for name in dir(type(self))
+            if not name.startswith('_') and callable(getattr(type(self), name))])
+
+    def clear_mail_cache(self):
+        """Removes all cached email messages, both from memory and from the on-disk cache
+        enabled by `Open Mailbox` ``cache_path``.
+
+        Examples:
+        | Clear Mail Cache |
+        """
+        self._cache.clear()
+
+    def close_all_mailboxes(self):
+        """Close all IMAP email client sessions opened by `Open Mailbox`.
+
+        Examples:
+        | Close All Mailboxes |
+        """
+        for alias in list(self._sessions):
+            self.switch_mailbox(alias)
+            self.close_mailbox()
+        self._alias = None
+        self._current = MailboxSession()
 
     def close_mailbox(self):
-        """Close IMAP email client session.
+        """Close the current IMAP email client session.
+
+        Pooled session will be returned to the session pool instead of being logged out.
 
         Examples:
         | Close Mailbox |
         """
+        if self._sessions.get(self._alias) is self._current:
+            del self._sessions[self._alias]
         self._imap.close()
+        if self._pool_key is None:
+            self._imap.logout()
+        else:
+            POOL.release(self._pool_key, self._imap)
+            self._pool_key = None
+
+    def count_emails(self, **kwargs):
+        """Returns the number of email messages matching given filter criteria.
 
-    def delete_all_emails(self):
-        """Delete all emails.
+        When the IMAP server supports [https://tools.ietf.org/html/rfc4731|ESEARCH],
+        only the count is returned by the server instead of every matching email index.
+
+        Arguments:
+        - ``kwargs``: The filter criteria of `Wait For Email`, e.g. ``sender`` or ``since``.
+                      (Default UNSEEN email messages)
+
+        Examples:
+        | ${count} = | Count Emails | sender=noreply@domain.com | status=ALL |
+        """
+        criteria = build_criteria(**kwargs)
+        self._refresh_mailbox()
+        if 'ESEARCH' in self._imap.capabilities:
+            arguments = self._search_arguments(criteria)
+            charset = ['CHARSET', arguments[0]] if arguments[0] else []
+            return int(self._esearch('SEARCH', 'RETURN', '(COUNT)', *(charset + arguments[1:]))
+                       .get('COUNT', 0))
+        return len(self._search(criteria))
+
+    def delete_all_emails(self, trash=None):
+        """Delete all emails found by the latest `Wait For Email`.
+
+        The email messages are flagged as deleted with one STORE command for many email
+        messages, and then removed with a single EXPUNGE command. When the IMAP server
+        supports [https://tools.ietf.org/html/rfc4315|UIDPLUS], only these email messages
+        are expunged.
+
+        Arguments:
+        - ``trash``: The folder name to move the email messages into, instead of
+                     permanently deleting them. (Default None)
 
         Examples:
         | Delete All Emails |
+        | Delete All Emails | trash=Trash |
         """
-        for mail in self._mails:
-            self._imap.store(mail, '+FLAGS', r'\DELETED')
-        self._imap.expunge()
+        if trash:
+            self._move_emails(self._mails, trash)
+        else:
+            self._delete_emails(self._mails)
+        self._mails = []
 
-    def delete_email(self, email_index):
+    def delete_email(self, email_index, trash=None):
         """Delete email on given ``email_index``.
 
         Arguments:
         - ``email_index``: An email index to identity the email message.
+        - ``trash``: The folder name to move the email message into, instead of
+                     permanently deleting it. (Default None)
 
         Examples:
         | Delete Email | INDEX |
+        | Delete Email | INDEX | trash=Trash |
+        """
+        if trash:
+            self._move_emails([email_index], trash)
+        else:
+            self._delete_emails([email_index])
+
+    def fetch_emails(self, email_indexes=None, chunk_size=None):
+        """Returns the list of email messages on given ``email_indexes``,
+        otherwise all email messages found by the latest `Wait For Email`.
+
+        The email messages which are not cached yet are fetched with one FETCH command
+        for each ``chunk_size`` email messages. The returned email messages are in
+        the same order as given ``email_indexes``.
+
+        Arguments:
+        - ``email_indexes``: The list of email indexes to identity the email messages.
+                             (Default None)
+        - ``chunk_size``: The maximum number of email messages fetched at once. (Default 50)
+
+        Examples:
+        | Fetch Emails |
+        | Fetch Emails | ${INDEXES} |
+        | Fetch Emails | ${INDEXES} | chunk_size=200 |
+        """
+        indexes = self._mails if email_indexes is None else email_indexes
+        chunk_size = int(chunk_size or self.FETCH_CHUNK_SIZE)
+        self._resolve_uids(indexes)
+        messages = {}
+        for index in indexes:
+            entry = self._cached_message(index)
+            if entry is not None:
+                messages[int(index)] = entry
+        missing = [index for index in indexes if int(index) not in messages]
+        messages.update(self._fetch_messages(*self._sequence_sets(missing, chunk_size)))
+        return [messages[int(index)].message if int(index) in messages else None
+                for index in indexes]
+
+    def find_part(self, email_index, content_type=None, filename=None, disposition=None,
+                  lazy=False):
+        """Returns the index of the first part of the email message on given ``email_index``
+        matching all given criteria, to be used with `Get Part Payload`.
+
+        Arguments:
+        - ``email_index``: An email index to identity the email message.
+        - ``content_type``: A content type pattern, e.g. ``text/html`` or ``image/*``.
+                            (Default None)
+        - ``disposition``: A content disposition, e.g. ``attachment`` or ``inline``.
+                           (Default None)
+        - ``filename``: A file name pattern, e.g. ``*.pdf``. (Default None)
+        - ``lazy``: An indicator flag to only fetch the MIME structure. (Default False)
+
+        Examples:
+        | ${index} = | Find Part | INDEX | content_type=text/html |
+        | ${index} = | Find Part | INDEX | filename=*.pdf | disposition=attachment |
         """
-        self._imap.store(email_index, '+FLAGS', r'\DELETED')
-        self._imap.expunge()
+        index = self._parts(email_index, lazy).find(content_type, filename, disposition)
+        if index is None:
+            raise AssertionError('Part %s not found!' % ', '.join(
+                '%s=%s' % (name, value) for name, value in (
+                    ('content_type', content_type), ('filename', filename),
+                    ('disposition', disposition)) if value is not None))
+        return index
 
     def get_email_body(self, email_index):
         """Returns the decoded email body on multipart email message,
@@ -128,25 +317,142 @@ class ImapLibrary(object):
         if self._is_walking_multipart(email_index):
             body = self.get_multipart_payload(decode=True)
         else:
-            body = self._imap.fetch(email_index, '(BODY[TEXT])')[1][0][1].decode('quoted-printable')
+            body = self._fetch_message(email_index).body
         return body
 
-    def get_links_from_email(self, email_index):
+    def get_email_parts(self, email_index, lazy=False):
+        """Returns a list of dictionaries of all parts of the email message on given
+        ``email_index``, in `Walk Multipart Email` order: the part ``index`` to be used with
+        `Get Part Payload`, its IMAP part ``path``, ``content_type``, ``charset``, encoded
+        payload ``size`` in bytes, ``disposition`` and ``filename``.
+
+        The parts are indexed once per email message, and kept with the cached email message.
+
+        Arguments:
+        - ``email_index``: An email index to identity the email message.
+        - ``lazy``: An indicator flag to only fetch the MIME structure. (Default False)
+
+        Examples:
+        | ${parts} = | Get Email Parts | INDEX |
+        | ${parts} = | Get Email Parts | INDEX | lazy=True |
+        """
+        parts = []
+        for index, part in enumerate(self._parts(email_index, lazy).descriptors):
+            description = part.to_dict()
+            description['index'] = index
+            parts.append(description)
+        return parts
+
+    def get_imap_statistics(self, **kwargs):
+        """Returns a dictionary of the IMAP statistics, in ``total`` and per ``keywords`` name:
+        the number of keyword ``calls`` and their ``elapsed`` seconds, the IMAP ``commands``
+        with their ``count``, round-trip ``seconds`` and ``max_seconds``, the ``bytes_in``
+        received and ``bytes_out`` sent, the message cache ``cache_hits`` and ``cache_misses``,
+        and the mailbox checks ``polls``, and the message ``cache`` statistics.
+
+        Arguments:
+        - ``log``: An indicator flag to write the statistics into the log. (Default False)
+        - ``output_format``: The statistics file format, ``json`` or ``prometheus``
+                             text exposition format. (Default json)
+        - ``path``: The file path to write the statistics into. (Default None)
+        - ``reset``: An indicator flag to reset the statistics after returning them.
+                     (Default False)
+
+        Examples:
+        | ${stats} = | Get IMAP Statistics |
+        | Get IMAP Statistics | log=True | reset=True |
+        | Get IMAP Statistics | path=${OUTPUT DIR}${/}imap.prom | output_format=prometheus |
+        """
+        output_format = kwargs.pop('output_format', 'json').lower()
+        if output_format not in ('json', 'prometheus'):
+            raise ValueError('Unknown output format: %s' % output_format)
+        statistics = self._statistics.snapshot()
+        statistics['cache'] = self._cache.statistics()
+        if self._to_bool(kwargs.pop('log', False)):
+            logger.info('IMAP statistics: %s' % self._statistics.to_json())
+        path = kwargs.pop('path', None)
+        if path:
+            text = self._statistics.to_json() if output_format == 'json' else \
+                self._statistics.to_prometheus()
+            with open(path, 'wb') as writer:
+                writer.write(text.encode('utf-8'))
+        if self._to_bool(kwargs.pop('reset', False)):
+            self._statistics.reset()
+        return statistics
+
+    def get_latest_email(self, **kwargs):
+        """Returns the email index of the latest email message matching given filter criteria,
+        the only email message found for `Delete All Emails`, `Fetch Emails`, and
+        `Mark All Emails As Read`. Fails when no email message matches.
+
+        The latest email message is the last arrived one when the IMAP server supports
+        [https://tools.ietf.org/html/rfc5256|SORT], otherwise the highest email index.
+        When the IMAP server supports [https://tools.ietf.org/html/rfc5267|ESORT] or
+        [https://tools.ietf.org/html/rfc4731|ESEARCH], only that email index is returned
+        by the server instead of every matching email index.
+
+        Arguments:
+        - ``kwargs``: The filter criteria of `Wait For Email`, e.g. ``sender`` or ``since``.
+                      (Default UNSEEN email messages)
+
+        Examples:
+        | ${index} = | Get Latest Email | sender=noreply@domain.com | status=ALL |
+        """
+        criteria = build_criteria(**kwargs)
+        self._refresh_mailbox()
+        capabilities = self._imap.capabilities
+        arguments = self._search_arguments(criteria)
+        sort = ['(REVERSE ARRIVAL)', arguments[0] or 'UTF-8'] + arguments[1:]
+        if 'ESORT' in capabilities:
+            latest = self._esearch('SORT', 'RETURN', '(MIN)', *sort).get('MIN')
+        elif 'ESEARCH' in capabilities:
+            charset = ['CHARSET', arguments[0]] if arguments[0] else []
+            latest = self._esearch('SEARCH', 'RETURN', '(MAX)',
+                                   *(charset + arguments[1:])).get('MAX')
+        elif 'SORT' in capabilities:
+            typ, data = self._imap.sort(*sort)
+            if typ != 'OK':
+                raise Exception('imap.sort error: %s, %s, criteria=%s' % (typ, data, criteria))
+            found = b' '.join(value for value in data if value).split()
+            latest = found[0] if found else None
+        else:
+            found = self._search(criteria)
+            latest = found[-1] if found else None
+        if latest is None:
+            raise AssertionError('No email found matching %s' % ' '.join(criteria))
+        self._mails = [to_str(latest)]
+        return self._mails[0]
+
+    def get_links_from_email(self, email_index, details=False):
         """Returns all links found in the email body from given ``email_index``.
 
+        The links of all ``text/html`` and ``text/plain`` parts are extracted at once,
+        and kept with the cached email message for the next link keywords.
+        During `Walk Multipart Email`, only the links of the current part are returned.
+
         Arguments:
         - ``email_index``: An email index to identity the email message.
+        - ``details``: An indicator flag to return a dictionary of each link ``url``,
+                       its anchor ``text``, and the ``part`` index of the email message part
+                       in `Walk Multipart Email` order, instead of the link URL. (Default False)
 
         Examples:
         | Get Links From Email | INDEX |
+        | Get Links From Email | INDEX | details=True |
         """
-        body = self.get_email_body(email_index)
-        return findall(r'href=[\'"]?([^\'" >]+)', body)
+        links = self._links(email_index)
+        if self._to_bool(details):
+            return [link.to_dict() for link in links]
+        return [link.url for link in links]
 
     def get_matches_from_email(self, email_index, pattern):
         """Returns all Regular Expression ``pattern`` found in the email body
         from given ``email_index``.
 
+        The ``text/html`` and ``text/plain`` parts are searched, the compiled ``pattern``
+        is reused by the next calls. During `Walk Multipart Email`, only the current part
+        is searched.
+
         Arguments:
         - ``email_index``: An email index to identity the email message.
         - ``pattern``: It consists of one or more character literals, operators, or constructs.
@@ -154,8 +460,9 @@ class ImapLibrary(object):
         Examples:
         | Get Matches From Email | INDEX | PATTERN |
         """
-        body = self.get_email_body(email_index)
-        return findall(pattern, body)
+        if self._is_walking_multipart(email_index):
+            return compile_pattern(pattern).findall(decode_text(self._part))
+        return self._fetch_message(email_index).text.findall(pattern)
 
     def get_multipart_content_type(self):
         """Returns the content type of current part of selected multipart email message.
@@ -186,30 +493,71 @@ class ImapLibrary(object):
         """
         return list(self._mp_msg.keys())
 
-    def get_multipart_payload(self, decode=False):
+    def get_multipart_payload(self, decode=False, start=None, length=None):
         """Returns the payload of current part of selected multipart email message.
 
+        On lazy walk, only the requested byte range of the part payload is fetched.
+        The decoded payload of each part is kept, it is only decoded once.
+
         Arguments:
         - ``decode``: An indicator flag to decode the email message. (Default False)
+        - ``length``: The maximum number of payload bytes to return. (Default None)
+        - ``start``: The payload byte offset to start from. (Default None)
 
         Examples:
         | Get Multipart Payload |
         | Get Multipart Payload | decode=True |
+        | Get Multipart Payload | decode=True | start=0 | length=1024 |
         """
-        payload = self._part.get_payload(decode=decode)
-        charset = self._part.get_content_charset()
-        if charset is not None:
-            return payload.decode(charset)
-        return payload
+        return self._payload(self._part, decode, start, length)
+
+    def get_part_payload(self, email_index, index, decode=False, start=None, length=None,
+                         lazy=False):
+        """Returns the payload of the part on given ``index`` of the email message on given
+        ``email_index``, without walking through the previous parts.
+
+        On lazy, only the MIME structure and the requested part payload are fetched.
+
+        Arguments:
+        - ``email_index``: An email index to identity the email message.
+        - ``index``: The part index from `Get Email Parts` or `Find Part`.
+        - ``decode``: An indicator flag to decode the part payload. (Default False)
+        - ``lazy``: An indicator flag to only fetch the MIME structure and the part payload.
+                    (Default False)
+        - ``length``: The maximum number of payload bytes to return. (Default None)
+        - ``start``: The payload byte offset to start from. (Default None)
+
+        Examples:
+        | ${index} = | Find Part | INDEX | content_type=text/html |
+        | ${html} = | Get Part Payload | INDEX | ${index} | decode=True |
+        """
+        parts = self._parts(email_index, lazy)
+        index = int(index)
+        if not -len(parts) <= index < len(parts):
+            raise AssertionError('Part number %i not found!' % index)
+        return self._payload(parts.parts[index], decode, start, length)
+
+    def get_wait_statistics(self):
+        """Returns a dictionary of the latest `Wait For Email` or `Wait For Multiple Emails`
+        statistics: the number of mailbox checks ``polls``, the ``elapsed`` seconds,
+        and the ``time_to_match`` seconds until the first matching email message,
+        or None when no email message was received.
+
+        Examples:
+        | ${stats} = | Get Wait Statistics |
+        """
+        return dict(self._wait_statistics)
 
     def mark_all_emails_as_read(self):
         """Mark all received emails as read.
 
+        The email messages are flagged as read with one STORE command for many email messages.
+
         Examples:
         | Mark All Emails As Read |
         """
-        for mail in self._mails:
-            self._imap.store(mail, '+FLAGS', r'\SEEN')
+        self._execute(*[('store', (sequence_set, '+FLAGS', r'\SEEN')) for sequence_set
+                        in self._sequence_sets(self._mails, self.STORE_CHUNK_SIZE)])
 
     def mark_as_read(self):
         """****DEPRECATED****
@@ -228,28 +576,80 @@ class ImapLibrary(object):
         """
         self._imap.store(email_index, '+FLAGS', r'\SEEN')
 
-    def open_link_from_email(self, email_index, link_index=0):
+    def open_all_links_from_email(self, email_index, **kwargs):
+        """Opens all link URLs in email message body of given ``email_index`` concurrently.
+        Returns a list of dictionaries, in link order, of each link ``url``, its HTTP
+        ``status``, ``latency`` in seconds, ``bytes`` read, decoded ``body``, whether the body
+        was ``truncated``, and the connection ``error`` if any.
+
+        The links are opened on a pool of at most ``workers`` threads sharing keep-alive
+        HTTP connections, a failed link does not stop the other links.
+
+        Arguments:
+        - ``email_index``: An email index to identity the email message.
+        - ``max_bytes``: The maximum response body bytes read per link. (Default 10485760)
+        - ``timeout``: The maximum value in seconds to connect and wait for each read.
+                       (Default 30)
+        - ``workers``: The maximum number of links opened at the same time. (Default 8)
+
+        Examples:
+        | ${results} = | Open All Links From Email | INDEX |
+        | ${results} = | Open All Links From Email | INDEX | timeout=5 | max_bytes=65536 |
+        """
+        max_bytes = int(kwargs.pop('max_bytes', self.LINK_MAX_BYTES))
+        timeout = float(kwargs.pop('timeout', self.LINK_TIMEOUT))
+        workers = int(kwargs.pop('workers', self.WORKER_THREADS))
+        urls = self.get_links_from_email(email_index)
+        if not urls:
+            return []
+
+        def open_link(url):
+            """Returns the result of opening given link ``url``."""
+            return HTTP_POOL.open(url, timeout=timeout, max_bytes=max_bytes).to_dict()
+
+        threads = ThreadPool(max(1, min(len(urls), workers)))
+        try:
+            results = threads.map(open_link, urls)
+        finally:
+            threads.close()
+            threads.join()
+        for result in results:
+            logger.info('%s: %s, %d bytes in %.3fs' % (
+                result['url'], result['error'] or result['status'], result['bytes'],
+                result['latency']))
+        return results
+
+    def open_link_from_email(self, email_index, link_index=0, **kwargs):
         """Open link URL from given ``link_index`` in email message body of given ``email_index``.
         Returns HTML content of opened link URL.
 
+        The link is opened on a pooled keep-alive HTTP connection, and fails on connection
+        errors and HTTP error statuses.
+
         Arguments:
         - ``email_index``: An email index to identity the email message.
         - ``link_index``: The link index to be open. (Default 0)
+        - ``max_bytes``: The maximum response body bytes read. (Default 10485760)
+        - ``timeout``: The maximum value in seconds to connect and wait for each read.
+                       (Default 30)
 
         Examples:
         | Open Link From Email |
         | Open Link From Email | 1 |
+        | Open Link From Email | 1 | timeout=5 |
         """
         urls = self.get_links_from_email(email_index)
+        link_index = int(link_index)
 
         if len(urls) > link_index:
-            resp = urlopen(urls[link_index])
-            content_type = resp.headers.getheader('content-type')
-            if content_type:
-                enc = content_type.split('charset=')[-1]
-                return ustr(resp.read(), enc)
-            else:
-                return resp.read()
+            result = HTTP_POOL.open(
+                urls[link_index], timeout=float(kwargs.pop('timeout', self.LINK_TIMEOUT)),
+                max_bytes=int(kwargs.pop('max_bytes', self.LINK_MAX_BYTES)))
+            if result.error is not None:
+                raise AssertionError('Link %s failed: %s' % (result.url, result.error))
+            if result.status >= 400:
+                raise AssertionError('Link %s failed: HTTP %d' % (result.url, result.status))
+            return result.body
         else:
             raise AssertionError("Link number %i not found!" % link_index)
 
@@ -262,34 +662,284 @@ class ImapLibrary(object):
     def open_mailbox(self, **kwargs):
         """Open IMAP email client session to given ``host`` with given ``user`` and ``password``.
 
+        The session becomes the current session used by the other keywords. Several
+        sessions can be opened at once with different ``alias``, see `Switch Mailbox`.
+
         Arguments:
+        - ``alias``: The session alias, to switch back to the session with `Switch Mailbox`.
+                     An opened session of the same alias is replaced. (Default None)
+        - ``cache_disk_size``: The maximum total size in bytes of email messages cached on disk.
+                               (Default 268435456)
+        - ``cache_path``: The SQLite database file path of a persistent on-disk cache of
+                          email messages, shared by the next test runs. Email messages
+                          are keyed by host, user, mailbox, UIDVALIDITY, and UID, and never
+                          change, so only their UIDs are fetched again. (Default None)
+        - ``cache_size``: The maximum total size in bytes of email messages cached in memory.
+                          (Default 33554432)
+        - ``condstore``: An indicator flag to enable
+                         [https://tools.ietf.org/html/rfc7162|CONDSTORE and QRESYNC]
+                         extensions when the server supports them, so that the local mailbox
+                         index only fetches the flag changes and the removed email messages
+                         since its previous refresh. (Default True)
+        - ``change_detection``: How mailbox checks detect new email messages before searching:
+                                ``select`` to select the mailbox again on every check,
+                                ``noop`` to only search after a ``NOOP`` command reports
+                                new email messages, or ``status`` to only search after
+                                the mailbox ``STATUS`` ``UIDNEXT`` changes. (Default select)
         - ``host``: The IMAP host server. (Default None)
         - ``is_secure``: An indicator flag to connect to IMAP host securely or not. (Default True)
         - ``password``: The plaintext password to be use to authenticate mailbox on given ``host``.
+        - ``pipelining``: An indicator flag to send several IMAP commands without waiting
+                          for the previous command response, e.g. ``SELECT`` with ``SEARCH``
+                          on mailbox check, or all ``FETCH`` commands of `Fetch Emails`.
+                          (Default False)
+        - ``pool``: An indicator flag to reuse an authenticated session from the session pool,
+                    the session will be returned to the pool by `Close Mailbox`. (Default False)
+        - ``pool_idle_timeout``: The maximum value in seconds an unused session is kept
+                                 in the session pool. (Default 300)
+        - ``pool_size``: The maximum number of unused sessions kept in the session pool.
+                         (Default 8)
         - ``port``: The IMAP port number. (Default None)
+        - ``provider``: The email provider profile, ``gmail`` always selects the mailbox again
+                        on every check, since gmail only shows new email messages
+                        after the mailbox selection. It is detected from the server
+                        capabilities when not given. (Default None)
         - ``user``: The username to be use to authenticate mailbox on given ``host``.
 
         Examples:
         | Open Mailbox | host=HOST | user=USER | password=SECRET |
         | Open Mailbox | host=HOST | user=USER | password=SECRET | is_secure=False |
         | Open Mailbox | host=HOST | user=USER | password=SECRET | port=8000 |
+        | Open Mailbox | host=HOST | user=USER | password=SECRET | pool=True |
+        | Open Mailbox | host=HOST | user=USER | password=SECRET | alias=recipient |
+        | Open Mailbox | host=HOST | user=USER | password=SECRET | pipelining=True |
+        | Open Mailbox | host=HOST | user=USER | password=SECRET | change_detection=noop |
+        | Open Mailbox | host=HOST | user=USER | password=SECRET | cache_path=${CACHE_PATH} |
         """
+        self._alias = kwargs.pop('alias', None)
+        self._current = self._sessions[self._alias] = MailboxSession()
         host = kwargs.pop('host', kwargs.pop('server', None))
-        is_secure = kwargs.pop('is_secure', True)
+        is_secure = self._to_bool(kwargs.pop('is_secure', True))
         port = int(kwargs.pop('port', self.PORT_SECURE if is_secure else self.PORT))
-        self._imap = IMAP4_SSL(host, port) if is_secure else IMAP4(host, port)
-        self._imap.login(kwargs.pop('user', None), kwargs.pop('password', None))
+        user = kwargs.pop('user', None)
+        password = kwargs.pop('password', None)
+        if self._to_bool(kwargs.pop('pool', False)):
+            POOL.idle_timeout = float(kwargs.pop('pool_idle_timeout', POOL.idle_timeout))
+            POOL.max_size = int(kwargs.pop('pool_size', POOL.max_size))
+            self._pool_key = (host, port, user, is_secure)
+            self._imap = POOL.acquire(self._pool_key)
+        if self._imap is None:
+            start_time = time()
+            self._imap = IMAP4_SSL(host, port) if is_secure else IMAP4(host, port)
+            self._statistics.command('CONNECT', time() - start_time)
+            instrument(self._imap, self._statistics)
+            self._imap.login(user, password)
+        else:
+            instrument(self._imap, self._statistics)
+        self._extensions = ()
+        if self._to_bool(kwargs.pop('condstore', True)):
+            self._enable_extensions()
         self._imap.select()
+        self._cache.max_bytes = int(kwargs.pop('cache_size', self._cache.max_bytes))
+        self._open_cache_store(kwargs.pop('cache_path', None), kwargs.pop('cache_disk_size', None))
+        self._pipelining = self._to_bool(kwargs.pop('pipelining', False))
+        provider = kwargs.pop('provider', None)
+        if provider is None and 'X-GM-EXT-1' in self._imap.capabilities:
+            provider = 'gmail'
+        profile = self.PROVIDER_PROFILES.get((provider or '').lower(), {})
+        self._change_detection = profile.get(
+            'change_detection', kwargs.pop('change_detection', 'select')).lower()
+        if self._change_detection not in ('noop', 'select', 'status'):
+            raise ValueError('Unknown change detection: %s' % self._change_detection)
+        self._account = (host, port, user, password, is_secure)
+        self._mailbox = (host, port, user, 'INBOX')
+        self._uids = {}
+        self._uidvalidity = self._response_number('UIDVALIDITY')
+        self._index.clear()
         self._init_multipart_walk()
 
+    def run_keyword_in_mailboxes(self, aliases, name, *args, **kwargs):
+        """Runs the library keyword of given ``name`` with given arguments in each session
+        of given ``aliases`` concurrently. Returns a dictionary of session alias to
+        the keyword result.
+
+        The keywords run on a pool of at most 8 worker threads, each session is used by
+        one keyword at a time. The first keyword failure is raised once all keywords ended.
+
+        Arguments:
+        - ``aliases``: A list of session aliases or a comma separated session aliases.
+        - ``name``: The library keyword name, e.g. ``Wait For Email``.
+        - ``args``: The keyword arguments.
+
+        Examples:
+        | Open Mailbox | host=HOST | user=SENDER | password=SECRET | alias=sender |
+        | Open Mailbox | host=HOST | user=RECIPIENT | password=SECRET | alias=recipient |
+        | ${indexes} = | Run Keyword In Mailboxes | sender,recipient | Wait For Email | subject=Hi |
+        """
+        aliases, sessions = self._alias_sessions(aliases)
+        keyword = self._library_keyword(name)
+        workers = ThreadPool(max(1, min(len(sessions), self.WORKER_THREADS)))
+        try:
+            outcomes = workers.map(
+                lambda session: self._run_in_session(session, keyword, args, kwargs), sessions)
+        finally:
+            workers.close()
+            workers.join()
+        for _, error in outcomes:
+            if error is not None:
+                raise error
+        return dict((alias, result) for alias, (result, _) in zip(aliases, outcomes))
+
+    def save_attachment(self, email_index, path, filename=None, part=None, **kwargs):
+        """Saves the attachment of email message on given ``email_index`` into given ``path``.
+        Returns a dictionary of the saved file ``path``, its ``size`` in bytes,
+        and its ``digest`` hexadecimal string.
+
+        The attachment is fetched in ``chunk_size`` bytes chunks and decoded
+        into the file while it is being fetched, without loading the whole attachment
+        or email message in memory.
+
+        Arguments:
+        - ``email_index``: An email index to identity the email message.
+        - ``path``: The file path to save the attachment into, or a directory path to
+                    save the attachment with its own file name.
+        - ``filename``: The attachment file name to save, otherwise the first attachment
+                        is saved. (Default None)
+        - ``part``: The IMAP part number of the attachment to save, e.g. ``2`` or ``1.2``.
+                    (Default None)
+        - ``algorithm``: The digest hash algorithm name. (Default sha256)
+        - ``chunk_size``: The maximum number of bytes fetched at once. (Default 1048576)
+
+        Examples:
+        | Save Attachment | INDEX | ${OUTPUT DIR} |
+        | Save Attachment | INDEX | ${OUTPUT DIR}${/}report.pdf | filename=report.pdf |
+        | Save Attachment | INDEX | ${OUTPUT DIR} | part=2 | algorithm=md5 |
+        """
+        digest = new_hash(kwargs.pop('algorithm', 'sha256'))
+        chunk_size = int(kwargs.pop('chunk_size', self.ATTACHMENT_CHUNK_SIZE))
+        attachment = self._find_attachment(self._fetch_structure(email_index), filename, part)
+        if isdir(path):
+            path = join(path, basename(attachment.get_filename('part-%s' % attachment.path)))
+        decoder = TransferDecoder(attachment.encoding)
+        size = 0
+        start = 0
+        with open(path, 'wb') as writer:
+            while True:
+                chunk = attachment.get_payload(start=start, length=chunk_size)
+                start += len(chunk)
+                data = decoder.decode(chunk) if chunk else decoder.flush()
+                writer.write(data)
+                digest.update(data)
+                size += len(data)
+                if not chunk:
+                    break
+        return {'digest': digest.hexdigest(), 'path': path, 'size': size}
+
+    def search_emails(self, **kwargs):
+        """Returns the list of email indexes matching given filters, searched in memory
+        with the local mailbox index.
+
+        The local mailbox index keeps the envelope, the flags, the size, and the MIME structure
+        of each email message. It is built on the first search, then only email messages
+        arrived since the previous search are fetched into the index, so repeated
+        searches do not make the IMAP server scan the mailbox again.
+        The email body text is not indexed.
+
+        Arguments:
+        - ``attachment``: A part of an attachment file name. (Default None)
+        - ``before``: The email messages sent before given date, either ``YYYY-MM-DD``
+                      or ``DD-Mon-YYYY``. (Default None)
+        - ``larger``: The email messages larger than given size in bytes. (Default None)
+        - ``message_id``: The email message ``Message-ID`` header value. (Default None)
+        - ``recipient``: A part of the ``To``, ``Cc``, or ``Bcc`` addresses. (Default None)
+        - ``recipient_regex``: A regular expression searched in the recipient addresses.
+                               (Default None)
+        - ``sender``: A part of the ``From`` addresses. (Default None)
+        - ``sender_regex``: A regular expression searched in the ``From`` addresses.
+                            (Default None)
+        - ``since``: The email messages sent on or after given date, either ``YYYY-MM-DD``
+                     or ``DD-Mon-YYYY``. (Default None)
+        - ``smaller``: The email messages smaller than given size in bytes. (Default None)
+        - ``status``: A flag status: ``ALL``, ``ANSWERED``, ``DELETED``, ``DRAFT``,
+                      ``FLAGGED``, ``RECENT``, ``SEEN``, or their ``UN`` prefixed negation.
+                      (Default UNSEEN without any other filter, otherwise ALL)
+        - ``subject``: A part of the subject. (Default None)
+        - ``subject_regex``: A regular expression searched in the subject. (Default None)
+
+        Text filters are compared case-insensitively, the same as the IMAP server search.
+
+        Examples:
+        | @{indexes} = | Search Emails | sender=noreply@domain.com | since=2024-01-01 |
+        | @{indexes} = | Search Emails | subject_regex=^Invoice #\\d+$ | attachment=.pdf |
+        """
+        return self._search_index(IndexQuery(**kwargs))
+
+    def switch_mailbox(self, alias):
+        """Switches the current session to the session opened by `Open Mailbox`
+        with given ``alias``. Returns the previous session alias.
+
+        Arguments:
+        - ``alias``: The session alias.
+
+        Examples:
+        | ${previous} = | Switch Mailbox | recipient |
+        | Switch Mailbox | ${previous} |
+        """
+        if alias not in self._sessions:
+            raise ValueError('Unknown mailbox alias: %s' % alias)
+        previous = self._alias
+        self._alias = alias
+        self._current = self._sessions[alias]
+        return previous
+
     def wait_for_email(self, **kwargs):
         """Wait for email message to arrived base on any given filter criteria.
         Returns email index of the latest email message received.
 
+        When the IMAP server supports [https://tools.ietf.org/html/rfc2177|IDLE] command,
+        the mailbox will be checked as soon as the server notifies a new email message arrival,
+        instead of waiting for the next mailbox check delay.
+
+        Only the first mailbox check searches the whole mailbox, the next checks only
+        search the email messages arrived after the previous check.
+
+        The delay between mailbox checks starts at ``poll_frequency`` and is multiplied by
+        ``poll_backoff`` after each check, up to ``poll_max`` seconds. It never goes past
+        the ``timeout``. The wait statistics are logged and available from
+        `Get Wait Statistics`.
+
+        The filter criteria are searched by the IMAP server. Text containing non-ASCII
+        characters is searched with ``CHARSET UTF-8``.
+
         Arguments:
+        - ``any``: A list of criteria dictionaries, email messages matching any of them
+                   are found. (Default None)
+        - ``before``: The email messages received before given date, either ``YYYY-MM-DD``
+                      or ``DD-Mon-YYYY``. (Default None)
+        - ``exclude``: A criteria dictionary of email messages not to be found. (Default None)
+        - ``gmail_raw``: A Gmail search query, only supported by Gmail. (Default None)
+        - ``header``: A ``Name: value`` header field filter, a list of them, or a dictionary
+                      of header field name to value. (Default None)
+        - ``idle``: An indicator flag to use IMAP IDLE command when it is supported by
+                    the server. (Default True)
+        - ``keyword``: A flag keyword set on the email messages. (Default None)
+        - ``larger``: The email messages larger than given size in bytes. (Default None)
+        - ``on``: The email messages received on given date. (Default None)
+        - ``poll_backoff``: The factor applied to the delay after each mailbox check.
+                            (Default 1)
         - ``poll_frequency``: The delay value in seconds to retry the mailbox check. (Default 10)
+        - ``poll_jitter``: The random fraction of the delay added or removed, between 0 and 1,
+                           so that parallel tests do not check the mailbox at the same time.
+                           (Default 0)
+        - ``poll_max``: The maximum delay value in seconds between mailbox checks.
+                        (Default None)
         - ``recipient``: Email recipient. (Default None)
         - ``sender``: Email sender. (Default None)
+        - ``sent_before``, ``sent_on``, ``sent_since``: The email messages sent before, on,
+                      or on and after given date, according to their ``Date`` header field.
+                      (Default None)
+        - ``since``: The email messages received on or after given date. (Default None)
+        - ``smaller``: The email messages smaller than given size in bytes. (Default None)
         - ``status``: A mailbox status filter: ``MESSAGES``, ``RECENT``, ``UIDNEXT``,
                       ``UIDVALIDITY``, and ``UNSEEN``.
                       Please see [https://goo.gl/3KKHoY|Mailbox Status] for more information.
@@ -298,20 +948,147 @@ class ImapLibrary(object):
         - ``text``: Email body text. (Default None)
         - ``timeout``: The maximum value in seconds to wait for email message to arrived.
                        (Default 60)
+        - ``uid``: A UID set of the email messages, e.g. ``100:*`` or ``1,5:9``.
+                   (Default None)
+        - ``unkeyword``: A flag keyword not set on the email messages. (Default None)
+        - ``use_index``: An indicator flag to filter email messages with the local mailbox
+                         index instead of the IMAP server search, accepting all
+                         `Search Emails` filters. (Default False)
 
         Examples:
         | Wait For Email | sender=noreply@domain.com |
+        | Wait For Email | sender=noreply@domain.com | idle=False |
+        | Wait For Email | subject=Order | poll_frequency=1 | poll_backoff=2 | poll_max=30 |
+        | Wait For Email | sender=noreply@domain.com | poll_jitter=0.2 |
+        | Wait For Email | sender=noreply@domain.com | since=2024-01-31 | header=X-Campaign: 42 |
+        | ${spam} = | Create Dictionary | subject=Newsletter |
+        | Wait For Email | sender=noreply@domain.com | exclude=${spam} |
+        | Wait For Email | sender_regex=@domain\\.com$ | subject_regex=Order \\d+ | use_index=True |
+        """
+        idle = self._to_bool(kwargs.pop('idle', True)) and self._is_idle_supported()
+        schedule = self._poll_schedule(kwargs)
+        timeout = int(kwargs.pop('timeout', 60))
+        if self._to_bool(kwargs.pop('use_index', False)):
+            query = IndexQuery(**kwargs)
+            self._wait(lambda: self._search_index(query), idle, schedule, timeout)
+        else:
+            criteria = build_criteria(**kwargs)
+            self._wait(lambda: self._check_emails(criteria), idle, schedule, timeout)
+        return self._mails[-1]
+
+    def wait_for_email_in_folders(self, folders, **kwargs):
+        """Wait for email message to arrived in any of given ``folders`` concurrently
+        base on any given filter criteria. Returns a dictionary of folder name to
+        email index of the latest email message received in that folder.
+
+        The folders are watched concurrently over at most ``connections`` additional
+        IMAP sessions of the opened mailbox account. A session watching a single folder
+        waits with [https://tools.ietf.org/html/rfc2177|IDLE] command when it is
+        supported by the server. The returned email indexes are relative to their folder.
+
+        This keyword requires Python 3.
+
+        Arguments:
+        - ``folders``: A list of folder names or a comma separated folder names.
+        - ``connections``: The maximum number of IMAP sessions used to watch
+                           the folders. (Default 4)
+        - ``mode``: ``any`` to return once any folder receives an email message,
+                    or ``all`` to wait until all folders receive one. (Default any)
+        - ``poll_frequency``: The delay value in seconds to retry the mailbox check. (Default 10)
+        - ``recipient``: Email recipient. (Default None)
+        - ``sender``: Email sender. (Default None)
+        - ``status``: A mailbox status filter. (Default None)
+        - ``subject``: Email subject. (Default None)
+        - ``text``: Email body text. (Default None)
+        - ``timeout``: The maximum value in seconds to wait for email message to arrived.
+                       (Default 60)
+
+        The other filter criteria of `Wait For Email` are accepted as well.
+
+        Examples:
+        | Wait For Email In Folders | INBOX,Spam | sender=noreply@domain.com |
+        | Wait For Email In Folders | INBOX,Spam | sender=noreply@domain.com | mode=all |
         """
+        if ENGINE is None:
+            raise RuntimeError('Wait For Email In Folders requires Python 3 asyncio')
+        if isinstance(folders, (bytes, ustr, str)):
+            folders = [folder.strip() for folder in folders.split(',') if folder.strip()]
+        connections = int(kwargs.pop('connections', 4))
+        wait_all = kwargs.pop('mode', 'any').lower() == 'all'
         poll_frequency = float(kwargs.pop('poll_frequency', 10))
         timeout = int(kwargs.pop('timeout', 60))
-        end_time = time() + timeout
-        while time() < end_time:
-            self._mails = self._check_emails(**kwargs)
-            if len(self._mails) > 0:
-                return self._mails[-1]
-            if time() < end_time:
-                sleep(poll_frequency)
-        raise AssertionError("No email received within %ss" % timeout)
+        criteria = build_criteria(**kwargs)
+        found = ENGINE.run(ENGINE.wait_for_email(self._account, list(folders), criteria,
+                                                 connections=connections,
+                                                 poll_frequency=poll_frequency,
+                                                 timeout=timeout, wait_all=wait_all))
+        if not found or (wait_all and len(found) < len(folders)):
+            raise AssertionError("No email received within %ss" % timeout)
+        return found
+
+    def wait_for_multiple_emails(self, criteria, **kwargs):
+        """Wait for email messages to arrived base on several filter criteria sets
+        in one mailbox check loop. Returns a dictionary of each criteria set name,
+        or its position when ``criteria`` is a list, to its matching email indexes.
+
+        Each mailbox check sends a single combined ``OR`` search of all criteria sets,
+        the email messages it finds are then matched against each criteria set.
+        All matching email indexes are available to `Delete All Emails`,
+        `Fetch Emails`, and `Mark All Emails As Read`.
+
+        Arguments:
+        - ``criteria``: A list of criteria set dictionaries, or a dictionary of criteria set
+                        name to its criteria set dictionary. Each criteria set accepts
+                        the filter criteria of `Wait For Email`.
+        - ``idle``: An indicator flag to use IMAP IDLE command when it is supported by
+                    the server. (Default True)
+        - ``mode``: ``all`` to wait until every criteria set has a matching email message,
+                    ``any`` to wait until one of them has, or a number of criteria sets
+                    to wait for. (Default all)
+        - ``poll_frequency``: The delay value in seconds to retry the mailbox check. (Default 10)
+        - ``poll_backoff``, ``poll_jitter``, ``poll_max``: The mailbox check delay schedule
+                                                          as in `Wait For Email`.
+        - ``timeout``: The maximum value in seconds to wait for email messages to arrived.
+                       (Default 60)
+
+        Examples:
+        | ${confirm} = | Create Dictionary | sender=noreply@domain.com | subject=Confirm |
+        | ${receipt} = | Create Dictionary | sender=billing@domain.com | subject=Receipt |
+        | ${sets} = | Create Dictionary | confirm=${confirm} | receipt=${receipt} |
+        | ${matches} = | Wait For Multiple Emails | ${sets} |
+        | ${matches} = | Wait For Multiple Emails | ${sets} | mode=any | timeout=120 |
+        """
+        idle = self._to_bool(kwargs.pop('idle', True)) and self._is_idle_supported()
+        mode = ustr(kwargs.pop('mode', 'all')).lower()
+        schedule = self._poll_schedule(kwargs)
+        timeout = int(kwargs.pop('timeout', 60))
+        names = list(criteria.keys()) if hasattr(criteria, 'keys') else \
+            list(range(len(criteria)))
+        criteria_sets = [build_criteria(**dict(criteria[name])) for name in names]
+        if not criteria_sets:
+            raise ValueError('At least one criteria set is required')
+        if mode == 'all':
+            required = len(names)
+        elif mode == 'any':
+            required = 1
+        else:
+            required = min(int(mode), len(names))
+        combined = any_criteria(criteria_sets)
+        found = []
+        matches = dict((name, []) for name in names)
+
+        def check():
+            """Matches new email messages against each criteria set."""
+            mails = self._check_emails(combined)
+            if mails:
+                found.extend(mail for mail in mails if mail not in found)
+                within = [mails] if len(names) == 1 else self._search_within(mails, criteria_sets)
+                for name, indexes in zip(names, within):
+                    matches[name].extend(indexes)
+            return found if sum(1 for name in names if matches[name]) >= required else []
+
+        self._wait(check, idle, schedule, timeout)
+        return dict((name, sorted(set(indexes), key=int)) for name, indexes in matches.items())
 
     def wait_for_mail(self, **kwargs):
         """****DEPRECATED****
@@ -319,21 +1096,28 @@ class ImapLibrary(object):
         """
         return self.wait_for_email(**kwargs)
 
-    def walk_multipart_email(self, email_index):
+    def walk_multipart_email(self, email_index, lazy=False):
         """Returns total parts of a multipart email message on given ``email_index``.
         Email message is cache internally to be used by other multipart keywords:
         `Get Multipart Content Type`, `Get Multipart Field`, `Get Multipart Field Names`,
         `Get Multipart Field`, and `Get Multipart Payload`.
 
+        On lazy walk, only the email message headers and its MIME structure are fetched,
+        each part payload is only fetched once `Get Multipart Payload` is called on it.
+
         Arguments:
         - ``email_index``: An email index to identity the email message.
+        - ``lazy``: An indicator flag to fetch the part payloads on demand. (Default False)
 
         Examples:
         | Walk Multipart Email | INDEX |
+        | Walk Multipart Email | INDEX | lazy=True |
         """
         if not self._is_walking_multipart(email_index):
-            data = self._imap.fetch(email_index, '(RFC822)')[1][0][1]
-            msg = message_from_string(data)
+            if self._to_bool(lazy):
+                msg = self._fetch_structure(email_index)
+            else:
+                msg = self._fetch_message(email_index).message
             self._start_multipart_walk(email_index, msg)
         try:
             self._part = next(self._mp_iter)
@@ -343,40 +1127,257 @@ class ImapLibrary(object):
         # return number of parts
         return len(self._mp_msg.get_payload())
 
-    def _check_emails(self, **kwargs):
-        """Returns filtered email."""
-        criteria = self._criteria(**kwargs)
-        # Calling select before each search is necessary with gmail
-        status, data = self._imap.select()
-        if status != 'OK':
-            raise Exception("imap.select error: %s, %s" % (status, data))
-        typ, msgnums = self._imap.search(None, *criteria)
+    def _alias_sessions(self, aliases):
+        """Returns the list of given session ``aliases``, either a list or comma separated
+        session aliases, and the list of their sessions."""
+        if isinstance(aliases, (bytes, ustr, str)):
+            aliases = [alias.strip() for alias in aliases.split(',') if alias.strip()]
+        for alias in aliases:
+            if alias not in self._sessions:
+                raise ValueError('Unknown mailbox alias: %s' % alias)
+        return aliases, [self._sessions[alias] for alias in aliases]
+
+    def _cache_key(self, uid):
+        """Returns the message cache key of given ``uid``, otherwise None."""
+        if None in (uid, self._uidvalidity):
+            return None
+        return self._mailbox, self._uidvalidity, uid
+
+    def _cached_message(self, email_index):
+        """Returns the cached email message on given ``email_index``, otherwise None.
+        An email message of unknown UID is not cached yet, it is counted as a miss."""
+        entry = self._cache.get(self._cache_key(self._uids.get(int(email_index))))
+        self._statistics.cache(entry is not None)
+        return entry
+
+    def _check_emails(self, criteria):
+        """Returns filtered email.
+
+        Once the mailbox ``UIDNEXT`` is known, only email messages arrived after the
+        previous check are searched. The whole mailbox is searched again when
+        the mailbox ``UIDVALIDITY`` changes, or on every check when the criteria
+        also match email messages whose flags changed.
+
+        On ``noop`` change detection, the mailbox is only selected on the first check,
+        the next checks only search when a ``NOOP`` command reports new email messages.
+        On ``status`` change detection, the mailbox ``STATUS`` replaces its selection."""
+        arrivals = is_arrival_criteria(criteria)
+        if self._change_detection == 'noop' and self._exists is not None:
+            exists, expunged = self._noop()
+            if not expunged:
+                if arrivals and exists == self._exists:
+                    return []
+                sequence = ['%d:*' % (self._exists + 1)] if arrivals else []
+                mails = self._search(sequence + criteria)
+                self._exists = exists
+                return mails
+        search = criteria if self._uidnext is None or not arrivals else \
+            criteria + ['UID', '%d:*' % self._uidnext]
+        result = None
+        if self._change_detection == 'status':
+            uidvalidity, uidnext = self._mailbox_status()
+        else:
+            selected = None
+            if self._pipelining:
+                selected, result = self._execute(('select', ()),
+                                                 ('search', self._search_arguments(search)))
+            uidvalidity, uidnext = self._select_mailbox(selected)
+        if uidvalidity != self._uidvalidity:
+            self._uidnext = None
+            self._uidvalidity = uidvalidity
+        if arrivals and None not in (uidnext, self._uidnext):
+            if uidnext == self._uidnext:
+                return []
+            criteria = criteria + ['UID', '%d:*' % self._uidnext]
+        # The pipelined search is only used when it has the expected criteria
+        mails = self._search(criteria, result if search == criteria else None)
+        self._uidnext = uidnext
+        return mails
+
+    def _delete_emails(self, indexes):
+        """Flag given email ``indexes`` as deleted and expunge them."""
+        if 'UIDPLUS' in self._imap.capabilities:
+            uids = self._fetch_uids(indexes)
+            uid_sets = self._sequence_sets(uids, self.STORE_CHUNK_SIZE)
+            stores = [('uid', ('STORE', uid_set, '+FLAGS', r'\DELETED')) for uid_set in uid_sets]
+            expunges = [('uid', ('EXPUNGE', uid_set)) for uid_set in uid_sets]
+        else:
+            stores = [('store', (sequence_set, '+FLAGS', r'\DELETED')) for sequence_set
+                      in self._sequence_sets(indexes, self.STORE_CHUNK_SIZE)]
+            expunges = [('expunge', ())]
+        # The expunge depends on the stored flags, it is only sent once they are completed
+        self._execute(*stores)
+        self._execute(*expunges)
+        self._forget_emails(indexes)
+
+    def _execute(self, *commands):
+        """Returns the results of given ``(imaplib method, arguments)`` commands,
+        pipelined when it is enabled."""
+        if self._pipelining:
+            return Pipeline(self._imap).execute(*commands)
+        return [getattr(self._imap, method)(*args) for method, args in commands]
+
+    def _enable_extensions(self):
+        """Enables CONDSTORE and QRESYNC extensions when the server supports them."""
+        capabilities = self._imap.capabilities
+        extensions = [name for name in ('CONDSTORE', 'QRESYNC') if name in capabilities]
+        if not extensions or 'ENABLE' not in capabilities:
+            return
+        typ, _ = self._imap._simple_command('ENABLE', *extensions)
+        if typ == 'OK':
+            enabled = self._imap.response('ENABLED')[1]
+            self._extensions = tuple(name.upper() for value in enabled if value is not None
+                                     for name in to_str(value).split())
+
+    def _esearch(self, command, *args):
+        """Returns the dictionary of ESEARCH result option names to values of given
+        ``SEARCH`` or ``SORT`` command with ``RETURN`` options."""
+        typ, data = self._imap._simple_command(command, *args)
         if typ != 'OK':
-            raise Exception('imap.search error: %s, %s, criteria=%s' % (typ, msgnums, criteria))
-        return msgnums[0].split()
+            raise Exception('imap.%s error: %s, %s' % (command.lower(), typ, data))
+        # The search correlator and UID indicator precede the result options
+        tokens = [to_str(token) for token in parse(self._imap.response('ESEARCH')[1])
+                  if isinstance(token, bytes) and token.upper() != b'UID']
+        return dict(zip(tokens[::2], tokens[1::2]))
+
+    def _fetch_message(self, email_index):
+        """Returns the email message on given ``email_index``,
+        it is only fetched from the IMAP server when it is not cached."""
+        self._resolve_uids([email_index])
+        entry = self._cached_message(email_index)
+        if entry is None:
+            entry = self._fetch_messages(email_index)[int(email_index)]
+        return entry
+
+    def _fetch_messages(self, *sequence_sets):
+        """Fetches and caches the email messages on given ``sequence_sets``.
+        Returns the dict of email index to its email message."""
+        messages = {}
+        for typ, data in self._execute(*[('fetch', (sequence_set, '(UID RFC822)'))
+                                         for sequence_set in sequence_sets]):
+            if typ != 'OK':
+                raise Exception('imap.fetch error: %s, %s' % (typ, data))
+            for number, items in parse_fetch(data):
+                literal = items.get('RFC822')
+                if literal is None:
+                    continue
+                uid = self._remember_uid(number, items)
+                key = self._cache_key(uid)
+                messages[number] = CachedMessage(literal) if key is None else \
+                    self._cache.put(key, literal)
+        return messages
+
+    def _fetch_part(self, uid, part, decode, start, length):
+        """Returns the payload of given ``part`` of the email message on given ``uid``,
+        optionally only ``length`` bytes from ``start`` offset."""
+        binary = decode and 'BINARY' in self._imap.capabilities
+        section = '%s.PEEK[%s]' % ('BINARY' if binary else 'BODY', part.path)
+        ranged = start is not None
+        if ranged and (binary or not decode):
+            section += '<%d.%d>' % (start, part.size - start if length is None else length)
+        typ, data = self._imap.uid('FETCH', '%d' % uid, '(%s)' % section)
+        if typ != 'OK':
+            raise Exception('imap.fetch error: %s, %s' % (typ, data))
+        payload = b''
+        for _, items in parse_fetch(data):
+            for name, value in items.items():
+                if name.startswith(('BODY[', 'BINARY[')) and value is not None:
+                    payload = bytes(value)
+        if decode and not binary:
+            payload = decode_transfer(payload, part.encoding)
+            if ranged:
+                payload = payload[start:None if length is None else start + length]
+        return payload
+
+    def _fetch_structure(self, email_index):
+        """Returns the email message on given ``email_index`` with only its headers
+        and MIME structure fetched."""
+        typ, data = self._imap.fetch(email_index, '(UID BODY.PEEK[HEADER] BODYSTRUCTURE)')
+        if typ != 'OK':
+            raise Exception('imap.fetch error: %s, %s' % (typ, data))
+        for number, items in parse_fetch(data):
+            if 'BODYSTRUCTURE' not in items:
+                continue
+            uid = self._remember_uid(number, items)
+            root = parse_bodystructure(items['BODYSTRUCTURE'],
+                                       lambda part, decode, start, length, uid=uid:
+                                       self._fetch_part(uid, part, decode, start, length))
+            return LazyMessage(message_from_bytes(bytes(items.get('BODY[HEADER]') or b'')), root)
+        raise Exception('imap.fetch error: %s, %s' % (typ, data))
+
+    def _fetch_uids(self, indexes):
+        """Returns the list of UIDs of given email ``indexes``."""
+        uids = []
+        for typ, data in self._execute(*[('fetch', (sequence_set, '(UID)')) for sequence_set
+                                         in self._sequence_sets(indexes, self.STORE_CHUNK_SIZE)]):
+            if typ != 'OK':
+                raise Exception('imap.fetch error: %s, %s' % (typ, data))
+            for number, items in parse_fetch(data):
+                uid = self._remember_uid(number, items)
+                if uid is not None:
+                    uids.append(uid)
+        return uids
 
     @staticmethod
-    def _criteria(**kwargs):
-        """Returns email criteria."""
-        criteria = []
-        recipient = kwargs.pop('recipient', kwargs.pop('to_email', kwargs.pop('toEmail', None)))
-        sender = kwargs.pop('sender', kwargs.pop('from_email', kwargs.pop('fromEmail', None)))
-        status = kwargs.pop('status', None)
-        subject = kwargs.pop('subject', None)
-        text = kwargs.pop('text', None)
-        if recipient:
-            criteria += ['TO', '"%s"' % recipient]
-        if sender:
-            criteria += ['FROM', '"%s"' % sender]
-        if subject:
-            criteria += ['SUBJECT', '"%s"' % subject]
-        if text:
-            criteria += ['TEXT', '"%s"' % text]
-        if status:
-            criteria += [status]
-        if not criteria:
-            criteria = ['UNSEEN']
-        return criteria
+    def _find_attachment(msg, filename=None, part=None):
+        """Returns the attachment part of given ``msg`` matching given ``filename``
+        or ``part`` number, otherwise its first attachment part."""
+        for candidate in msg.walk():
+            if candidate.is_multipart():
+                continue
+            if part is not None:
+                found = candidate.path == ustr(part)
+            elif filename is not None:
+                found = candidate.get_filename() == filename
+            else:
+                found = candidate.disposition == 'attachment' or \
+                    candidate.get_filename() is not None
+            if found:
+                return candidate
+        raise AssertionError("Attachment %s not found!" % (part or filename or ''))
+
+    def _forget_emails(self, indexes):
+        """Invalidates the cached email messages on given removed email ``indexes``."""
+        for index in indexes:
+            key = self._cache_key(self._uids.get(int(index)))
+            if key is not None:
+                self._cache.invalidate(key)
+        # Email indexes are shifted once email messages are removed
+        self._index.stale = True
+        self._uids = {}
+
+    def _idle(self, timeout):
+        """Returns boolean value whether the IMAP server notifies a mailbox change
+        within given ``timeout`` seconds using IDLE command."""
+        tag = self._imap._new_tag()
+        self._imap.send(tag + b' IDLE' + CRLF)
+        response = self._imap.readline()
+        if not response.startswith(b'+'):
+            raise Exception('imap.idle error: %s' % response)
+        changed = False
+        end_time = time() + timeout
+        try:
+            while not changed and self._is_readable(end_time - time()):
+                changed = self._idle_event(self._imap.readline()) in ('EXISTS', 'RECENT')
+        finally:
+            self._imap.send(b'DONE' + CRLF)
+            response = self._imap.readline()
+            while not response.startswith(tag):
+                self._idle_event(response)
+                response = self._imap.readline()
+        if not response[len(tag):].strip().startswith(b'OK'):
+            raise Exception('imap.idle error: %s' % response)
+        return changed
+
+    def _idle_event(self, line):
+        """Returns the response code of given untagged message count ``line`` read during
+        IDLE, otherwise None. It is kept as imaplib does, for the next mailbox check."""
+        match = IDLE_EVENT.match(line)
+        if match is None:
+            return None
+        code = to_str(match.group(2)).upper()
+        self._imap._append_untagged(code, match.group(1))
+        return code
 
     def _init_multipart_walk(self):
         """Initialize multipart email walk."""
@@ -388,8 +1389,372 @@ class ImapLibrary(object):
         """Returns boolean value whether the multipart email walk is in-progress or not."""
         return self._mp_msg is not None and self._email_index == email_index
 
+    def _is_buffered(self):
+        """Returns boolean value whether the IMAP connection already has data to read
+        or not, without waiting for the IMAP server."""
+        peek = getattr(self._imap.file, 'peek', None)
+        if peek is None:
+            return False
+        sock = self._imap.sock
+        timeout = sock.gettimeout()
+        # A non-blocking peek returns the data imaplib already read ahead into its buffer
+        sock.settimeout(0)
+        try:
+            return len(peek(1)) > 0
+        except (IOError, OSError):
+            return False
+        finally:
+            sock.settimeout(timeout)
+
+    def _is_idle_supported(self):
+        """Returns boolean value whether the IMAP server supports IDLE command or not."""
+        return 'IDLE' in self._imap.capabilities
+
+    def _is_readable(self, timeout):
+        """Returns boolean value whether the IMAP connection has data to read
+        within given ``timeout`` seconds."""
+        pending = getattr(self._imap.sock, 'pending', None)
+        if (pending is not None and pending()) or self._is_buffered():
+            return True
+        return timeout > 0 and len(select([self._imap.sock], [], [], timeout)[0]) > 0
+
+    def _library_keyword(self, name):
+        """Returns the library keyword method of given keyword ``name``, session keywords
+        excluded."""
+        method_name = name.strip().lower().replace(' ', '_')
+        keyword = getattr(self, method_name, None)
+        if method_name.startswith('_') or method_name in self.SESSION_KEYWORDS or \
+                not callable(keyword):
+            raise ValueError('Unknown keyword: %s' % name)
+        return keyword
+
+    def _links(self, email_index):
+        """Returns the links of the email message on given ``email_index``,
+        only of the current part during multipart email walk."""
+        if not self._is_walking_multipart(email_index):
+            return self._fetch_message(email_index).text.links
+        part = next((index for index, part in enumerate(self._mp_msg.walk())
+                     if part is self._part), None)
+        return find_links(decode_text(self._part), part)
+
+    def _mailbox_status(self):
+        """Returns the selected mailbox ``UIDVALIDITY`` and ``UIDNEXT`` from its ``STATUS``."""
+        typ, data = self._imap.status(quote(self._mailbox[3]), '(UIDNEXT UIDVALIDITY)')
+        if typ != 'OK':
+            raise Exception('imap.status error: %s, %s' % (typ, data))
+        self._pop_expunged()
+        items = ([value for value in parse(data) if isinstance(value, list)] or [[]])[0]
+        status = dict((to_str(items[pos]).upper(), to_int(items[pos + 1]))
+                      for pos in range(0, len(items) - 1, 2))
+        return status.get('UIDVALIDITY'), status.get('UIDNEXT')
+
+    def _move_emails(self, indexes, folder):
+        """Move given email ``indexes`` into given ``folder``."""
+        folder = quote(folder)
+        sequence_sets = self._sequence_sets(indexes, self.STORE_CHUNK_SIZE)
+        if 'MOVE' in self._imap.capabilities:
+            # Moving the highest email indexes first keeps the lower ones unchanged
+            for sequence_set in reversed(sequence_sets):
+                typ, data = self._imap._simple_command('MOVE', sequence_set, folder)
+                if typ != 'OK':
+                    raise Exception('imap.move error: %s, %s' % (typ, data))
+            self._forget_emails(indexes)
+        else:
+            for sequence_set in sequence_sets:
+                typ, data = self._imap.copy(sequence_set, folder)
+                if typ != 'OK':
+                    raise Exception('imap.copy error: %s, %s' % (typ, data))
+            self._delete_emails(indexes)
+
+    def _noop(self):
+        """Returns the selected mailbox message count reported by a ``NOOP`` command,
+        otherwise the previously known one, and whether email messages were expunged."""
+        typ, data = self._imap.noop()
+        if typ != 'OK':
+            raise Exception('imap.noop error: %s, %s' % (typ, data))
+        # Flag changes and recent counts are not needed to detect new email messages
+        self._imap.response('FETCH')
+        self._imap.response('RECENT')
+        exists = self._response_number('EXISTS')
+        return (self._exists if exists is None else exists), self._pop_expunged()
+
+    def _open_cache_store(self, path, max_bytes):
+        """Opens the on-disk message cache store of given ``path``."""
+        store = self._cache.store
+        if path is None or (store is not None and store.path == path):
+            if store is not None and max_bytes is not None:
+                store.max_bytes = int(max_bytes)
+                store.evict()
+            return
+        if DiskStore is None:
+            raise RuntimeError('On-disk message cache requires Python sqlite3 module')
+        if store is not None:
+            store.close()
+        self._cache.store = DiskStore(path) if max_bytes is None else \
+            DiskStore(path, int(max_bytes))
+
+    def _parts(self, email_index, lazy):
+        """Returns the part index of the email message on given ``email_index``."""
+        if self._to_bool(lazy):
+            return PartIndex(self._fetch_structure(email_index))
+        return self._fetch_message(email_index).parts
+
+    def _payload(self, part, decode, start, length):
+        """Returns the payload of given email message ``part``, optionally decoded,
+        and only ``length`` bytes from ``start`` offset."""
+        decode = self._to_bool(decode)
+        ranged = start is not None or length is not None
+        start = int(start or 0)
+        length = None if length is None else int(length)
+        if decode and not ranged:
+            return decode_part(part)
+        if isinstance(part, Part) and ranged:
+            payload = part.get_payload(decode=decode, start=start, length=length)
+        else:
+            payload = decode_payload(part) if decode else part.get_payload()
+            if ranged:
+                payload = payload[start:None if length is None else start + length]
+        charset = part.get_content_charset()
+        if charset is not None and isinstance(payload, bytes):
+            return payload.decode(charset, 'replace' if ranged else 'strict')
+        return payload
+
+    @staticmethod
+    def _poll_schedule(kwargs):
+        """Returns the mailbox check delay schedule, given ``kwargs`` schedule arguments
+        are removed."""
+        maximum = kwargs.pop('poll_max', None)
+        return PollSchedule(float(kwargs.pop('poll_frequency', 10)),
+                            float(kwargs.pop('poll_backoff', 1)),
+                            None if maximum is None else float(maximum),
+                            float(kwargs.pop('poll_jitter', 0)))
+
+    def _pop_expunged(self):
+        """Returns boolean value whether email messages were expunged since the previous
+        command or not. Remembered UIDs are forgotten when they were."""
+        expunged = [number for number in self._imap.response('EXPUNGE')[1] if number is not None]
+        # QRESYNC servers report removed email messages with VANISHED instead of EXPUNGE
+        if 'QRESYNC' in self._extensions:
+            expunged += [uids for uids in self._imap.response('VANISHED')[1] if uids is not None]
+        if expunged:
+            self._uids = {}
+        return len(expunged) > 0
+
+    def _refresh_index(self, flags=False):
+        """Fetches the email messages arrived since the previous refresh into the local
+        mailbox index. Email indexes, and ``flags`` when requested, of indexed email messages
+        are refreshed when email messages were removed."""
+        expunged = False
+        if self._change_detection == 'select':
+            self._uidvalidity = self._select_mailbox()[0]
+            exists = self._exists
+        else:
+            # The message count is unknown until the first refresh, not expunged
+            exists, expunged = self._noop()
+        if self._index.uidvalidity != self._uidvalidity:
+            self._index.clear(self._uidvalidity)
+        last_uid = self._index.last_uid
+        modseq = self._index.modseq
+        items = self.FETCH_INDEX_ITEMS
+        if 'CONDSTORE' in self._extensions:
+            items = items.replace('(UID FLAGS', '(UID FLAGS MODSEQ')
+        typ, data = self._imap.uid('FETCH', '%d:*' % (last_uid + 1), items)
+        if typ != 'OK':
+            raise Exception('imap.fetch error: %s, %s' % (typ, data))
+        for number, items in parse_fetch(data):
+            # A UID range past the last UID still matches the last email message
+            if to_int(items.get('UID'), 0) > last_uid:
+                self._remember_uid(number, items)
+                self._index.add(number, items)
+        removed = expunged or self._index.stale or exists not in (None, len(self._index))
+        if last_uid and (flags or removed):
+            if not self._resync_index(last_uid, modseq, exists, removed):
+                self._renumber_index()
+        self._exists = len(self._index) if exists is None else exists
+
+    def _refresh_mailbox(self):
+        """Selects the mailbox again on ``select`` change detection before a search,
+        as mailbox checks do."""
+        if self._change_detection == 'select':
+            self._uidvalidity = self._select_mailbox()[0]
+
+    def _remember_uid(self, email_index, items):
+        """Remembers and returns the UID of given ``email_index`` from FETCH response ``items``."""
+        uid = to_int(items.get('UID'))
+        if uid is not None:
+            self._uids[email_index] = uid
+        return uid
+
+    def _renumber_index(self):
+        """Fetches the UIDs and flags of all email messages to renumber the local mailbox
+        index, indexed email messages missing from the mailbox are removed."""
+        typ, data = self._imap.fetch('1:*', '(UID FLAGS)')
+        if typ != 'OK':
+            raise Exception('imap.fetch error: %s, %s' % (typ, data))
+        self._index.renumber(parse_fetch(data))
+
+    def _resolve_uids(self, indexes):
+        """Fetches the unknown UIDs of given email ``indexes`` when the on-disk message cache
+        is enabled, so that their email messages can be served from it."""
+        if self._cache.store is not None and self._uidvalidity is not None:
+            unknown = [index for index in indexes if int(index) not in self._uids]
+            if unknown:
+                self._fetch_uids(unknown)
+
+    def _resync_index(self, last_uid, modseq, exists, removed):
+        """Fetches the flag changes, and the removed UIDs with QRESYNC, of indexed email
+        messages since given ``modseq`` modification sequence into the local mailbox index.
+
+        Returns boolean value whether the local mailbox index matches given ``exists``
+        message count afterwards or not. Without QRESYNC, ``removed`` email messages
+        can not be resynced."""
+        qresync = 'QRESYNC' in self._extensions
+        if modseq is None or not (qresync or ('CONDSTORE' in self._extensions and not removed)):
+            return False
+        self._imap.response('VANISHED')
+        typ, data = self._imap.uid('FETCH', '1:%d' % last_uid, '(UID FLAGS MODSEQ)',
+                                   '(CHANGEDSINCE %d%s)' % (modseq, ' VANISHED' if qresync else ''))
+        if typ != 'OK':
+            raise Exception('imap.fetch error: %s, %s' % (typ, data))
+        vanished = self._imap.response('VANISHED')[1] if qresync else None
+        self._index.resync(parse_fetch(data), vanished)
+        self._uids = {}
+        return exists in (None, len(self._index))
+
+    def _response_number(self, code):
+        """Returns the number of given untagged response ``code``, otherwise None."""
+        data = self._imap.response(code)[1]
+        value = data[-1] if data else None
+        if isinstance(value, bytes):
+            value = value.decode('ascii')
+        if isinstance(value, (ustr, str)) and value.isdigit():
+            return int(value)
+        return None
+
+    def _run_in_session(self, session, keyword, args, kwargs):
+        """Returns the result and error of given ``keyword`` with given arguments run
+        in given ``session``, used by the current thread meanwhile."""
+        with session.lock:
+            self._local.session = session
+            try:
+                return keyword(*args, **kwargs), None
+            except Exception as error:  # pylint: disable=broad-except
+                return None, error
+            finally:
+                self._local.session = None
+
+    def _search(self, criteria, result=None):
+        """Returns the email indexes matching given ``criteria``, from the given ``result``
+        of an already sent search command when it is not None."""
+        typ, msgnums = result if result is not None else \
+            self._imap.search(*self._search_arguments(criteria))
+        if typ != 'OK':
+            raise Exception('imap.search error: %s, %s, criteria=%s' % (typ, msgnums, criteria))
+        return msgnums[0].split()
+
+    def _search_arguments(self, criteria):
+        """Returns the imaplib ``search`` arguments of given ``criteria``."""
+        return search_arguments(criteria, 'LITERAL+' in self._imap.capabilities)
+
+    def _search_index(self, query):
+        """Returns the email indexes matching given local index ``query``."""
+        self._refresh_index(query.uses_flags)
+        self._mails = ['%d' % entry.number for entry in self._index.search(query)]
+        return self._mails
+
+    def _search_within(self, indexes, criteria_sets):
+        """Returns the list of email indexes among given ``indexes`` matching
+        each of given ``criteria_sets``."""
+        sequence_sets = self._sequence_sets(indexes, self.STORE_CHUNK_SIZE)
+        results = iter(self._execute(*[
+            ('search', self._search_arguments([sequence_set] + criteria))
+            for criteria in criteria_sets for sequence_set in sequence_sets]))
+        matches = []
+        for criteria in criteria_sets:
+            mails = []
+            for _ in sequence_sets:
+                typ, msgnums = next(results)
+                if typ != 'OK':
+                    raise Exception('imap.search error: %s, %s, criteria=%s' %
+                                    (typ, msgnums, criteria))
+                mails += msgnums[0].split()
+            matches.append(mails)
+        return matches
+
+    def _select_mailbox(self, result=None):
+        """Selects the mailbox again, it is necessary before each search with gmail,
+        from the given ``result`` of an already sent select command when it is not None.
+        Returns the mailbox ``UIDVALIDITY`` and ``UIDNEXT``."""
+        status, data = result if result is not None else self._imap.select()
+        if status != 'OK':
+            raise Exception("imap.select error: %s, %s" % (status, data))
+        self._exists = to_int(data[-1]) if data else None
+        self._uids = {}
+        return self._response_number('UIDVALIDITY'), self._response_number('UIDNEXT')
+
+    @staticmethod
+    def _sequence_sets(indexes, chunk_size):
+        """Returns the list of IMAP sequence sets of given email ``indexes``,
+        each of them covers at most ``chunk_size`` email messages."""
+        numbers = sorted(set(int(index) for index in indexes))
+        sequence_sets = []
+        for start in range(0, len(numbers), chunk_size):
+            ranges = []
+            for number in numbers[start:start + chunk_size]:
+                if ranges and ranges[-1][1] + 1 == number:
+                    ranges[-1][1] = number
+                else:
+                    ranges.append([number, number])
+            sequence_sets.append(','.join('%d' % first if first == last else
+                                          '%d:%d' % (first, last) for first, last in ranges))
+        return sequence_sets
+
+    @property
+    def _session(self):
+        """Returns the session used by the current thread, a worker thread session
+        of `Run Keyword In Mailboxes`, otherwise the current session."""
+        return getattr(self._local, 'session', None) or self._current
+
     def _start_multipart_walk(self, email_index, msg):
         """Start multipart email walk."""
         self._email_index = email_index
         self._mp_msg = msg
         self._mp_iter = msg.walk()
+
+    @staticmethod
+    def _to_bool(value):
+        """Returns boolean value of given ``value``."""
+        if isinstance(value, (ustr, str)):
+            return value.strip().lower() not in ('', '0', 'false', 'no', 'none', 'off')
+        return bool(value)
+
+    def _wait(self, check, idle, schedule, timeout):
+        """Calls ``check`` until it returns email indexes, waiting for a mailbox change
+        with IDLE, or the ``schedule`` delay, between mailbox checks."""
+        start_time = time()
+        end_time = start_time + timeout
+        delays = schedule.delays()
+        self._exists = None
+        self._uidnext = None
+        self._wait_statistics = {'elapsed': 0.0, 'polls': 0, 'time_to_match': None}
+        try:
+            while True:
+                self._mails = check()
+                self._statistics.poll()
+                self._wait_statistics['polls'] += 1
+                if len(self._mails) > 0:
+                    self._wait_statistics['time_to_match'] = time() - start_time
+                    return self._mails
+                remaining = end_time - time()
+                if remaining <= 0:
+                    break
+                # The delay is clamped so that the last check happens at the timeout
+                delay = min(next(delays), remaining)
+                if delay > 0 and idle:
+                    self._idle(min(delay, self.IDLE_TIMEOUT))
+                elif delay > 0:
+                    sleep(delay)
+            raise AssertionError("No email received within %ss" % timeout)
+        finally:
+            self._wait_statistics['elapsed'] = time() - start_time
+            logger.info('Wait statistics: %s' % self._wait_statistics)
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright 2015-2016 Richard Huang <rickypc@users.noreply.github.com>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+IMAP Library - a size-bounded LRU cache of email messages.
+"""
+
+from collections import OrderedDict
+try:
+    from email import message_from_bytes
+except ImportError:
+    from email import message_from_string as message_from_bytes
+from quopri import decodestring
+from re import compile as re_compile
+from threading import Lock
+from ImapLibrary.extract import MessageText, decode_bytes
+from ImapLibrary.parts import PartIndex
+
+BODY_SEPARATOR = re_compile(br'\r?\n\r?\n')
+
+
+class CachedMessage(object):
+    """A raw email message with its lazily parsed email message, body, parts and text parts."""
+
+    __slots__ = ('raw', '_body', '_message', '_parts', '_text')
+
+    def __init__(self, raw):
+        self.raw = raw
+        self._body = None
+        self._message = None
+        self._parts = None
+        self._text = None
+
+    def __len__(self):
+        """Returns the raw email message size in bytes."""
+        return len(self.raw)
+
+    @property
+    def body(self):
+        """Returns the text after the header fields, quoted-printable and charset decoded."""
+        if self._body is None:
+            match = BODY_SEPARATOR.search(self.raw)
+            body = decodestring(self.raw[match.end():]) if match else b''
+            self._body = decode_bytes(body, self.message.get_content_charset())
+        return self._body
+
+    @property
+    def message(self):
+        """Returns the parsed email message."""
+        if self._message is None:
+            self._message = message_from_bytes(self.raw)
+        return self._message
+
+    @property
+    def parts(self):
+        """Returns the index of the email message parts."""
+        if self._parts is None:
+            self._parts = PartIndex(self.message)
+        return self._parts
+
+    @property
+    def text(self):
+        """Returns the decoded text parts with their links."""
+        if self._text is None:
+            self._text = MessageText(self.message)
+        return self._text
+
+
+class MessageCache(object):
+    """A LRU cache of email messages keyed by ``(mailbox, UIDVALIDITY, UID)``,
+    bounded by the total size of the raw email messages.
+
+    Email messages missing from memory are looked up in the optional on-disk ``store``."""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, store=None):
+        """Instantiate the cache.
+
+        Arguments:
+        - ``max_bytes``: The maximum total size in bytes of cached email messages.
+                         (Default 32 MiB)
+        - ``store``: The on-disk store of email messages, e.g. ``DiskStore``. (Default None)
+        """
+        self.hits = 0
+        self.max_bytes = max_bytes
+        self.misses = 0
+        self.size = 0
+        self.store = store
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        """Returns the number of cached email messages."""
+        return len(self._entries)
+
+    def clear(self):
+        """Removes all cached email messages, including the stored ones."""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+        if self.store is not None:
+            self.store.clear()
+
+    def get(self, key):
+        """Returns the cached email message of given ``key``, otherwise None.
+        An unknown ``key``, None, is always a miss."""
+        with self._lock:
+            entry = None if key is None else self._entries.pop(key, None)
+            if entry is not None:
+                self._entries[key] = entry
+                self.hits += 1
+                return entry
+            self.misses += 1
+        raw = self.store.get(key) if None not in (key, self.store) else None
+        return None if raw is None else self._put(key, raw)
+
+    def invalidate(self, key):
+        """Removes the cached email message of given ``key``."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.size -= len(entry)
+        if self.store is not None:
+            self.store.invalidate(key)
+
+    def put(self, key, raw):
+        """Caches given ``raw`` email message and returns its cache entry.
+        The least recently used email messages are evicted to stay within ``max_bytes``."""
+        if self.store is not None:
+            self.store.put(key, raw)
+        return self._put(key, raw)
+
+    def statistics(self):
+        """Returns the cache statistics."""
+        statistics = {'bytes': self.size, 'hits': self.hits, 'messages': len(self._entries),
+                      'misses': self.misses}
+        if self.store is not None:
+            statistics['disk'] = self.store.statistics()
+        return statistics
+
+    def _put(self, key, raw):
+        """Caches given ``raw`` email message in memory and returns its cache entry."""
+        entry = CachedMessage(raw)
+        if len(entry) > self.max_bytes:
+            return entry
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._entries[key] = entry
+            self.size += len(entry)
+            while self.size > self.max_bytes:
+                self.size -= len(self._entries.popitem(last=False)[1])
+        return entry
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright 2015-2016 Richard Huang <rickypc@users.noreply.github.com>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+IMAP Library - IMAP SEARCH criteria of email message filters.
+"""
+
+from re import IGNORECASE, compile as re_compile
+from builtins import str as ustr
+from ImapLibrary.index import parse_date
+
+ATOM = re_compile(r'^[^\s(){%*"\\\]\x00-\x1f\x7f]+$')
+DATE_KEYS = (('since', 'SINCE'), ('before', 'BEFORE'), ('on', 'ON'),
+             ('sent_since', 'SENTSINCE'), ('sent_before', 'SENTBEFORE'), ('sent_on', 'SENTON'))
+FLAG_KEYS = re_compile(r'(?:^|(?<=[\s(]))(?:ANSWERED|DELETED|DRAFT|FLAGGED|KEYWORD|NEW|OLD|'
+                       r'RECENT|SEEN|UNANSWERED|UNDELETED|UNDRAFT|UNFLAGGED|UNKEYWORD|'
+                       r'X-GM-RAW)(?=[\s)]|$)', IGNORECASE)
+MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+QUOTED = re_compile(r'"((?:[^"\\]|\\.)*)"')
+QUOTED_PAIR = re_compile(r'\\(.)')
+SEQUENCE_SET = re_compile(r'^(\d+|\*)(:(\d+|\*))?(,(\d+|\*)(:(\d+|\*))?)*$')
+
+
+def any_criteria(criteria_sets):
+    """Returns the criteria matching any of given ``criteria_sets``."""
+    criteria = [_group(criteria_sets[-1])]
+    for criteria_set in reversed(criteria_sets[:-1]):
+        criteria = ['OR', _group(criteria_set)] + criteria
+    return criteria
+
+
+def build_criteria(default='UNSEEN', **kwargs):
+    """Returns the IMAP SEARCH criteria of given email filters, ``default``
+    criteria without any filter.
+
+    Arguments:
+    - ``any``: A list of criteria dictionaries, any of them matches.
+    - ``before``, ``on``, ``since``: The internal date of the email messages, either a date,
+      ``YYYY-MM-DD`` or ``DD-Mon-YYYY``.
+    - ``exclude``: A criteria dictionary the email messages do not match.
+    - ``gmail_raw``: A Gmail search query.
+    - ``header``: A ``Name: value`` header filter, a list of them or a dictionary.
+    - ``keyword``, ``unkeyword``: A flag keyword set, or not set.
+    - ``larger``, ``smaller``: The email message size in bytes.
+    - ``recipient``, ``sender``, ``subject``, ``text``: A part of the field text.
+    - ``sent_before``, ``sent_on``, ``sent_since``: The ``Date`` header of the email messages.
+    - ``status``: A flag status, e.g. ``SEEN`` or ``UNSEEN``.
+    - ``uid``: A UID set, e.g. ``100:*`` or ``1,5:9``.
+    """
+    criteria = []
+    for family in (_text_criteria, _date_criteria, _size_criteria, _keyword_criteria,
+                   _uid_criteria, _gmail_criteria, _composed_criteria):
+        criteria += family(kwargs)
+    status = kwargs.pop('status', None)
+    if status:
+        criteria += [status]
+    return criteria or [default]
+
+
+def is_arrival_criteria(criteria):
+    """Returns boolean value whether given ``criteria`` only match newly arrived email
+    messages or not. Criteria of flags, other than the default ``UNSEEN``, or keywords
+    also match email messages whose flags changed after their arrival."""
+    return FLAG_KEYS.search(QUOTED.sub('""', ' '.join(criteria))) is None
+
+
+def quote(value):
+    """Returns IMAP quoted string of given ``value``."""
+    return '"%s"' % value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def search_arguments(criteria, literal_plus=False):
+    """Returns the imaplib ``search`` charset and criteria arguments of given ``criteria``.
+
+    Criteria with non-ASCII text are sent UTF-8 encoded with ``CHARSET UTF-8``. Their
+    non-ASCII quoted strings are sent as non-synchronizing literals when the server
+    supports ``LITERAL+``, otherwise as quoted strings most servers accept.
+    """
+    if all(_is_ascii(token) for token in criteria):
+        return [None] + list(criteria)
+    arguments = ['UTF-8']
+    for token in criteria:
+        if not isinstance(token, bytes):
+            token = (QUOTED.sub(_literal, token) if literal_plus else token).encode('utf-8')
+        arguments.append(token)
+    return arguments
+
+
+def _composed_criteria(kwargs):
+    """Returns the ``any`` and ``exclude`` criteria of given ``kwargs`` filters."""
+    criteria = []
+    alternatives = [build_criteria('ALL', **dict(alternative))
+                    for alternative in kwargs.pop('any', None) or []]
+    if alternatives:
+        criteria += any_criteria(alternatives)
+    exclude = kwargs.pop('exclude', None)
+    if exclude:
+        criteria += ['NOT', _group(build_criteria('ALL', **dict(exclude)))]
+    return criteria
+
+
+def _date_criteria(kwargs):
+    """Returns the internal date and ``Date`` header criteria of given ``kwargs`` filters."""
+    criteria = []
+    for name, key in DATE_KEYS:
+        value = parse_date(kwargs.pop(name, None))
+        if value is not None:
+            criteria += [key, '%02d-%s-%04d' % (value.day, MONTHS[value.month - 1], value.year)]
+    return criteria
+
+
+def _gmail_criteria(kwargs):
+    """Returns the Gmail search query criteria of given ``kwargs`` filters."""
+    gmail_raw = kwargs.pop('gmail_raw', None)
+    return ['X-GM-RAW', quote(gmail_raw)] if gmail_raw else []
+
+
+def _group(criteria):
+    """Returns given ``criteria`` as a single parenthesized search key."""
+    return '(%s)' % ' '.join(criteria)
+
+
+def _headers(value):
+    """Returns the list of ``(name, value)`` of given header filters."""
+    if not value:
+        return []
+    if hasattr(value, 'items'):
+        return list(value.items())
+    headers = []
+    for header in [value] if isinstance(value, (bytes, ustr, str)) else value:
+        name, _, text = header.partition(':')
+        headers.append((name.strip(), text.strip()))
+    return headers
+
+
+def _is_ascii(token):
+    """Returns boolean value whether given criteria ``token`` is ASCII text or not."""
+    return isinstance(token, bytes) or all(ord(char) < 128 for char in token)
+
+
+def _keyword_criteria(kwargs):
+    """Returns the flag keyword criteria of given ``kwargs`` filters."""
+    criteria = []
+    for name in ('keyword', 'unkeyword'):
+        value = kwargs.pop(name, None)
+        if value:
+            if not ATOM.match(value):
+                raise ValueError('Invalid %s: %s' % (name, value))
+            criteria += [name.upper(), value]
+    return criteria
+
+
+def _literal(match):
+    """Returns the non-synchronizing literal of given non-ASCII quoted string ``match``."""
+    if _is_ascii(match.group(1)):
+        return match.group(0)
+    value = QUOTED_PAIR.sub(r'\1', match.group(1))
+    return '{%d+}\r\n%s' % (len(value.encode('utf-8')), value)
+
+
+def _size_criteria(kwargs):
+    """Returns the email message size criteria of given ``kwargs`` filters."""
+    criteria = []
+    for name in ('larger', 'smaller'):
+        value = kwargs.pop(name, None)
+        if value is not None and value != '':
+            criteria += [name.upper(), '%d' % int(value)]
+    return criteria
+
+
+def _text_criteria(kwargs):
+    """Returns the address, subject, text and header criteria of given ``kwargs`` filters."""
+    criteria = []
+    recipient = kwargs.pop('recipient', kwargs.pop('to_email', kwargs.pop('toEmail', None)))
+    sender = kwargs.pop('sender', kwargs.pop('from_email', kwargs.pop('fromEmail', None)))
+    for key, value in (('TO', recipient), ('FROM', sender),
+                       ('SUBJECT', kwargs.pop('subject', None)),
+                       ('TEXT', kwargs.pop('text', None))):
+        if value:
+            criteria += [key, quote(value)]
+    for name, value in _headers(kwargs.pop('header', None)):
+        criteria += ['HEADER', quote(name), quote(value)]
+    return criteria
+
+
+def _uid_criteria(kwargs):
+    """Returns the UID set criteria of given ``kwargs`` filters."""
+    uid = kwargs.pop('uid', None)
+    if not uid:
+        return []
+    uid = ('%s' % uid).replace(' ', '')
+    if not SEQUENCE_SET.match(uid):
+        raise ValueError('Invalid UID set: %s' % uid)
+    return ['UID', uid]
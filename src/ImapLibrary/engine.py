@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright 2015-2016 Richard Huang <rickypc@users.noreply.github.com>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+IMAP Library - an asyncio IMAP engine to watch many mailbox folders at once.
+"""
+
+import asyncio
+try:
+    from asyncio import all_tasks, current_task
+except ImportError:
+    all_tasks = asyncio.Task.all_tasks  # pylint: disable=no-member
+    current_task = asyncio.Task.current_task  # pylint: disable=no-member
+from atexit import register
+from imaplib import IMAP4
+from re import compile as re_compile
+from ssl import CERT_NONE, create_default_context
+from threading import Lock, Thread
+from time import time
+from ImapLibrary.criteria import quote, search_arguments
+
+IDLE_EVENT = re_compile(br'^\* \d+ (EXISTS|RECENT)')
+LITERAL = re_compile(br'\{(\d+)\}\r\n$')
+RESPONSE_CODE = re_compile(br'\[(UIDNEXT|UIDVALIDITY) (\d+)\]')
+UNTAGGED_NUMBER = re_compile(br'^\* (\d+) ([A-Z-]+)(?: (.*))?$')
+UNTAGGED_TYPE = re_compile(br'^\* ([A-Z-]+)(?: (.*))?$')
+
+
+class AsyncImapClient(object):
+    """A minimal asyncio IMAP client, one command is executed at a time."""
+
+    def __init__(self, host, port, is_secure=True):
+        self.capabilities = ()
+        self.host = host
+        self.is_secure = is_secure
+        self.port = port
+        self._lock = None
+        self._reader = None
+        self._tag = 0
+        self._writer = None
+
+    async def connect(self):
+        """Opens the connection and reads the server capabilities."""
+        context = None
+        if self.is_secure:
+            # Same as imaplib.IMAP4_SSL default, the server certificate is not verified
+            context = create_default_context()
+            context.check_hostname = False
+            context.verify_mode = CERT_NONE
+        self._lock = asyncio.Lock()
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port,
+                                                                   ssl=context)
+        await self._read_response()
+        untagged = (await self.command('CAPABILITY'))[1]
+        self.capabilities = tuple(item.decode('ascii').upper()
+                                  for data in untagged.get('CAPABILITY', [])
+                                  for item in data.split())
+
+    def close(self):
+        """Closes the connection without waiting for the server."""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    async def command(self, name, *args):
+        """Executes given IMAP command, returns its status and its untagged responses
+        grouped by response type."""
+        async with self._lock:
+            tag = self._send(name, *args)
+            untagged = {}
+            while True:
+                response = await self._read_response()
+                line = response[0][0] if isinstance(response[0], tuple) else response[0]
+                if line.startswith(tag + b' '):
+                    status = line[len(tag) + 1:].split(b' ', 1)[0].decode('ascii')
+                    if status != 'OK':
+                        raise IMAP4.error('%s error: %s' % (name, line.decode('utf-8', 'replace')))
+                    return status, untagged
+                self._collect(untagged, response)
+
+    async def idle(self, timeout):
+        """Returns boolean value whether the server notifies a mailbox change
+        within given ``timeout`` seconds using IDLE command."""
+        async with self._lock:
+            tag = self._send('IDLE')
+            line = (await self._read_response())[0]
+            if not line.startswith(b'+'):
+                raise IMAP4.error('IDLE error: %s' % line.decode('utf-8', 'replace'))
+            changed = False
+            end_time = time() + timeout
+            try:
+                while not changed and end_time > time():
+                    line = await asyncio.wait_for(self._reader.readline(), end_time - time())
+                    changed = IDLE_EVENT.match(line) is not None
+            except asyncio.TimeoutError:
+                pass
+            self._writer.write(b'DONE\r\n')
+            while True:
+                line = (await self._read_response())[0]
+                line = line[0] if isinstance(line, tuple) else line
+                if line.startswith(tag + b' '):
+                    return changed
+
+    async def login(self, user, password):
+        """Authenticates with given ``user`` and ``password``."""
+        await self.command('LOGIN', quote(user), quote(password))
+
+    async def logout(self):
+        """Logout and closes the connection."""
+        try:
+            await self.command('LOGOUT')
+        except (IMAP4.error, IOError, OSError):
+            pass
+        self.close()
+
+    async def search(self, criteria):
+        """Returns the list of email indexes matching given ``criteria``."""
+        arguments = search_arguments(criteria, 'LITERAL+' in self.capabilities)
+        charset = ['CHARSET', arguments[0]] if arguments[0] else []
+        untagged = (await self.command('SEARCH', *(charset + arguments[1:])))[1]
+        return [number for data in untagged.get('SEARCH', []) for number in data.split()]
+
+    async def select(self, folder):
+        """Selects given ``folder``, returns its ``UIDVALIDITY`` and ``UIDNEXT``."""
+        untagged = (await self.command('SELECT', quote(folder)))[1]
+        codes = dict((match.group(1), int(match.group(2))) for data in untagged.get('OK', [])
+                     for match in [RESPONSE_CODE.search(data)] if match)
+        return codes.get(b'UIDVALIDITY'), codes.get(b'UIDNEXT')
+
+    @staticmethod
+    def _collect(untagged, response):
+        """Groups given untagged ``response`` by its response type."""
+        line = response[0][0] if isinstance(response[0], tuple) else response[0]
+        match = UNTAGGED_NUMBER.match(line) or UNTAGGED_TYPE.match(line)
+        if match is None:
+            return
+        if len(match.groups()) == 3:
+            name = match.group(2)
+            data = match.group(1) + b' ' + (match.group(3) or b'')
+        else:
+            name, data = match.group(1), match.group(2) or b''
+        name = name.decode('ascii')
+        if isinstance(response[0], tuple):
+            data = [(data, response[0][1])] + response[1:]
+        untagged.setdefault(name, []).extend(data if isinstance(data, list) else [data])
+
+    async def _read_response(self):
+        """Returns one server response in imaplib format, a list of bytes
+        or ``(head, literal)`` tuples."""
+        items = []
+        line = await self._reader.readline()
+        if not line:
+            raise IMAP4.error('socket error: EOF')
+        match = LITERAL.search(line)
+        while match:
+            literal = await self._reader.readexactly(int(match.group(1)))
+            items.append((line[:-2], literal))
+            line = await self._reader.readline()
+            match = LITERAL.search(line)
+        items.append(line.rstrip(b'\r\n'))
+        return items
+
+    def _send(self, name, *args):
+        """Sends given IMAP command and returns its tag."""
+        self._tag += 1
+        tag = ('A%d' % self._tag).encode('ascii')
+        data = b' '.join([tag, name.encode('ascii')] + [
+            arg if isinstance(arg, bytes) else arg.encode('utf-8') for arg in args])
+        self._writer.write(data + b'\r\n')
+        return tag
+
+
+class Engine(object):
+    """An asyncio event loop running on a background thread,
+    coroutines are submitted from the synchronous keywords."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._loop = None
+        self._thread = None
+
+    def run(self, coroutine):
+        """Runs given ``coroutine`` on the engine event loop and returns its result."""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = Thread(target=self._loop.run_forever, name='ImapLibraryEngine')
+                self._thread.daemon = True
+                self._thread.start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def stop(self):
+        """Stops the engine event loop."""
+        with self._lock:
+            if self._loop is not None:
+                asyncio.run_coroutine_threadsafe(self._cancel_tasks(), self._loop).result()
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._thread.join()
+                self._loop.close()
+                self._loop = None
+
+    async def wait_for_email(self, account, folders, criteria, **kwargs):
+        """Returns the dict of folder name to its latest email index matching given ``criteria``.
+
+        Folders are spread over at most ``connections`` connections. A connection
+        watching a single folder waits with IDLE when it is supported, otherwise
+        its folders are searched every ``poll_frequency`` seconds.
+        """
+        connections = max(1, min(len(folders), int(kwargs.get('connections', 4))))
+        poll_frequency = float(kwargs.get('poll_frequency', 10))
+        timeout = float(kwargs.get('timeout', 60))
+        wait_all = kwargs.get('wait_all', False)
+        found = {}
+        matched = asyncio.Event()
+        groups = [folders[pos::connections] for pos in range(connections)]
+        tasks = [asyncio.ensure_future(self._watch(account, group, criteria, poll_frequency,
+                                                   found, matched, wait_all))
+                 for group in groups]
+        waiters = [asyncio.ensure_future(asyncio.gather(*tasks))]
+        try:
+            if not wait_all:
+                waiters.append(asyncio.ensure_future(matched.wait()))
+            done, _ = await asyncio.wait(waiters, timeout=timeout,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            for waiter in done:
+                waiter.result()
+        finally:
+            for task in tasks + waiters:
+                task.cancel()
+            await asyncio.gather(*(tasks + waiters), return_exceptions=True)
+        return found
+
+    @staticmethod
+    async def _cancel_tasks():
+        """Cancels all pending tasks of the engine event loop."""
+        tasks = [task for task in all_tasks() if task is not current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    @staticmethod
+    async def _watch(account, folders, criteria, poll_frequency, found, matched, wait_all):
+        """Watches given ``folders`` over one connection until they have matching email."""
+        host, port, user, password, is_secure = account
+        client = AsyncImapClient(host, port, is_secure)
+        try:
+            await client.connect()
+            await client.login(user, password)
+            pending = list(folders)
+            while pending:
+                for folder in list(pending):
+                    await client.select(folder)
+                    mails = await client.search(criteria)
+                    if mails:
+                        found[folder] = mails[-1]
+                        pending.remove(folder)
+                        if not wait_all:
+                            matched.set()
+                            return
+                if len(pending) == 1 and 'IDLE' in client.capabilities:
+                    await client.idle(poll_frequency)
+                elif pending:
+                    await asyncio.sleep(poll_frequency)
+            await client.logout()
+        finally:
+            client.close()
+
+
+ENGINE = Engine()
+register(ENGINE.stop)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright 2015-2016 Richard Huang <rickypc@users.noreply.github.com>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+IMAP Library - links and pattern matches extracted from email message text parts.
+"""
+
+from collections import OrderedDict
+try:
+    from html import unescape
+except ImportError:
+    from HTMLParser import HTMLParser
+    unescape = HTMLParser().unescape
+from quopri import decodestring
+from re import DOTALL, IGNORECASE, compile as re_compile
+from threading import Lock
+from weakref import WeakKeyDictionary
+
+LINK = re_compile(r'<a\b[^>]*?\bhref=[\'"]?(?P<anchor>[^\'" >]+)[^>]*>'
+                  r'(?P<text>(?:(?!<a\b|</a\s*>).)*)</a\s*>|href=[\'"]?(?P<url>[^\'" >]+)',
+                  DOTALL | IGNORECASE)
+PATTERN_CACHE_SIZE = 256
+TAG = re_compile(r'<[^>]*>')
+TEXT_TYPES = ('text/html', 'text/plain')
+WHITESPACE = re_compile(r'\s+')
+
+_DECODED = WeakKeyDictionary()
+_DECODED_LOCK = Lock()
+_PATTERNS = OrderedDict()
+_PATTERNS_LOCK = Lock()
+
+
+class Link(object):
+    """A link of an email message, with its anchor text and the index of
+    the email message part it was found in, in walk order."""
+
+    __slots__ = ('part', 'text', 'url')
+
+    def __init__(self, url, text, part):
+        self.part = part
+        self.text = text
+        self.url = url
+
+    def to_dict(self):
+        """Returns the link as a dictionary."""
+        return {'part': self.part, 'text': self.text, 'url': self.url}
+
+
+class MessageText(object):
+    """The decoded text parts of an email message and their links, extracted
+    in one pass over the email message parts."""
+
+    __slots__ = ('links', 'parts')
+
+    def __init__(self, message):
+        self.links = []
+        self.parts = []
+        for index, part in enumerate(message.walk()):
+            if part.get_content_type() in TEXT_TYPES:
+                text = decode_text(part)
+                self.parts.append((index, text))
+                self.links.extend(find_links(text, index))
+
+    def findall(self, pattern):
+        """Returns all matches of given regular expression ``pattern`` in the text parts."""
+        regex = compile_pattern(pattern)
+        return [match for _, text in self.parts for match in regex.findall(text)]
+
+
+def compile_pattern(pattern):
+    """Returns the compiled regular expression of given ``pattern``,
+    the least recently used compiled patterns are discarded first."""
+    with _PATTERNS_LOCK:
+        regex = _PATTERNS.pop(pattern, None)
+        if regex is None:
+            regex = re_compile(pattern)
+            if len(_PATTERNS) >= PATTERN_CACHE_SIZE:
+                _PATTERNS.popitem(last=False)
+        _PATTERNS[pattern] = regex
+        return regex
+
+
+def decode_bytes(payload, charset, errors='replace'):
+    """Returns given ``payload`` bytes decoded with given ``charset``, UTF-8 on unknown
+    or missing charset."""
+    try:
+        return payload.decode(charset or 'utf-8', errors)
+    except LookupError:
+        return payload.decode('utf-8', errors)
+
+
+def decode_payload(part):
+    """Returns the content transfer decoded payload bytes of given email message ``part``,
+    it is only decoded once per part."""
+    decoded = _decoded(part)
+    if 'payload' not in decoded:
+        decoded['payload'] = part.get_payload(decode=True)
+    return decoded['payload']
+
+
+def decode_part(part, errors='strict'):
+    """Returns the payload of given email message ``part`` decoded from its content transfer
+    encoding and its charset, or its payload bytes without charset.
+    It is only decoded once per part."""
+    decoded = _decoded(part)
+    if errors not in decoded:
+        payload = decode_payload(part)
+        charset = part.get_content_charset()
+        decoded[errors] = payload.decode(charset, errors) \
+            if charset is not None and isinstance(payload, bytes) else payload
+    return decoded[errors]
+
+
+def decode_text(part):
+    """Returns the text of given email message ``part``, decoded from its
+    content transfer encoding and its charset. It is only decoded once per part."""
+    decoded = _decoded(part)
+    if 'text' not in decoded:
+        payload = decode_payload(part) or b''
+        if isinstance(payload, bytes):
+            if part.get('Content-Transfer-Encoding') is None:
+                # Same as Get Email Body, quoted-printable text is often sent without its header
+                payload = decodestring(payload)
+            payload = decode_bytes(payload, part.get_content_charset())
+        decoded['text'] = payload
+    return decoded['text']
+
+
+def find_links(text, part=None):
+    """Returns the list of links of given ``text``, found in one scan."""
+    links = []
+    for match in LINK.finditer(text):
+        if match.group('anchor') is not None:
+            anchor = WHITESPACE.sub(' ', TAG.sub('', match.group('text'))).strip()
+            links.append(Link(match.group('anchor'), unescape(anchor), part))
+        else:
+            links.append(Link(match.group('url'), None, part))
+    return links
+
+
+def _decoded(part):
+    """Returns the decoded payloads of given email message ``part``, kept as long as
+    the part is."""
+    with _DECODED_LOCK:
+        decoded = _DECODED.get(part)
+        if decoded is None:
+            decoded = _DECODED[part] = {}
+        return decoded
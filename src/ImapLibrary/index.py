@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright 2015-2016 Richard Huang <rickypc@users.noreply.github.com>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+IMAP Library - a local index of mailbox email messages.
+"""
+
+from collections import OrderedDict
+from datetime import date, datetime
+from email.header import decode_header
+from email.utils import parsedate_tz
+from re import compile as re_compile
+from ImapLibrary.parts import parse_bodystructure
+from ImapLibrary.response import to_int, to_str
+
+DATE_FORMATS = ('%Y-%m-%d', '%d-%b-%Y')
+STATUS_FLAGS = {'ANSWERED': ('\\ANSWERED', True), 'DELETED': ('\\DELETED', True),
+                'DRAFT': ('\\DRAFT', True), 'FLAGGED': ('\\FLAGGED', True),
+                'RECENT': ('\\RECENT', True), 'SEEN': ('\\SEEN', True),
+                'UNANSWERED': ('\\ANSWERED', False), 'UNDELETED': ('\\DELETED', False),
+                'UNDRAFT': ('\\DRAFT', False), 'UNFLAGGED': ('\\FLAGGED', False),
+                'UNSEEN': ('\\SEEN', False)}
+
+
+class IndexEntry(object):
+    """An indexed email message, described by its IMAP ENVELOPE and BODYSTRUCTURE."""
+
+    __slots__ = ('attachments', 'bcc', 'cc', 'content_type', 'date', 'flags', 'message_id',
+                 'number', 'sender', 'size', 'subject', 'to', 'uid')
+
+    def __init__(self, uid, number, items):
+        envelope = items.get('ENVELOPE') or []
+        envelope = list(envelope) + [None] * (10 - len(envelope))
+        structure = items.get('BODYSTRUCTURE')
+        root = parse_bodystructure(structure) if isinstance(structure, list) else None
+        self.attachments = [part.get_filename() for part in root.walk()
+                            if part.get_filename()] if root else []
+        self.bcc = _addresses(envelope[7])
+        self.cc = _addresses(envelope[6])
+        self.content_type = root.get_content_type() if root else None
+        self.date = _date(to_str(envelope[0]))
+        self.flags = _flags(items.get('FLAGS'))
+        self.message_id = to_str(envelope[9])
+        self.number = number
+        self.sender = _addresses(envelope[2])
+        self.size = to_int(items.get('RFC822.SIZE'), 0)
+        self.subject = _decode(to_str(envelope[1])) or ''
+        self.to = _addresses(envelope[5])
+        self.uid = uid
+
+
+class IndexQuery(object):
+    """An email message filter evaluated against the local index."""
+
+    def __init__(self, **kwargs):
+        """Instantiate the filter.
+
+        Arguments:
+        - ``attachment``: A part of an attachment file name.
+        - ``before``: The email messages sent before given date, e.g. ``2024-01-31``.
+        - ``larger``: The email messages larger than given size in bytes.
+        - ``message_id``: The email message ``Message-ID``.
+        - ``recipient``: A part of the ``To``, ``Cc`` or ``Bcc`` addresses.
+        - ``recipient_regex``: A regular expression searched in the recipient addresses.
+        - ``sender``: A part of the ``From`` addresses.
+        - ``sender_regex``: A regular expression searched in the ``From`` addresses.
+        - ``since``: The email messages sent on or after given date, e.g. ``2024-01-01``.
+        - ``smaller``: The email messages smaller than given size in bytes.
+        - ``status``: A flag status, e.g. ``SEEN``, ``UNSEEN``, ``FLAGGED``, or ``ALL``.
+        - ``subject``: A part of the subject.
+        - ``subject_regex``: A regular expression searched in the subject.
+
+        Text is compared case-insensitively, the same as IMAP SEARCH.
+        Without any filter, unseen email messages are matched.
+        """
+        recipient = kwargs.pop('recipient', kwargs.pop('to_email', kwargs.pop('toEmail', None)))
+        sender = kwargs.pop('sender', kwargs.pop('from_email', kwargs.pop('fromEmail', None)))
+        self.filters = []
+        self._contains('attachments', kwargs.pop('attachment', None))
+        self._contains('recipients', recipient)
+        self._contains('sender', sender)
+        self._contains('subject', kwargs.pop('subject', None))
+        self._matches('recipients', kwargs.pop('recipient_regex', None))
+        self._matches('sender', kwargs.pop('sender_regex', None))
+        self._matches('subject', kwargs.pop('subject_regex', None))
+        message_id = kwargs.pop('message_id', None)
+        if message_id:
+            self.filters.append(lambda entry: entry.message_id == message_id)
+        since = parse_date(kwargs.pop('since', None))
+        if since:
+            self.filters.append(lambda entry: entry.date is not None and entry.date >= since)
+        before = parse_date(kwargs.pop('before', None))
+        if before:
+            self.filters.append(lambda entry: entry.date is not None and entry.date < before)
+        larger = to_int(kwargs.pop('larger', None))
+        if larger is not None:
+            self.filters.append(lambda entry: entry.size > larger)
+        smaller = to_int(kwargs.pop('smaller', None))
+        if smaller is not None:
+            self.filters.append(lambda entry: entry.size < smaller)
+        if 'text' in kwargs:
+            raise ValueError('Email body text is not indexed, use the IMAP server search instead')
+        status = (kwargs.pop('status', None) or ('UNSEEN' if not self.filters else 'ALL'))
+        self.uses_flags = status.upper() != 'ALL'
+        if self.uses_flags:
+            if status.upper() not in STATUS_FLAGS:
+                raise ValueError('Unknown status: %s' % status)
+            flag, present = STATUS_FLAGS[status.upper()]
+            self.filters.append(lambda entry: (flag in entry.flags) == present)
+
+    def __call__(self, entry):
+        """Returns boolean value whether given index ``entry`` matches or not."""
+        return all(match(entry) for match in self.filters)
+
+    def _contains(self, field, value):
+        """Adds a case-insensitive substring filter of given entry ``field``."""
+        if value:
+            value = value.lower()
+            self.filters.append(lambda entry: any(value in text.lower()
+                                                  for text in _texts(entry, field)))
+
+    def _matches(self, field, pattern):
+        """Adds a regular expression filter of given entry ``field``."""
+        if pattern:
+            regex = re_compile(pattern)
+            self.filters.append(lambda entry: any(regex.search(text)
+                                                  for text in _texts(entry, field)))
+
+
+class MailboxIndex(object):
+    """A local index of the selected mailbox email messages keyed by UID."""
+
+    def __init__(self):
+        self.modseq = None
+        self.stale = False
+        self.uidvalidity = None
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        """Returns the number of indexed email messages."""
+        return len(self._entries)
+
+    def add(self, number, items):
+        """Indexes the email message of given FETCH response ``items`` and returns its entry."""
+        uid = to_int(items.get('UID'))
+        if uid is None:
+            return None
+        entry = IndexEntry(uid, number, items)
+        self._entries[uid] = entry
+        self._track_modseq(items)
+        return entry
+
+    def clear(self, uidvalidity=None):
+        """Removes all indexed email messages."""
+        self._entries.clear()
+        self.modseq = None
+        self.stale = False
+        self.uidvalidity = uidvalidity
+
+    @property
+    def last_uid(self):
+        """Returns the highest indexed UID, otherwise 0."""
+        return max(self._entries) if self._entries else 0
+
+    def renumber(self, responses):
+        """Updates the email indexes and flags from given ``(email index, items)`` FETCH
+        responses of the whole mailbox, email messages not in responses are removed."""
+        entries = OrderedDict()
+        for number, items in responses:
+            entry = self._entries.get(to_int(items.get('UID')))
+            if entry is not None:
+                entry.number = number
+                if 'FLAGS' in items:
+                    entry.flags = _flags(items['FLAGS'])
+                entries[entry.uid] = entry
+        self._entries = entries
+        self.stale = False
+
+    def resync(self, responses, vanished=None):
+        """Updates the flags from given ``(email index, items)`` FETCH responses of changed
+        email messages, and removes the email messages of given ``vanished`` UID sets.
+
+        Email indexes are renumbered by UID order, it requires the index to hold
+        all email messages of the mailbox."""
+        for _, items in responses:
+            entry = self._entries.get(to_int(items.get('UID')))
+            if entry is not None and 'FLAGS' in items:
+                entry.flags = _flags(items['FLAGS'])
+            self._track_modseq(items)
+        ranges = _uid_ranges(vanished)
+        uids = sorted(uid for uid in self._entries
+                      if not any(first <= uid <= last for first, last in ranges))
+        self._entries = OrderedDict((uid, self._entries[uid]) for uid in uids)
+        for number, uid in enumerate(uids, 1):
+            self._entries[uid].number = number
+        self.stale = False
+
+    def search(self, query):
+        """Returns the list of index entries matching given ``query``, by email index."""
+        return sorted((entry for entry in self._entries.values() if query(entry)),
+                      key=lambda entry: entry.number)
+
+    def _track_modseq(self, items):
+        """Keeps the highest modification sequence of given FETCH response ``items``."""
+        value = items.get('MODSEQ')
+        modseq = to_int(value[0] if isinstance(value, list) and value else value)
+        if modseq is not None and (self.modseq is None or modseq > self.modseq):
+            self.modseq = modseq
+
+
+def parse_date(value):
+    """Returns the date of given ``value``, either a date or ``YYYY-MM-DD`` or
+    ``DD-Mon-YYYY`` string, otherwise None."""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    raise ValueError('Unknown date format: %s' % value)
+
+
+def _addresses(value):
+    """Returns the list of ``Name <mailbox@host>`` strings of given ENVELOPE address list."""
+    addresses = []
+    for address in value if isinstance(value, list) else []:
+        if not isinstance(address, list) or len(address) < 4 or address[2] is None:
+            continue
+        email = '%s@%s' % (to_str(address[2]), to_str(address[3]) or '')
+        name = _decode(to_str(address[0]))
+        addresses.append('%s <%s>' % (name, email) if name else email)
+    return addresses
+
+
+def _date(value):
+    """Returns the sent date of given ENVELOPE date string, otherwise None."""
+    parsed = parsedate_tz(value) if value else None
+    if not parsed:
+        return None
+    try:
+        return date(*parsed[:3])
+    except ValueError:
+        return None
+
+
+def _decode(value):
+    """Returns given RFC 2047 encoded-word header ``value`` decoded."""
+    if not value or '=?' not in value:
+        return value
+    text = []
+    for chunk, charset in decode_header(value):
+        if isinstance(chunk, bytes):
+            chunk = chunk.decode(charset or 'ascii', 'replace')
+        text.append(chunk)
+    return ''.join(text)
+
+
+def _flags(value):
+    """Returns the upper-cased flags of given FETCH FLAGS value."""
+    return tuple(to_str(flag).upper() for flag in value or [] if flag is not None)
+
+
+def _uid_ranges(values):
+    """Returns the list of ``(first, last)`` UID ranges of given VANISHED response values."""
+    ranges = []
+    for value in values or []:
+        text = to_str(value) if not isinstance(value, tuple) else to_str(value[0])
+        for uid_set in (text or '').replace('(EARLIER)', '').split():
+            for uid_range in uid_set.split(','):
+                first, _, last = uid_range.partition(':')
+                if to_int(first) is not None:
+                    ranges.append(tuple(sorted((int(first), to_int(last, int(first))))))
+    return ranges
+
+
+def _texts(entry, field):
+    """Returns the list of texts of given index ``entry`` field."""
+    if field == 'recipients':
+        return entry.to + entry.cc + entry.bcc
+    value = getattr(entry, field)
+    return value if isinstance(value, list) else [value]
@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright 2015-2016 Richard Huang <rickypc@users.noreply.github.com>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+IMAP Library - email message parts fetched on demand.
+"""
+
+from binascii import a2b_base64
+from fnmatch import fnmatch
+from quopri import decodestring
+from re import compile as re_compile
+from ImapLibrary.response import to_int, to_str
+
+BASE64_IGNORED = re_compile(br'[^A-Za-z0-9+/=]')
+
+
+class Part(object):
+    """A MIME part described by IMAP BODYSTRUCTURE, its payload is only fetched
+    from the IMAP server once it is requested.
+
+    It provides the subset of ``email.message.Message`` methods used by multipart keywords.
+    """
+
+    __slots__ = ('children', 'content_type', 'disposition', 'encoding', 'filename', 'params',
+                 'path', 'size', '_loader', '_payloads', '__weakref__')
+
+    def __init__(self, path, content_type, params=None, encoding=None, size=0,
+                 disposition=None, filename=None, children=None, loader=None):
+        self.children = children or []
+        self.content_type = content_type
+        self.disposition = disposition
+        self.encoding = encoding
+        self.filename = filename
+        self.params = params or {}
+        self.path = path
+        self.size = size
+        self._loader = loader
+        self._payloads = {}
+
+    def get(self, name, failobj=None):
+        """Returns the value of given MIME header field ``name`` described by BODYSTRUCTURE,
+        ``Content-Type``, ``Content-Transfer-Encoding`` or ``Content-Disposition``."""
+        value = {'content-disposition': self.disposition,
+                 'content-transfer-encoding': self.encoding,
+                 'content-type': self.content_type}.get(name.lower())
+        return failobj if value is None else value
+
+    def get_content_charset(self, failobj=None):
+        """Returns the charset parameter of the content type."""
+        charset = self.params.get('charset')
+        return charset.lower() if charset else failobj
+
+    def get_content_maintype(self):
+        """Returns the main content type."""
+        return self.content_type.split('/')[0]
+
+    def get_content_subtype(self):
+        """Returns the content sub-type."""
+        return self.content_type.split('/')[-1]
+
+    def get_content_type(self):
+        """Returns the content type."""
+        return self.content_type
+
+    def get_filename(self, failobj=None):
+        """Returns the filename parameter of the content disposition or content type."""
+        return self.filename or failobj
+
+    def get_payload(self, i=None, decode=False, start=None, length=None):
+        """Returns the list of sub-parts on multipart part, None when ``decode`` is requested
+        as ``email.message.Message`` does, otherwise the part payload bytes,
+        optionally only ``length`` bytes from ``start`` offset."""
+        if self.is_multipart():
+            if decode:
+                return None
+            return self.children if i is None else self.children[i]
+        if start is not None or length is not None:
+            return self._loader(self, decode, start or 0, length)
+        if decode not in self._payloads:
+            self._payloads[decode] = self._loader(self, decode, None, None)
+        return self._payloads[decode]
+
+    def is_multipart(self):
+        """Returns boolean value whether the part has sub-parts or not."""
+        return self.content_type.startswith('multipart/')
+
+    def to_dict(self):
+        """Returns the part description as a dictionary."""
+        return {'charset': self.get_content_charset(), 'content_type': self.content_type,
+                'disposition': self.disposition, 'filename': self.filename, 'path': self.path,
+                'size': self.size}
+
+    def walk(self):
+        """Yields this part and all of its sub-parts, depth-first."""
+        yield self
+        for child in self.children:
+            for part in child.walk():
+                yield part
+
+
+class LazyMessage(object):
+    """An email message with its headers and the MIME parts described by IMAP BODYSTRUCTURE."""
+
+    def __init__(self, headers, root):
+        self.headers = headers
+        self.root = root
+
+    def __getitem__(self, name):
+        """Returns the value of given header field ``name``."""
+        return self.headers[name]
+
+    def get_content_type(self):
+        """Returns the content type."""
+        return self.root.get_content_type()
+
+    def get_payload(self, i=None, decode=False):
+        """Returns the list of sub-parts on multipart message, otherwise the body payload."""
+        return self.root.get_payload(i, decode)
+
+    def keys(self):
+        """Returns all header field names."""
+        return self.headers.keys()
+
+    def walk(self):
+        """Yields all MIME parts, depth-first."""
+        return self.root.walk()
+
+
+class PartIndex(object):
+    """The MIME parts of an email message in walk order, indexed once, with their
+    ``Part`` descriptors numbered like IMAP BODYSTRUCTURE."""
+
+    __slots__ = ('descriptors', 'parts')
+
+    def __init__(self, message):
+        self.parts = list(message.walk())
+        if isinstance(message, LazyMessage):
+            self.descriptors = self.parts
+        else:
+            self.descriptors = list(describe_message(message).walk())
+
+    def __len__(self):
+        """Returns the number of parts."""
+        return len(self.parts)
+
+    def find(self, content_type=None, filename=None, disposition=None):
+        """Returns the index of the first part matching given ``content_type`` pattern,
+        e.g. ``text/html`` or ``image/*``, ``filename`` pattern and ``disposition``,
+        otherwise None."""
+        for index, part in enumerate(self.descriptors):
+            if content_type is not None and not fnmatch(part.content_type,
+                                                        content_type.lower()):
+                continue
+            if filename is not None and not fnmatch(part.filename or '', filename):
+                continue
+            if disposition is not None and part.disposition != disposition.lower():
+                continue
+            return index
+        return None
+
+
+class TransferDecoder(object):
+    """An incremental decoder of content transfer encoded payload chunks."""
+
+    def __init__(self, encoding):
+        self.encoding = (encoding or '').lower()
+        self._pending = b''
+
+    def decode(self, chunk):
+        """Returns the decoded bytes of given ``chunk``, incomplete input is kept
+        until the next chunk."""
+        if self.encoding == 'base64':
+            data = self._pending + BASE64_IGNORED.sub(b'', chunk)
+            end = len(data) - len(data) % 4
+        elif self.encoding == 'quoted-printable':
+            data = self._pending + chunk
+            end = data.rfind(b'\n') + 1
+        else:
+            return chunk
+        self._pending = data[end:]
+        return decode_transfer(data[:end], self.encoding)
+
+    def flush(self):
+        """Returns the decoded bytes of the remaining input."""
+        data, self._pending = self._pending, b''
+        return decode_transfer(data, self.encoding)
+
+
+def decode_transfer(payload, encoding):
+    """Returns the bytes of given content transfer encoded ``payload``."""
+    encoding = (encoding or '').lower()
+    if encoding == 'base64':
+        return a2b_base64(payload)
+    if encoding == 'quoted-printable':
+        return decodestring(payload)
+    return payload
+
+
+def describe_message(message, path=''):
+    """Returns the root ``Part`` descriptor of given parsed email ``message``,
+    numbered like IMAP BODYSTRUCTURE, without any payload loader."""
+    content_type = message.get_content_type()
+    params = dict((name.lower(), value) for name, value in (message.get_params() or [])[1:])
+    disposition = (message.get('Content-Disposition') or '').split(';')[0].strip().lower()
+    if content_type.startswith('multipart/'):
+        children = [describe_message(child, _join(path, number))
+                    for number, child in enumerate(message.get_payload(), 1)]
+        return Part(path, content_type, params, disposition=disposition or None,
+                    children=children)
+    path = path or '1'
+    children = []
+    payload = message.get_payload()
+    if isinstance(payload, list):
+        nested = describe_message(payload[0], path)
+        if not nested.is_multipart():
+            nested.path = _join(path, 1)
+        children = [nested]
+        payload = payload[0].as_string()
+    return Part(path, content_type, params,
+                (message.get('Content-Transfer-Encoding') or '7bit').strip().lower(),
+                len(payload or ''), disposition or None, message.get_filename(), children)
+
+
+def parse_bodystructure(value, loader=None, path=''):
+    """Returns the root ``Part`` of given parsed IMAP BODYSTRUCTURE ``value``."""
+    if value and isinstance(value[0], list):
+        children = []
+        while value and isinstance(value[0], list):
+            children.append(value[0])
+            value = value[1:]
+        children = [parse_bodystructure(child, loader, _join(path, number))
+                    for number, child in enumerate(children, 1)]
+        subtype = (to_str(value[0]) if value else None) or 'mixed'
+        params = _params(value[1]) if len(value) > 1 else {}
+        disposition = value[2] if len(value) > 2 else None
+        return Part(path, 'multipart/%s' % subtype.lower(), params,
+                    disposition=_disposition(disposition)[0], children=children, loader=loader)
+    content_type = ('%s/%s' % (to_str(value[0]), to_str(value[1]))).lower()
+    params = _params(value[2])
+    path = path or '1'
+    children = []
+    extension = 7
+    if content_type.startswith('text/'):
+        extension = 8
+    elif content_type == 'message/rfc822' and len(value) > 8:
+        nested = parse_bodystructure(value[8], loader, path)
+        if not nested.is_multipart():
+            nested.path = _join(path, 1)
+        children = [nested]
+        extension = 10
+    disposition, disposition_params = _disposition(value[extension + 1]
+                                                   if len(value) > extension + 1 else None)
+    filename = disposition_params.get('filename') or params.get('name')
+    part = Part(path, content_type, params, (to_str(value[5]) or '7bit').lower(),
+                to_int(value[6], 0), disposition, filename, loader=loader)
+    part.children = children
+    return part
+
+
+def _disposition(value):
+    """Returns the disposition type and its parameters."""
+    if not isinstance(value, list) or not value:
+        return None, {}
+    return (to_str(value[0]) or '').lower() or None, _params(value[1] if len(value) > 1 else None)
+
+
+def _join(path, number):
+    """Returns the part path of sub-part ``number``."""
+    return '%s.%d' % (path, number) if path else '%d' % number
+
+
+def _params(value):
+    """Returns the dict of given IMAP body parameter list."""
+    if not isinstance(value, list):
+        return {}
+    return dict((to_str(value[pos]).lower(), to_str(value[pos + 1]))
+                for pos in range(0, len(value) - 1, 2))
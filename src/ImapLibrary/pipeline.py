@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright 2015-2016 Richard Huang <rickypc@users.noreply.github.com>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+IMAP Library - pipelined IMAP commands over one imaplib session.
+"""
+
+UID_UNTAGGED = ('SEARCH', 'SORT', 'THREAD')
+
+
+class Pipeline(object):
+    """Sends several tagged IMAP commands on an imaplib session without waiting
+    for the previous command completion, then reads their responses by tag.
+
+    Commands are given as imaplib method names and arguments, e.g.
+    ``('search', (None, 'UNSEEN'))``, and their results are the same as
+    the imaplib method results.
+    """
+
+    def __init__(self, imap):
+        self.imap = imap
+
+    def execute(self, *commands):
+        """Returns the list of results of given ``(method, args)`` commands."""
+        requests = [self._request(method, args) for method, args in commands]
+        if any(name in ('SELECT', 'EXAMINE') for name, _, _ in requests):
+            # Same as imaplib select, flush old responses
+            self.imap.untagged_responses = {}
+        tags = [self.imap._command(name, *args) for name, args, _ in requests]
+        results = []
+        error = None
+        for (name, _, untagged), tag in zip(requests, tags):
+            try:
+                typ, data = self.imap._command_complete(name, tag)
+            except self.imap.abort:
+                raise
+            except self.imap.error as exc:
+                # Other commands responses must still be read before raising
+                error = error or exc
+                continue
+            results.append(self._result(name, untagged, typ, data))
+        if error is not None:
+            raise error
+        return results
+
+    @staticmethod
+    def _request(method, args):
+        """Returns IMAP command name, arguments and untagged response name
+        of given imaplib ``method`` call."""
+        name = method.upper()
+        if name in ('SELECT', 'EXAMINE'):
+            return name, (args[0] if args else 'INBOX',), 'EXISTS'
+        if name == 'SEARCH':
+            charset, criteria = args[0], tuple(args[1:])
+            return name, (('CHARSET', charset) + criteria if charset else criteria), name
+        if name == 'UID':
+            command = args[0].upper()
+            return name, (command,) + tuple(args[1:]), \
+                command if command in UID_UNTAGGED else 'FETCH'
+        if name == 'STORE':
+            return name, args, 'FETCH'
+        return name, args, name
+
+    def _result(self, name, untagged, typ, data):
+        """Returns the imaplib method result of completed command."""
+        if name in ('SELECT', 'EXAMINE'):
+            if typ != 'OK':
+                self.imap.state = 'AUTH'
+                return typ, data
+            self.imap.state = 'SELECTED'
+            return typ, self.imap.untagged_responses.get(untagged, [None])
+        return self.imap._untagged_response(typ, data, untagged)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright 2015-2016 Richard Huang <rickypc@users.noreply.github.com>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+IMAP Library - a pool of authenticated IMAP sessions.
+"""
+
+from atexit import register
+from imaplib import IMAP4
+from threading import Lock
+from time import time
+
+
+class ConnectionPool(object):
+    """A pool of authenticated IMAP sessions keyed by ``(host, port, user, is_secure)``."""
+
+    def __init__(self, max_size=8, idle_timeout=300):
+        """Instantiate the pool.
+
+        Arguments:
+        - ``max_size``: The maximum number of idle sessions kept in the pool. (Default 8)
+        - ``idle_timeout``: The maximum value in seconds an idle session is kept in the pool.
+                            (Default 300)
+        """
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._lock = Lock()
+        self._sessions = []
+
+    def __len__(self):
+        """Returns the number of idle sessions in the pool."""
+        return len(self._sessions)
+
+    def acquire(self, key):
+        """Returns a healthy idle session of given ``key``, otherwise None."""
+        while True:
+            with self._lock:
+                expired = self._evict_expired()
+                imap = None
+                for pos in range(len(self._sessions) - 1, -1, -1):
+                    if self._sessions[pos][0] == key:
+                        imap = self._sessions.pop(pos)[1]
+                        break
+            self._logout(*expired)
+            if imap is None or self._is_healthy(imap):
+                return imap
+            self._logout(imap)
+
+    def clear(self):
+        """Logout all idle sessions in the pool."""
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+        self._logout(*[imap for _, imap, _ in sessions])
+
+    def release(self, key, imap):
+        """Returns given authenticated ``imap`` session of given ``key`` to the pool."""
+        with self._lock:
+            self._sessions.append((key, imap, time()))
+            evicted = self._evict_expired()
+            while len(self._sessions) > self.max_size:
+                evicted.append(self._sessions.pop(0)[1])
+        self._logout(*evicted)
+
+    def _evict_expired(self):
+        """Removes expired sessions from the pool and returns them."""
+        deadline = time() - self.idle_timeout
+        expired = [imap for _, imap, released in self._sessions if released < deadline]
+        self._sessions = [session for session in self._sessions if session[2] >= deadline]
+        return expired
+
+    @staticmethod
+    def _is_healthy(imap):
+        """Returns boolean value whether the session is still usable or not."""
+        try:
+            return imap.noop()[0] == 'OK'
+        except (IMAP4.error, IOError, OSError):
+            return False
+
+    @staticmethod
+    def _logout(*sessions):
+        """Logout given sessions, ignoring any connection error."""
+        for imap in sessions:
+            try:
+                imap.logout()
+            except (IMAP4.error, IOError, OSError):
+                pass
+
+
+POOL = ConnectionPool()
+register(POOL.clear)
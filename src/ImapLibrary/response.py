@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright 2015-2016 Richard Huang <rickypc@users.noreply.github.com>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+IMAP Library - a parser of IMAP server responses.
+"""
+
+from re import compile as re_compile
+
+ATOM = re_compile(br'[^\s()"{\[\]]+(\[[^\]]*\](<\d+>)?)?')
+LITERAL_SUFFIX = re_compile(br'\{\d+\+?\}$')
+QUOTED = re_compile(br'"((?:[^"\\]|\\.)*)"')
+QUOTED_ESCAPE = re_compile(br'\\(.)')
+SPACE = re_compile(br'\s+')
+
+
+class Literal(bytes):
+    """An IMAP literal string value."""
+
+
+def parse_fetch(data):
+    """Returns the list of ``(email index, items)`` from given imaplib FETCH response ``data``.
+
+    Each ``items`` is a dict of upper-cased FETCH item name to its value, IMAP lists are
+    returned as Python lists, strings as bytes, numbers as bytes, and NIL as None.
+    """
+    values = parse(data)
+    responses = []
+    for pos in range(0, len(values) - 1, 2):
+        number, items = values[pos], values[pos + 1]
+        if not isinstance(items, list):
+            continue
+        responses.append((int(number), dict((_name(items[item]), items[item + 1])
+                                            for item in range(0, len(items) - 1, 2))))
+    return responses
+
+
+def parse(data):
+    """Returns the list of values from given imaplib response ``data``."""
+    stack = [[]]
+    for token in _tokenize(data):
+        if token == b'(':
+            stack.append([])
+        elif token == b')':
+            if len(stack) > 1:
+                values = stack.pop()
+                stack[-1].append(values)
+        else:
+            stack[-1].append(token)
+    while len(stack) > 1:
+        values = stack.pop()
+        stack[-1].append(values)
+    return stack[0]
+
+
+def to_int(value, default=None):
+    """Returns the integer of given ``value``, otherwise ``default``."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def to_str(value):
+    """Returns the native string of given ``value``, otherwise None."""
+    if value is None or isinstance(value, list):
+        return None
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    return value
+
+
+def _name(value):
+    """Returns the upper-cased FETCH item name."""
+    return to_str(value).upper()
+
+
+def _tokenize(data):
+    """Yields the tokens of given imaplib response ``data``."""
+    for item in data:
+        if isinstance(item, tuple):
+            head, literal = item
+            for token in _tokenize_text(LITERAL_SUFFIX.sub(b'', head)):
+                yield token
+            yield Literal(literal)
+        elif item is not None:
+            for token in _tokenize_text(item):
+                yield token
+
+
+def _tokenize_text(text):
+    """Yields the tokens of given response ``text``."""
+    pos = 0
+    while pos < len(text):
+        match = SPACE.match(text, pos)
+        if match:
+            pos = match.end()
+            continue
+        char = text[pos:pos + 1]
+        if char in (b'(', b')'):
+            pos += 1
+            yield char
+            continue
+        match = QUOTED.match(text, pos)
+        if match:
+            pos = match.end()
+            yield QUOTED_ESCAPE.sub(br'\1', match.group(1))
+            continue
+        match = ATOM.match(text, pos)
+        if match:
+            pos = match.end()
+            token = match.group(0)
+            yield None if token.upper() == b'NIL' else token
+            continue
+        pos += 1
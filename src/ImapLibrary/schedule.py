@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright 2015-2016 Richard Huang <rickypc@users.noreply.github.com>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+IMAP Library - a mailbox check delay schedule.
+"""
+
+from random import uniform
+
+
+class PollSchedule(object):
+    """A schedule of delays between mailbox checks, growing exponentially
+    from ``initial`` seconds up to ``maximum`` seconds, with random jitter."""
+
+    def __init__(self, initial=10, backoff=1, maximum=None, jitter=0):
+        """Instantiate the schedule.
+
+        Arguments:
+        - ``initial``: The first delay value in seconds. (Default 10)
+        - ``backoff``: The factor applied to the delay after each mailbox check. (Default 1)
+        - ``maximum``: The maximum delay value in seconds. (Default None)
+        - ``jitter``: The random fraction of the delay added or removed, between 0 and 1,
+                      so that concurrent waits do not check the mailbox at the same time.
+                      (Default 0)
+        """
+        self.backoff = backoff
+        self.initial = initial
+        self.jitter = jitter
+        self.maximum = maximum
+
+    def delays(self):
+        """Yields the delay values in seconds."""
+        delay = self.initial
+        while True:
+            if self.jitter:
+                yield max(0.0, delay * (1 + uniform(-self.jitter, self.jitter)))
+            else:
+                yield delay
+            delay *= self.backoff
+            if self.maximum is not None:
+                delay = min(delay, self.maximum)
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright 2015-2016 Richard Huang <rickypc@users.noreply.github.com>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+IMAP Library - the state of an IMAP email client session.
+"""
+
+from threading import RLock
+from ImapLibrary.index import MailboxIndex
+
+
+class MailboxSession(object):
+    """The state of one IMAP email client session, its selected mailbox, the latest
+    found email messages and the multipart email walk.
+
+    The ``lock`` serializes the keywords using the session from several threads.
+    """
+
+    __slots__ = ('account', 'change_detection', 'email_index', 'exists', 'extensions', 'imap',
+                 'index', 'lock', 'mailbox', 'mails', 'mp_iter', 'mp_msg', 'part', 'pipelining',
+                 'pool_key', 'uidnext', 'uids', 'uidvalidity', 'wait_statistics')
+
+    def __init__(self):
+        self.account = None
+        self.change_detection = 'select'
+        self.email_index = None
+        self.exists = None
+        self.extensions = ()
+        self.imap = None
+        self.index = MailboxIndex()
+        self.lock = RLock()
+        self.mailbox = None
+        self.mails = []
+        self.mp_iter = None
+        self.mp_msg = None
+        self.part = None
+        self.pipelining = False
+        self.pool_key = None
+        self.uidnext = None
+        self.uids = {}
+        self.uidvalidity = None
+        self.wait_statistics = {}
+
+
+def session_state(name):
+    """Returns a property of given ``name`` state of the library current session."""
+    return property(lambda library: getattr(library._session, name),
+                    lambda library, value: setattr(library._session, name, value),
+                    doc='The %s state of the current session.' % name)
@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright 2015-2016 Richard Huang <rickypc@users.noreply.github.com>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+IMAP Library - IMAP command timing and byte counters.
+"""
+
+from collections import OrderedDict
+from imaplib import IMAP4
+from json import dumps
+from threading import Lock
+from time import time
+
+COUNTERS = ('bytes_in', 'bytes_out', 'cache_hits', 'cache_misses', 'calls', 'elapsed', 'polls')
+PROMETHEUS_METRICS = (
+    ('imap_keyword_calls_total', 'calls', 'Keyword calls.'),
+    ('imap_keyword_seconds_total', 'elapsed', 'Keyword elapsed seconds.'),
+    ('imap_bytes_received_total', 'bytes_in', 'Bytes received from the IMAP server.'),
+    ('imap_bytes_sent_total', 'bytes_out', 'Bytes sent to the IMAP server.'),
+    ('imap_cache_hits_total', 'cache_hits', 'Email messages served from the message cache.'),
+    ('imap_cache_misses_total', 'cache_misses', 'Email messages missing from the message cache.'),
+    ('imap_polls_total', 'polls', 'Mailbox checks while waiting for email messages.'))
+PROMETHEUS_COMMAND_METRICS = (
+    ('imap_commands_total', 'counter', 'count', 'IMAP commands sent.'),
+    ('imap_command_seconds_total', 'counter', 'seconds', 'IMAP command round-trip seconds.'),
+    ('imap_command_seconds_max', 'gauge', 'max_seconds',
+     'Slowest IMAP command round-trip seconds.'))
+
+
+class ImapStatistics(object):
+    """IMAP commands, round-trip times, bytes transferred, message cache lookups and
+    mailbox checks, recorded in total and per keyword call."""
+
+    def __init__(self):
+        self._keyword = None
+        self._lock = Lock()
+        self._started = None
+        self._total = _counters()
+        self._keywords = OrderedDict()
+
+    def cache(self, hit):
+        """Records a message cache lookup, a ``hit`` or a miss."""
+        self._add('cache_hits' if hit else 'cache_misses', 1)
+
+    def command(self, name, seconds):
+        """Records an IMAP command ``name`` completed in given round-trip ``seconds``."""
+        with self._lock:
+            for counters in self._targets():
+                command = counters['commands'].setdefault(
+                    name, {'count': 0, 'max_seconds': 0.0, 'seconds': 0.0})
+                command['count'] += 1
+                command['max_seconds'] = max(command['max_seconds'], seconds)
+                command['seconds'] += seconds
+
+    def end_keyword(self):
+        """Records the elapsed time of the current keyword call."""
+        with self._lock:
+            if self._keyword is not None:
+                elapsed = time() - self._started
+                self._keywords[self._keyword]['elapsed'] += elapsed
+                self._total['elapsed'] += elapsed
+            self._keyword = None
+
+    def poll(self):
+        """Records a mailbox check."""
+        self._add('polls', 1)
+
+    def received(self, size):
+        """Records ``size`` bytes received from the IMAP server."""
+        self._add('bytes_in', size)
+
+    def reset(self):
+        """Removes all recorded statistics, except the current keyword call."""
+        with self._lock:
+            self._total = _counters()
+            self._keywords = OrderedDict()
+            if self._keyword is not None:
+                self._keywords[self._keyword] = _counters()
+
+    def sent(self, size):
+        """Records ``size`` bytes sent to the IMAP server."""
+        self._add('bytes_out', size)
+
+    def snapshot(self):
+        """Returns a copy of the statistics, ``total`` and per ``keywords`` name."""
+        with self._lock:
+            return {'keywords': OrderedDict((name, _copy(counters)) for name, counters
+                                            in self._keywords.items()),
+                    'total': _copy(self._total)}
+
+    def start_keyword(self, name):
+        """Records a keyword call, the next statistics are recorded for this keyword."""
+        with self._lock:
+            self._keyword = name
+            self._started = time()
+            counters = self._keywords.setdefault(name, _counters())
+            counters['calls'] += 1
+            self._total['calls'] += 1
+
+    def to_json(self):
+        """Returns the statistics as JSON document."""
+        return dumps(self.snapshot(), indent=2, sort_keys=True)
+
+    def to_prometheus(self):
+        """Returns the statistics per keyword name in Prometheus text exposition format.
+        Without any keyword call, the total statistics have an empty keyword name."""
+        snapshot = self.snapshot()
+        keywords = list(snapshot['keywords'].items()) or [('', snapshot['total'])]
+        lines = []
+        for metric, counter, description in PROMETHEUS_METRICS:
+            lines.extend(['# HELP %s %s' % (metric, description), '# TYPE %s counter' % metric])
+            lines.extend('%s{keyword="%s"} %s' % (metric, _label(name), counters[counter])
+                         for name, counters in keywords)
+        for metric, kind, field, description in PROMETHEUS_COMMAND_METRICS:
+            lines.extend(['# HELP %s %s' % (metric, description), '# TYPE %s %s' % (metric, kind)])
+            for name, counters in keywords:
+                for command, values in sorted(counters['commands'].items()):
+                    lines.append('%s{keyword="%s",command="%s"} %s' % (
+                        metric, _label(name), _label(command), values[field]))
+        return '\n'.join(lines) + '\n'
+
+    def _add(self, counter, value):
+        """Adds given ``value`` to given ``counter``."""
+        with self._lock:
+            for counters in self._targets():
+                counters[counter] += value
+
+    def _targets(self):
+        """Returns the counters to be updated, in total and of the current keyword call."""
+        if self._keyword is None:
+            return (self._total,)
+        return self._total, self._keywords[self._keyword]
+
+
+class StatisticsListener(object):
+    """Robot Framework listener recording the statistics of each library keyword call."""
+
+    ROBOT_LISTENER_API_VERSION = 2
+
+    def __init__(self, statistics, keywords, library='ImapLibrary'):
+        """Instantiate the listener.
+
+        Arguments:
+        - ``statistics``: The ``ImapStatistics`` to record keyword calls into.
+        - ``keywords``: The library keyword method names, e.g. ``open_mailbox``.
+        - ``library``: The library name. (Default ImapLibrary)
+        """
+        self.library = library
+        self.statistics = statistics
+        self.keywords = frozenset(keywords)
+
+    def end_keyword(self, _name, attrs):
+        """Ends the statistics of a library keyword call."""
+        if self._is_library_keyword(attrs):
+            self.statistics.end_keyword()
+
+    def start_keyword(self, _name, attrs):
+        """Starts the statistics of a library keyword call."""
+        if self._is_library_keyword(attrs):
+            self.statistics.start_keyword(attrs['kwname'])
+
+    def _is_library_keyword(self, attrs):
+        """Returns boolean value whether the keyword is a library keyword or not,
+        keywords of the same name from other libraries are not."""
+        return attrs.get('libname') == self.library and \
+            attrs.get('kwname', '').lower().replace(' ', '_') in self.keywords
+
+
+def instrument(imap, statistics):
+    """Records the commands, round-trip times and bytes transferred by given imaplib
+    ``imap`` session into given ``statistics``. A session is only instrumented once,
+    further calls only change the ``statistics`` it records into.
+    Other session objects are returned as is."""
+    if not isinstance(imap, IMAP4):
+        return imap
+    if '_statistics' not in vars(imap):
+        _wrap(imap)
+    imap._statistics = statistics
+    return imap
+
+
+def _copy(counters):
+    """Returns a copy of given ``counters``."""
+    copy = dict(counters)
+    copy['commands'] = dict((name, dict(values)) for name, values
+                            in counters['commands'].items())
+    return copy
+
+
+def _counters():
+    """Returns new empty counters."""
+    counters = dict((name, 0) for name in COUNTERS)
+    counters['commands'] = {}
+    counters['elapsed'] = 0.0
+    return counters
+
+
+def _label(value):
+    """Returns given ``value`` escaped as Prometheus label value."""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _wrap(imap):
+    """Replaces imaplib session methods sending commands and reading responses
+    with methods recording their statistics."""
+    command, command_complete = imap._command, imap._command_complete
+    read, readline, send = imap.read, imap.readline, imap.send
+    started = {}
+
+    def _command(name, *args):
+        started_at = time()
+        tag = command(name, *args)
+        started[tag] = started_at
+        return tag
+
+    def _command_complete(name, tag):
+        try:
+            return command_complete(name, tag)
+        finally:
+            if tag in started:
+                imap._statistics.command(name, time() - started.pop(tag))
+
+    def _read(size):
+        data = read(size)
+        imap._statistics.received(len(data))
+        return data
+
+    def _readline():
+        line = readline()
+        imap._statistics.received(len(line))
+        return line
+
+    def _send(data):
+        imap._statistics.sent(len(data))
+        return send(data)
+
+    imap._command = _command
+    imap._command_complete = _command_complete
+    imap.read = _read
+    imap.readline = _readline
+    imap.send = _send
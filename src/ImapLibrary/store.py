@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright 2015-2016 Richard Huang <rickypc@users.noreply.github.com>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+IMAP Library - a persistent on-disk store of email messages.
+"""
+
+from sqlite3 import Binary, connect
+from threading import Lock
+from time import time
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS messages (host TEXT NOT NULL, user TEXT NOT NULL, '
+    'mailbox TEXT NOT NULL, uidvalidity INTEGER NOT NULL, uid INTEGER NOT NULL, '
+    'size INTEGER NOT NULL, accessed REAL NOT NULL, raw BLOB NOT NULL, '
+    'PRIMARY KEY (host, user, mailbox, uidvalidity, uid))',
+    'CREATE INDEX IF NOT EXISTS messages_accessed ON messages (accessed)')
+WHERE_KEY = 'host = ? AND user = ? AND mailbox = ? AND uidvalidity = ? AND uid = ?'
+
+
+class DiskStore(object):
+    """A SQLite store of raw email messages keyed by message cache keys,
+    ``((host, port, user, mailbox), UIDVALIDITY, UID)``, bounded by the total size
+    of the raw email messages.
+
+    Raw email messages never change for a given UIDVALIDITY and UID, so they can be
+    reused by the next test runs. The least recently used email messages are evicted first.
+    """
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024):
+        """Instantiate the store.
+
+        Arguments:
+        - ``path``: The SQLite database file path.
+        - ``max_bytes``: The maximum total size in bytes of stored email messages.
+                         (Default 256 MiB)
+        """
+        self.hits = 0
+        self.max_bytes = max_bytes
+        self.misses = 0
+        self.path = path
+        self._lock = Lock()
+        # Parallel test runs may share the same database file
+        self._connection = connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._connection:
+            for statement in SCHEMA:
+                self._connection.execute(statement)
+        self.evict()
+
+    def __len__(self):
+        """Returns the number of stored email messages."""
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+
+    def clear(self):
+        """Removes all stored email messages."""
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM messages')
+
+    def close(self):
+        """Closes the SQLite database."""
+        with self._lock:
+            self._connection.close()
+
+    def evict(self):
+        """Removes the least recently used email messages to stay within ``max_bytes``."""
+        with self._lock, self._connection:
+            self._evict()
+
+    def get(self, key):
+        """Returns the raw email message of given ``key``, otherwise None."""
+        with self._lock, self._connection:
+            row = self._connection.execute('SELECT raw FROM messages WHERE ' + WHERE_KEY,
+                                           self._columns(key)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._connection.execute('UPDATE messages SET accessed = ? WHERE ' + WHERE_KEY,
+                                     (time(),) + self._columns(key))
+            self.hits += 1
+            return bytes(row[0])
+
+    def invalidate(self, key):
+        """Removes the stored email message of given ``key``."""
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM messages WHERE ' + WHERE_KEY,
+                                     self._columns(key))
+
+    def put(self, key, raw):
+        """Stores given ``raw`` email message of given ``key``.
+        The least recently used email messages are evicted to stay within ``max_bytes``."""
+        if len(raw) > self.max_bytes:
+            return
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                self._columns(key) + (len(raw), time(), Binary(raw)))
+            self._evict()
+
+    def statistics(self):
+        """Returns the store statistics."""
+        with self._lock:
+            count, size = self._connection.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM messages').fetchone()
+        return {'bytes': size, 'hits': self.hits, 'messages': count, 'misses': self.misses}
+
+    @staticmethod
+    def _columns(key):
+        """Returns the key column values of given message cache ``key``."""
+        (host, _, user, mailbox), uidvalidity, uid = key
+        return host or '', user or '', mailbox, uidvalidity, uid
+
+    def _evict(self):
+        """Removes the least recently used email messages exceeding ``max_bytes``."""
+        excess = self._connection.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM messages').fetchone()[0] - self.max_bytes
+        if excess <= 0:
+            return
+        evicted = []
+        for row in self._connection.execute('SELECT host, user, mailbox, uidvalidity, uid, size '
+                                            'FROM messages ORDER BY accessed'):
+            evicted.append(row[:5])
+            excess -= row[5]
+            if excess <= 0:
+                break
+        self._connection.executemany('DELETE FROM messages WHERE ' + WHERE_KEY, evicted)
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright 2015-2016 Richard Huang <rickypc@users.noreply.github.com>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+IMAP Library - a pool of keep-alive HTTP connections to open email message links.
+"""
+
+from atexit import register
+try:
+    from http.client import HTTPConnection, HTTPException, HTTPSConnection
+    from urllib.parse import urljoin, urlsplit
+except ImportError:
+    from httplib import HTTPConnection, HTTPException, HTTPSConnection
+    from urlparse import urljoin, urlsplit
+from re import IGNORECASE, compile as re_compile
+from threading import Lock
+from time import time
+
+CHARSET = re_compile(r'charset=["\']?([^;"\'\s]+)', IGNORECASE)
+CHUNK_SIZE = 64 * 1024
+CONNECTIONS = {'http': HTTPConnection, 'https': HTTPSConnection}
+REDIRECTS = (301, 302, 303, 307, 308)
+
+
+class LinkResult(object):
+    """The outcome of opening a link URL: the HTTP ``status``, the ``latency`` in seconds,
+    the ``bytes`` read, the decoded ``body``, whether the body was ``truncated``,
+    and the connection ``error`` if any."""
+
+    __slots__ = ('body', 'bytes', 'error', 'latency', 'status', 'truncated', 'url')
+
+    def __init__(self, url):
+        self.body = None
+        self.bytes = 0
+        self.error = None
+        self.latency = None
+        self.status = None
+        self.truncated = False
+        self.url = url
+
+    def to_dict(self):
+        """Returns the link result as a dictionary."""
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+
+class HttpPool(object):
+    """A pool of idle keep-alive HTTP connections keyed by ``(scheme, host, port)``."""
+
+    def __init__(self, max_size=8, idle_timeout=60):
+        """Instantiate the pool.
+
+        Arguments:
+        - ``max_size``: The maximum number of idle connections kept in the pool. (Default 8)
+        - ``idle_timeout``: The maximum value in seconds an idle connection is kept in the pool.
+                            (Default 60)
+        """
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._connections = []
+        self._lock = Lock()
+
+    def __len__(self):
+        """Returns the number of idle connections in the pool."""
+        return len(self._connections)
+
+    def clear(self):
+        """Closes all idle connections in the pool."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        self._close(*[connection for _, connection, _ in connections])
+
+    def open(self, url, timeout=30, max_bytes=None, max_redirects=5):
+        """Returns the ``LinkResult`` of a ``GET`` request of given ``url``, following redirects.
+
+        Arguments:
+        - ``url``: The ``http`` or ``https`` link URL.
+        - ``timeout``: The maximum value in seconds to connect and wait for each read.
+                       (Default 30)
+        - ``max_bytes``: The maximum response body bytes read, the rest is discarded.
+                         (Default None, unlimited)
+        - ``max_redirects``: The maximum number of redirects followed. (Default 5)
+        """
+        result = LinkResult(url)
+        started = time()
+        try:
+            for _ in range(max_redirects + 1):
+                status, content_type, location, body, truncated = self._request(
+                    url, timeout, max_bytes)
+                if status not in REDIRECTS or not location:
+                    break
+                url = urljoin(url, location)
+            result.body = decode_body(body, content_type)
+            result.bytes = len(body)
+            result.status = status
+            result.truncated = truncated
+        except (HTTPException, IOError, OSError, ValueError) as error:
+            result.error = '%s: %s' % (type(error).__name__, error)
+        result.latency = time() - started
+        return result
+
+    def _acquire(self, key, timeout):
+        """Returns an idle connection of given ``key`` with given ``timeout``,
+        otherwise a new connection, and whether it is reused or not."""
+        with self._lock:
+            expired = self._evict_expired()
+            connection = None
+            for pos in range(len(self._connections) - 1, -1, -1):
+                if self._connections[pos][0] == key:
+                    connection = self._connections.pop(pos)[1]
+                    break
+        self._close(*expired)
+        if connection is None:
+            return CONNECTIONS[key[0]](key[1], key[2], timeout=timeout), False
+        connection.timeout = timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+        return connection, True
+
+    def _evict_expired(self):
+        """Removes expired connections from the pool and returns them."""
+        deadline = time() - self.idle_timeout
+        expired = [connection for _, connection, released in self._connections
+                   if released < deadline]
+        self._connections = [item for item in self._connections if item[2] >= deadline]
+        return expired
+
+    def _release(self, key, connection):
+        """Returns given idle ``connection`` of given ``key`` to the pool."""
+        with self._lock:
+            self._connections.append((key, connection, time()))
+            evicted = self._evict_expired()
+            while len(self._connections) > self.max_size:
+                evicted.append(self._connections.pop(0)[1])
+        self._close(*evicted)
+
+    def _request(self, url, timeout, max_bytes):
+        """Returns the status, content type, location, body and truncation flag
+        of a ``GET`` request of given ``url``."""
+        parts = urlsplit(url)
+        if parts.scheme not in CONNECTIONS or not parts.hostname:
+            raise ValueError('Unsupported link URL: %s' % url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = (parts.path or '/') + ('?%s' % parts.query if parts.query else '')
+        for attempt in range(2):
+            connection, reused = self._acquire(key, timeout)
+            try:
+                connection.request('GET', path)
+                response = connection.getresponse()
+            except (HTTPException, IOError, OSError):
+                connection.close()
+                # The server may have closed an idle keep-alive connection, retry once
+                if reused and attempt == 0:
+                    continue
+                raise
+            break
+        try:
+            body, truncated = read_body(response, max_bytes)
+        except (HTTPException, IOError, OSError):
+            connection.close()
+            raise
+        if truncated or response.will_close:
+            connection.close()
+        else:
+            self._release(key, connection)
+        return (response.status, response.getheader('content-type'),
+                response.getheader('location'), body, truncated)
+
+    @staticmethod
+    def _close(*connections):
+        """Closes given connections, ignoring any connection error."""
+        for connection in connections:
+            try:
+                connection.close()
+            except (IOError, OSError):
+                pass
+
+
+def decode_body(body, content_type):
+    """Returns given response ``body`` decoded with the charset of given ``content_type``,
+    UTF-8 by default. Without content type, the body is returned as is."""
+    if not content_type:
+        return body
+    match = CHARSET.search(content_type)
+    try:
+        return body.decode(match.group(1) if match else 'utf-8', 'replace')
+    except LookupError:
+        return body.decode('utf-8', 'replace')
+
+
+def read_body(response, max_bytes=None):
+    """Returns the body of given HTTP ``response`` read in chunks, up to ``max_bytes``,
+    and whether it was truncated or not."""
+    chunks = []
+    size = 0
+    while max_bytes is None or size <= max_bytes:
+        chunk = response.read(CHUNK_SIZE if max_bytes is None else
+                              min(CHUNK_SIZE, max_bytes - size + 1))
+        if not chunk:
+            return b''.join(chunks), False
+        chunks.append(chunk)
+        size += len(chunk)
+    return b''.join(chunks)[:max_bytes], True
+
+
+POOL = HttpPool()
+register(POOL.clear)
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright 2015-2016 Richard Huang <rickypc@users.noreply.github.com>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+IMAP Library - a benchmark suite against a local in-process IMAP server stand-in.
+
+Usage: python test/benchmark/benchmark.py [--sizes 1000,10000,100000] [--latency 0.005]
+       [--message-size 2048] [--repeat 3] [--no-idle] [--output results.json]
+"""
+
+from argparse import ArgumentParser
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from json import dumps
+from logging import WARNING, getLogger
+from os.path import abspath, dirname, join
+from platform import platform, python_version
+from sys import path
+from threading import Timer
+from time import time
+path.insert(0, dirname(abspath(__file__)))
+path.insert(0, join(dirname(dirname(dirname(abspath(__file__)))), 'src'))
+from fakeimap import CAPABILITIES, Server  # noqa: E402
+from ImapLibrary import ImapLibrary, __version__  # noqa: E402
+
+SENDER = 'noreply@domain.com'
+
+
+class Benchmark(object):
+    """The benchmarks of one mailbox size, on a fresh IMAP server stand-in."""
+
+    def __init__(self, size, options):
+        self.options = options
+        self.results = []
+        self.size = size
+        capabilities = CAPABILITIES if options.idle else \
+            tuple(name for name in CAPABILITIES if name != 'IDLE')
+        self.server = Server(capabilities=capabilities, latency=options.latency)
+        folder = self.server.store.folder('INBOX')
+        for number in range(size - 1):
+            folder.append(text_message(number, options.message_size))
+        folder.append(multipart_message(size - 1, options.message_size))
+        self.server.start()
+        self.library = self._open_mailbox()
+
+    def run(self):
+        """Returns the list of benchmark results."""
+        try:
+            self._measure('open_mailbox', self._reopen_mailbox)
+            self._measure('wait_for_email_all', lambda: self.library.wait_for_email(
+                sender=SENDER, status='ALL', timeout=60))
+            self._measure('get_latest_email', lambda: self.library.get_latest_email(
+                sender=SENDER, status='ALL'))
+            self._measure('count_emails', lambda: self.library.count_emails(
+                sender=SENDER, status='ALL'))
+            self._measure('mark_all_emails_as_read', self._mark_all_emails_as_read)
+            latest = str(self.size)
+            self._measure('get_email_body_cold', lambda: self._cold(
+                self.library.get_email_body, latest))
+            self._measure('get_email_body_warm', lambda: self.library.get_email_body(latest))
+            self._measure('get_links_from_email', lambda: self._cold(
+                self.library.get_links_from_email, latest))
+            self._measure('walk_multipart_email', lambda: self._walk_multipart_email(latest))
+            self._measure_detection('poll')
+            if self.options.idle:
+                self._measure_detection('idle')
+            self.library.wait_for_email(sender=SENDER, status='ALL', timeout=60)
+            self._measure('delete_all_emails', self.library.delete_all_emails, repeat=1)
+            self.library.close_mailbox()
+        finally:
+            self.server.stop()
+        return self.results
+
+    def _cold(self, keyword, email_index):
+        """Calls given ``keyword`` without any cached email message."""
+        self.library.clear_mail_cache()
+        self.library._init_multipart_walk()  # pylint: disable=protected-access
+        return keyword(email_index)
+
+    def _mark_all_emails_as_read(self):
+        """Marks all email messages as read, after marking them as unread on the server."""
+        for message in self.server.store.folder('INBOX').messages:
+            message.flags.discard('\\Seen')
+        self.library.mark_all_emails_as_read()
+
+    def _measure(self, name, function, repeat=None):
+        """Records the elapsed seconds and IMAP statistics of given ``function`` calls."""
+        runs = []
+        self.library.get_imap_statistics(reset=True)
+        for _ in range(repeat or self.options.repeat):
+            start_time = time()
+            function()
+            runs.append(time() - start_time)
+        self._record(name, runs)
+
+    def _measure_detection(self, mode):
+        """Records the seconds to detect a new email message with given ``mode``,
+        ``poll`` or ``idle``."""
+        runs = []
+        self.library.get_imap_statistics(reset=True)
+        for number in range(self.options.repeat):
+            subject = 'Arrival %s %d' % (mode, number)
+            arrival = []
+
+            def deliver(subject=subject, arrival=arrival):
+                arrival.append(time())
+                self.server.store.append(text_message(0, self.options.message_size, subject))
+            timer = Timer(self.options.arrival, deliver)
+            timer.start()
+            self.library.wait_for_email(subject=subject, idle=mode == 'idle', timeout=60,
+                                        poll_frequency=self.options.poll_frequency)
+            runs.append(time() - arrival[0])
+            timer.join()
+        self._record('wait_for_email_%s' % mode, runs)
+
+    def _open_mailbox(self, library=None):
+        """Returns given ``library``, or a new library, with an opened mailbox."""
+        library = library or ImapLibrary()
+        library.open_mailbox(host='127.0.0.1', port=self.server.port, user='user',
+                             password='secret', is_secure=False,
+                             pipelining=self.options.pipelining)
+        return library
+
+    def _reopen_mailbox(self):
+        """Closes the mailbox and opens it again."""
+        self.library.close_mailbox()
+        self._open_mailbox(self.library)
+
+    def _record(self, name, runs):
+        """Records the result of given benchmark ``name`` runs."""
+        total = self.library.get_imap_statistics()['total']
+        runs = sorted(runs)
+        self.results.append({
+            'bytes_in': total['bytes_in'], 'bytes_out': total['bytes_out'],
+            'commands': sum(command['count'] for command in total['commands'].values()),
+            'max': runs[-1], 'median': runs[len(runs) // 2], 'messages': self.size,
+            'min': runs[0], 'name': name, 'runs': len(runs)})
+
+    def _walk_multipart_email(self, email_index):
+        """Walks all parts of the multipart email message, reading their payloads."""
+        self.library.clear_mail_cache()
+        parts = self.library.walk_multipart_email(email_index)
+        for _ in range(parts):
+            self.library.walk_multipart_email(email_index)
+            self.library.get_multipart_payload(decode=True)
+
+
+def multipart_message(number, size):
+    """Returns a raw multipart email message with text, HTML and attachment parts."""
+    message = MIMEMultipart()
+    message['From'] = SENDER
+    message['To'] = 'me@domain.com'
+    message['Subject'] = 'Multipart %d' % number
+    message.attach(MIMEText('Plain text http://example.com/plain/%d' % number, 'plain'))
+    message.attach(MIMEText(''.join('<p><a href="http://example.com/%d/%d">Link %d</a></p>' % (
+        number, link, link) for link in range(20)), 'html', 'utf-8'))
+    attachment = MIMEApplication(b'x' * size, 'pdf')
+    attachment.add_header('Content-Disposition', 'attachment', filename='document.pdf')
+    message.attach(attachment)
+    return message.as_string().replace('\n', '\r\n').encode('utf-8')
+
+
+def text_message(number, size, subject=None):
+    """Returns a raw text email message of about given ``size`` bytes."""
+    header = ('From: %s\r\nTo: me@domain.com\r\nSubject: %s\r\n'
+              'Date: Mon, 01 Jan 2024 10:00:00 +0000\r\nMessage-ID: <%d@domain.com>\r\n\r\n'
+              'Hello <a href="http://example.com/%d">confirm</a>\r\n' % (
+                  SENDER, subject or 'Message %d' % number, number, number))
+    return (header + 'x' * max(0, size - len(header) - 2) + '\r\n').encode('ascii')
+
+
+def main():
+    """Runs the benchmarks and writes their JSON results."""
+    parser = ArgumentParser(description='ImapLibrary benchmarks.')
+    parser.add_argument('--arrival', type=float, default=0.2,
+                        help='seconds before a new email message arrives (default 0.2)')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='IMAP server response delay in seconds (default 0)')
+    parser.add_argument('--message-size', type=int, default=2048,
+                        help='email message size in bytes (default 2048)')
+    parser.add_argument('--no-idle', dest='idle', action='store_false',
+                        help='do not advertise IDLE capability')
+    parser.add_argument('--output', help='JSON results file path (default stdout)')
+    parser.add_argument('--pipelining', action='store_true', help='pipeline IMAP commands')
+    parser.add_argument('--poll-frequency', type=float, default=0.5,
+                        help='mailbox check delay in seconds (default 0.5)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs of each benchmark (default 3)')
+    parser.add_argument('--sizes', default='1000,10000',
+                        help='comma separated mailbox sizes (default 1000,10000)')
+    options = parser.parse_args()
+    # Keyword messages are only meant for the Robot Framework log
+    getLogger().setLevel(WARNING)
+    results = []
+    for size in [int(size) for size in options.sizes.split(',')]:
+        results += Benchmark(size, options).run()
+    document = dumps({'environment': {'platform': platform(), 'python': python_version(),
+                                      'version': __version__},
+                      'parameters': dict(vars(options)), 'results': results},
+                     indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, 'w') as writer:
+            writer.write(document + '\n')
+    else:
+        print(document)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,800 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright 2015-2016 Richard Huang <rickypc@users.noreply.github.com>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+IMAP Library - a local in-process IMAP4rev1 server stand-in.
+"""
+
+from calendar import timegm
+try:
+    from email import message_from_bytes
+except ImportError:
+    from email import message_from_string as message_from_bytes
+from email.utils import getaddresses, mktime_tz, parsedate_tz
+from re import compile as re_compile
+from select import select
+from threading import Condition, Thread
+from time import gmtime, sleep, strftime, time
+try:
+    from socketserver import StreamRequestHandler, ThreadingTCPServer
+except ImportError:
+    from SocketServer import StreamRequestHandler, ThreadingTCPServer
+
+CAPABILITIES = ('IMAP4rev1', 'CONDSTORE', 'ENABLE', 'ESEARCH', 'ESORT', 'IDLE', 'LITERAL+',
+                'MOVE', 'QRESYNC', 'SORT', 'UIDPLUS')
+FLAG_KEYS = ('ANSWERED', 'DELETED', 'DRAFT', 'FLAGGED', 'SEEN')
+LITERAL = re_compile(br'\{(\d+)(\+?)\}\r\n$')
+MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+SECTION = re_compile(r'^(BODY|BODY\.PEEK|BINARY|BINARY\.PEEK)\[([^\]]*)\](?:<(\d+)(?:\.(\d+))?>)?$')
+UID_COMMANDS = ('COPY', 'EXPUNGE', 'FETCH', 'MOVE', 'SEARCH', 'SORT', 'STORE')
+
+
+class Folder(object):
+    """A folder of the fake mailbox."""
+
+    def __init__(self, name, uidvalidity=1):
+        self.highestmodseq = 1
+        self.messages = []
+        self.name = name
+        self.uidnext = 1
+        self.uidvalidity = uidvalidity
+        self.vanished = []
+
+    def append(self, raw, flags=()):
+        """Appends given ``raw`` email message and returns its UID."""
+        self.highestmodseq += 1
+        message = Message(self.uidnext, raw, flags, self.highestmodseq)
+        self.messages.append(message)
+        self.uidnext += 1
+        return message.uid
+
+
+class Handler(StreamRequestHandler):
+    """Serves one IMAP client connection, commands are handled by ``cmd_<name>`` methods."""
+
+    # Responses are flushed once per command, without waiting for delayed ACKs
+    disable_nagle_algorithm = True
+    wbufsize = 64 * 1024
+
+    def setup(self):
+        StreamRequestHandler.setup(self)
+        self.condstore = False
+        self.config = self.server.config
+        self.exists = 0
+        self.folder = None
+        self.qresync = False
+        self.store = self.server.store
+
+    def handle(self):
+        self._write('* OK [CAPABILITY %s] fake IMAP server ready' % ' '.join(self._capabilities()))
+        self.wfile.flush()
+        while True:
+            data = self._read_command()
+            if data is None:
+                return
+            tag, _, rest = data.partition(b' ')
+            tag = tag.decode('ascii')
+            command, _, args = rest.partition(b' ')
+            command = command.decode('ascii').upper()
+            if self.config.get('latency'):
+                sleep(self.config['latency'])
+            try:
+                with self.store.changed:
+                    result = self._dispatch(tag, command, args)
+            except Exception as exc:  # pylint: disable=broad-except
+                self._write('%s BAD %s' % (tag, exc))
+                result = None
+            self.wfile.flush()
+            if result == 'LOGOUT':
+                return
+
+    def cmd_capability(self, tag, tokens):
+        """Writes the capabilities."""
+        self._write('* CAPABILITY %s' % ' '.join(self._capabilities()))
+
+    def cmd_check(self, tag, tokens):
+        """Writes the selected folder changes."""
+        self._report_changes()
+
+    def cmd_close(self, tag, tokens):
+        """Silently expunges the deleted email messages and closes the selected folder."""
+        if self.folder is not None:
+            self._expunge(self.folder.messages, silent=True)
+        self.folder = None
+
+    def cmd_copy(self, tag, tokens, uid):
+        """Copies the email messages into the target folder."""
+        target = self.store.folder(tokens[1])
+        for _, message in self._selected(tokens[0], uid):
+            target.append(message.raw, message.flags)
+
+    def cmd_enable(self, tag, tokens):
+        """Enables the supported CONDSTORE and QRESYNC extensions."""
+        enabled = [token for token in tokens if token.upper() in self._capabilities()]
+        for token in enabled:
+            self.condstore = self.condstore or token.upper() in ('CONDSTORE', 'QRESYNC')
+            self.qresync = self.qresync or token.upper() == 'QRESYNC'
+        self._write('* ENABLED %s' % ' '.join(enabled))
+
+    def cmd_examine(self, tag, tokens):
+        """Selects a folder."""
+        return self.cmd_select(tag, tokens)
+
+    def cmd_expunge(self, tag, tokens, uid):
+        """Removes the deleted email messages, only the given UIDs with UID EXPUNGE."""
+        messages = self.folder.messages
+        if uid:
+            uids = _sequence(tokens[0], messages[-1].uid if messages else 0)
+            messages = [message for message in messages if message.uid in uids]
+        self._expunge(messages)
+
+    def cmd_fetch(self, tag, tokens, uid):
+        """Writes the requested items of the email messages, supporting CHANGEDSINCE
+        and VANISHED modifiers."""
+        spec, items = tokens[0], tokens[1]
+        items = items if isinstance(items, list) else [items]
+        changedsince = vanished = None
+        modifiers = tokens[2] if len(tokens) > 2 else []
+        for pos, modifier in enumerate(modifiers):
+            if modifier.upper() == 'CHANGEDSINCE':
+                changedsince = int(modifiers[pos + 1])
+            elif modifier.upper() == 'VANISHED':
+                vanished = True
+        if uid and 'UID' not in [item.upper() for item in items]:
+            items = ['UID'] + items
+        if vanished and changedsince is not None:
+            largest = self.folder.messages[-1].uid if self.folder.messages else 0
+            uids = _sequence(spec, max(largest, self.folder.uidnext))
+            gone = [vanished_uid for vanished_uid, modseq in self.folder.vanished
+                    if modseq > changedsince and vanished_uid in uids]
+            if gone:
+                self._write('* VANISHED (EARLIER) %s' % _compress(gone))
+        for number, message in self._selected(spec, uid):
+            if changedsince is None or message.modseq > changedsince:
+                self._write_fetch(number, message, items, changedsince is not None)
+
+    def cmd_idle(self, tag):
+        """Writes the selected folder changes until the client sends DONE."""
+        if 'IDLE' not in self._capabilities():
+            self._write('%s BAD IDLE not supported' % tag)
+            return None
+        self._write('+ idling')
+        self.wfile.flush()
+        while True:
+            self._report_changes()
+            self.wfile.flush()
+            if select([self.request], [], [], 0)[0]:
+                self.rfile.readline()
+                break
+            self.store.changed.wait(0.05)
+        self._write('%s OK IDLE terminated' % tag)
+        return 'DONE'
+
+    def cmd_login(self, tag, tokens):
+        """Accepts any user and password."""
+
+    def cmd_logout(self, tag, tokens):
+        """Ends the connection."""
+        self._write('* BYE logging out')
+        self._write('%s OK LOGOUT completed' % tag)
+        return 'LOGOUT'
+
+    def cmd_move(self, tag, tokens, uid):
+        """Moves the email messages into the target folder."""
+        chosen = self._selected(tokens[0], uid)
+        self.cmd_copy(tag, tokens, uid)
+        self._expunge([message for _, message in chosen], force=True)
+
+    def cmd_noop(self, tag, tokens):
+        """Writes the selected folder changes."""
+        self._report_changes()
+
+    def cmd_search(self, tag, tokens, uid):
+        """Writes the matching email messages, with ESEARCH when RETURN is given."""
+        options = None
+        if tokens and not isinstance(tokens[0], list) and tokens[0].upper() == 'RETURN':
+            options = [option.upper() for option in tokens[1]] or ['ALL']
+            tokens = tokens[2:]
+        if tokens and not isinstance(tokens[0], list) and tokens[0].upper() == 'CHARSET':
+            tokens = tokens[2:]
+        values = [message.uid if uid else number for number, message in self._matches(tokens)]
+        if options is not None:
+            self._write_esearch(tag, values, options, uid)
+        else:
+            self._write('* SEARCH %s' % ' '.join(str(value) for value in values))
+
+    def cmd_select(self, tag, tokens):
+        """Selects a folder, supporting CONDSTORE and QRESYNC parameters."""
+        self.folder = self.store.folder(tokens[0] if tokens else 'INBOX')
+        params = tokens[1] if len(tokens) > 1 else []
+        if params and params[0].upper() in ('CONDSTORE', 'QRESYNC'):
+            self.condstore = True
+        if params and params[0].upper() == 'QRESYNC' and len(params[1]) > 2 and \
+                int(params[1][0]) == self.folder.uidvalidity:
+            vanished = [uid for uid, modseq in self.folder.vanished if modseq > int(params[1][1])]
+            if vanished:
+                self._write('* VANISHED (EARLIER) %s' % _compress(vanished))
+        folder = self.folder
+        self.exists = len(folder.messages)
+        self._write('* FLAGS (\\Answered \\Flagged \\Deleted \\Seen \\Draft)')
+        self._write('* %d EXISTS' % self.exists)
+        self._write('* 0 RECENT')
+        self._write('* OK [UIDVALIDITY %d] UIDs valid' % folder.uidvalidity)
+        self._write('* OK [UIDNEXT %d] Predicted next UID' % folder.uidnext)
+        if self.condstore or 'CONDSTORE' in self._capabilities():
+            self._write('* OK [HIGHESTMODSEQ %d] Highest' % folder.highestmodseq)
+        self._write('%s OK [READ-WRITE] SELECT completed' % tag)
+        return 'DONE'
+
+    def cmd_sort(self, tag, tokens, uid):
+        """Writes the matching email messages sorted by arrival, with ESORT when
+        RETURN is given."""
+        options = None
+        if tokens and not isinstance(tokens[0], list) and tokens[0].upper() == 'RETURN':
+            options = [option.upper() for option in tokens[1]]
+            tokens = tokens[2:]
+        program = [key.upper() for key in tokens[0]]
+        messages = self._matches(tokens[2:])
+        if 'ARRIVAL' in program:
+            messages.sort(key=lambda pair: pair[1].internaldate)
+        if 'REVERSE' in program:
+            messages.reverse()
+        values = [message.uid if uid else number for number, message in messages]
+        if options is not None:
+            self._write_esearch(tag, values, options, uid)
+        else:
+            self._write('* SORT %s' % ' '.join(str(value) for value in values))
+
+    def cmd_status(self, tag, tokens):
+        """Writes the requested folder status items."""
+        folder = self.store.folder(tokens[0])
+        values = {'HIGHESTMODSEQ': folder.highestmodseq, 'MESSAGES': len(folder.messages),
+                  'RECENT': 0, 'UIDNEXT': folder.uidnext, 'UIDVALIDITY': folder.uidvalidity,
+                  'UNSEEN': len([message for message in folder.messages
+                                 if '\\Seen' not in message.flags])}
+        items = ' '.join('%s %d' % (item.upper(), values[item.upper()]) for item in tokens[1])
+        self._write('* STATUS %s (%s)' % (_quote(folder.name), items))
+
+    def cmd_store(self, tag, tokens, uid):
+        """Changes the flags of the email messages, supporting UNCHANGEDSINCE modifier."""
+        spec, action, flags = tokens[0], tokens[1], tokens[2]
+        unchangedsince = None
+        if isinstance(action, list):
+            unchangedsince = int(action[1])
+            action, flags = flags, tokens[3]
+        flags = set(_flag(flag) for flag in (flags if isinstance(flags, list) else [flags]))
+        for number, message in self._selected(spec, uid):
+            if unchangedsince is not None and message.modseq > unchangedsince:
+                continue
+            if action.startswith('+'):
+                message.flags |= flags
+            elif action.startswith('-'):
+                message.flags -= flags
+            else:
+                message.flags = set(flags)
+            self.folder.highestmodseq += 1
+            message.modseq = self.folder.highestmodseq
+            if 'SILENT' not in action.upper():
+                self._write_fetch(number, message, ['UID', 'FLAGS'] if uid else ['FLAGS'],
+                                  self.condstore)
+
+    def cmd_unselect(self, tag, tokens):
+        """Closes the selected folder."""
+        self.folder = None
+
+    def _capabilities(self):
+        """Returns the advertised capabilities."""
+        return self.config.get('capabilities', CAPABILITIES)
+
+    def _dispatch(self, tag, command, args):
+        """Executes given ``command`` and writes its responses."""
+        uid = command == 'UID'
+        if uid:
+            command, _, args = args.partition(b' ')
+            command = command.decode('ascii').upper()
+        handler = getattr(self, 'cmd_%s' % command.lower(), None)
+        if handler is None:
+            self._write('%s BAD unknown command %s' % (tag, command))
+            return None
+        if command == 'IDLE':
+            return handler(tag)
+        tokens = Parser(args).parse()
+        result = handler(tag, tokens, uid) if command in UID_COMMANDS else handler(tag, tokens)
+        if result not in ('DONE', 'LOGOUT'):
+            self._write('%s OK %s%s completed' % (tag, 'UID ' if uid else '', command))
+        return result
+
+    def _expunge(self, messages, force=False, silent=False):
+        """Removes given deleted ``messages`` from the selected folder."""
+        folder = self.folder
+        for message in list(messages):
+            if force or '\\Deleted' in message.flags:
+                number = folder.messages.index(message) + 1
+                folder.messages.remove(message)
+                folder.highestmodseq += 1
+                folder.vanished.append((message.uid, folder.highestmodseq))
+                if silent:
+                    continue
+                if self.qresync:
+                    self._write('* VANISHED %d' % message.uid)
+                else:
+                    self._write('* %d EXPUNGE' % number)
+        self.exists = len(folder.messages)
+
+    def _match(self, tokens, number, message, total):
+        """Returns boolean value whether given ``message`` matches all search ``tokens``."""
+        while tokens:
+            if not self._match_key(tokens, number, message, total):
+                return False
+        return True
+
+    def _match_key(self, tokens, number, message, total):
+        """Consumes one search key from ``tokens`` and returns boolean value whether
+        given ``message`` matches it or not."""
+        # pylint: disable=too-many-branches,too-many-return-statements
+        key = tokens.pop(0)
+        if isinstance(key, list):
+            return self._match(list(key), number, message, total)
+        upper = key.upper()
+        if upper in ('ALL', 'OLD'):
+            return True
+        if upper in ('NEW', 'RECENT'):
+            return False
+        if upper in FLAG_KEYS:
+            return '\\%s' % upper.capitalize() in message.flags
+        if upper[2:] in FLAG_KEYS and upper.startswith('UN'):
+            return '\\%s' % upper[2:].capitalize() not in message.flags
+        if upper in ('BCC', 'CC', 'FROM', 'SUBJECT', 'TO'):
+            return tokens.pop(0).lower() in (message.msg[upper.capitalize()] or '').lower()
+        if upper in ('BODY', 'TEXT', 'X-GM-RAW'):
+            source = message.raw if upper != 'BODY' else _section_data(message, 'TEXT')
+            return tokens.pop(0).lower().encode('utf-8') in source.lower()
+        if upper == 'HEADER':
+            name, value = tokens.pop(0), tokens.pop(0).lower()
+            return message.msg[name] is not None and value in message.msg[name].lower()
+        if upper in ('KEYWORD', 'UNKEYWORD'):
+            return (tokens.pop(0) in message.flags) == (upper == 'KEYWORD')
+        if upper in ('LARGER', 'SMALLER'):
+            size = int(tokens.pop(0))
+            return len(message.raw) > size if upper == 'LARGER' else len(message.raw) < size
+        if upper in ('BEFORE', 'ON', 'SINCE'):
+            return _match_date(upper, _imap_date(tokens.pop(0)), message.internaldate)
+        if upper in ('SENTBEFORE', 'SENTON', 'SENTSINCE'):
+            parsed = parsedate_tz(message.msg['Date'] or '')
+            sent = mktime_tz(parsed) if parsed else 0
+            return _match_date(upper[4:], _imap_date(tokens.pop(0)), sent)
+        if upper == 'MODSEQ':
+            return message.modseq >= int(tokens.pop(0))
+        if upper == 'UID':
+            largest = self.folder.messages[-1].uid if self.folder.messages else 0
+            return message.uid in _sequence(tokens.pop(0), largest)
+        if upper == 'NOT':
+            return not self._match_key(tokens, number, message, total)
+        if upper == 'OR':
+            left = self._match_key(tokens, number, message, total)
+            right = self._match_key(tokens, number, message, total)
+            return left or right
+        if upper[0].isdigit() or upper[0] == '*':
+            return number in _sequence(upper, total)
+        raise ValueError('unsupported search key %s' % key)
+
+    def _matches(self, tokens):
+        """Returns the list of ``(email index, message)`` matching given search ``tokens``."""
+        messages = self.folder.messages
+        return [(number, message) for number, message in enumerate(messages, 1)
+                if self._match(list(tokens), number, message, len(messages))]
+
+    def _read_command(self):
+        """Returns the full command line, including its literals, otherwise None."""
+        line = self.rfile.readline()
+        if not line:
+            return None
+        data = line
+        match = LITERAL.search(data)
+        while match:
+            if not match.group(2):
+                self._write('+ go ahead')
+                self.wfile.flush()
+            data += self.rfile.read(int(match.group(1)))
+            line = self.rfile.readline()
+            data += line
+            match = LITERAL.search(line)
+        return data.rstrip(b'\r\n')
+
+    def _report_changes(self):
+        """Writes untagged EXISTS response when the selected folder changed."""
+        if self.folder is not None and len(self.folder.messages) != self.exists:
+            self.exists = len(self.folder.messages)
+            self._write('* %d EXISTS' % self.exists)
+            self._write('* 0 RECENT')
+
+    def _selected(self, spec, uid):
+        """Returns the list of ``(email index, message)`` of given sequence set ``spec``."""
+        messages = self.folder.messages
+        if uid:
+            uids = _sequence(spec, messages[-1].uid if messages else 0)
+            return [(number, message) for number, message in enumerate(messages, 1)
+                    if message.uid in uids]
+        return [(number, messages[number - 1]) for number
+                in sorted(_sequence(spec, len(messages))) if 0 < number <= len(messages)]
+
+    def _write(self, line):
+        """Writes given response ``line``."""
+        if not isinstance(line, bytes):
+            line = line.encode('utf-8')
+        self.wfile.write(line + b'\r\n')
+
+    def _write_esearch(self, tag, values, options, uid):
+        """Writes ESEARCH response of given ``values``, MIN and MAX are the first and
+        last values in their search or sort order."""
+        items = []
+        if values and 'MIN' in options:
+            items.append('MIN %d' % values[0])
+        if values and 'MAX' in options:
+            items.append('MAX %d' % values[-1])
+        if 'COUNT' in options:
+            items.append('COUNT %d' % len(values))
+        if values and 'ALL' in options:
+            items.append('ALL %s' % _compress(values))
+        self._write('* ESEARCH (TAG "%s")%s%s' % (tag, ' UID' if uid else '',
+                                                  ''.join(' ' + item for item in items)))
+
+    def _write_fetch(self, number, message, items, modseq=False):
+        """Writes one untagged FETCH response of given ``items``."""
+        # pylint: disable=too-many-branches
+        out = []
+        literals = []
+        names = [item.upper() for item in items]
+        if modseq and 'MODSEQ' not in names:
+            names.append('MODSEQ')
+        for pos, name in enumerate(names):
+            if name == 'UID':
+                out.append('UID %d' % message.uid)
+            elif name == 'FLAGS':
+                out.append('FLAGS (%s)' % ' '.join(sorted(message.flags)))
+            elif name == 'MODSEQ':
+                out.append('MODSEQ (%d)' % message.modseq)
+            elif name == 'INTERNALDATE':
+                out.append('INTERNALDATE "%s"' % strftime('%d-%b-%Y %H:%M:%S +0000',
+                                                        gmtime(message.internaldate)))
+            elif name == 'RFC822.SIZE':
+                out.append('RFC822.SIZE %d' % len(message.raw))
+            elif name in ('RFC822', 'RFC822.HEADER', 'RFC822.TEXT'):
+                section = {'RFC822': '', 'RFC822.HEADER': 'HEADER', 'RFC822.TEXT': 'TEXT'}[name]
+                literals.append((name, _section_data(message, section)))
+                if name != 'RFC822.HEADER':
+                    message.flags.add('\\Seen')
+            elif name == 'ENVELOPE':
+                out.append('ENVELOPE %s' % _envelope(message.msg))
+            elif name in ('BODY', 'BODYSTRUCTURE'):
+                out.append('%s %s' % (name, _body_structure(message.msg)))
+            else:
+                match = SECTION.match(items[pos] if pos < len(items) else name)
+                if not match:
+                    raise ValueError('unsupported fetch item %s' % name)
+                kind, section, start, length = match.groups()
+                data = _section_data(message, section, kind.upper().startswith('BINARY'))
+                label = '%s[%s]' % (kind.split('.')[0].upper(), section)
+                if start is not None:
+                    data = data[int(start):int(start) + int(length)] if length else \
+                        data[int(start):]
+                    label += '<%s>' % start
+                if not kind.upper().endswith('PEEK'):
+                    message.flags.add('\\Seen')
+                literals.append((label, data))
+        line = ('* %d FETCH (%s' % (number, ' '.join(out))).encode('utf-8')
+        for pos, (label, data) in enumerate(literals):
+            line += (b' ' if out or pos else b'') + \
+                ('%s {%d}' % (label, len(data))).encode('utf-8') + b'\r\n' + data
+        self._write(line + b')')
+
+
+class Message(object):
+    """An email message of the fake mailbox."""
+
+    __slots__ = ('flags', 'internaldate', 'modseq', 'raw', 'uid', '_msg')
+
+    def __init__(self, uid, raw, flags=(), modseq=1):
+        self.flags = set(flags)
+        self.internaldate = time()
+        self.modseq = modseq
+        self.raw = raw
+        self.uid = uid
+        self._msg = None
+
+    @property
+    def msg(self):
+        """Returns the parsed email message."""
+        if self._msg is None:
+            self._msg = message_from_bytes(self.raw)
+        return self._msg
+
+
+class Parser(object):
+    """A tokenizer of IMAP command arguments."""
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def next(self):
+        """Returns the next token, a list of tokens for parenthesized list, otherwise None."""
+        data = self.data
+        while data[self.pos:self.pos + 1] == b' ':
+            self.pos += 1
+        char = data[self.pos:self.pos + 1]
+        if char in (b'', b')'):
+            return None
+        if char == b'(':
+            self.pos += 1
+            items = []
+            token = self.next()
+            while token is not None:
+                items.append(token)
+                token = self.next()
+            self.pos += 1
+            return items
+        if char == b'"':
+            value = b''
+            end = self.pos + 1
+            while data[end:end + 1] != b'"':
+                if data[end:end + 1] == b'\\':
+                    end += 1
+                value += data[end:end + 1]
+                end += 1
+            self.pos = end + 1
+            return value.decode('utf-8')
+        if char == b'{':
+            end = data.index(b'}', self.pos)
+            start = end + 3
+            self.pos = start + int(data[self.pos + 1:end].rstrip(b'+'))
+            return data[start:self.pos].decode('utf-8')
+        return self._atom()
+
+    def parse(self):
+        """Returns the list of parsed tokens."""
+        tokens = []
+        token = self.next()
+        while token is not None:
+            tokens.append(token)
+            token = self.next()
+        return tokens
+
+    def _atom(self):
+        """Returns the next atom, including its brackets and partial range,
+        e.g. ``BODY.PEEK[HEADER.FIELDS (FROM)]<0.100>``."""
+        data = self.data
+        end = self.pos
+        depth = 0
+        while end < len(data):
+            char = data[end:end + 1]
+            if char == b'[':
+                depth += 1
+            elif char == b']':
+                depth -= 1
+            elif depth == 0 and char in (b' ', b'(', b')'):
+                break
+            end += 1
+        if data[end:end + 1] == b'<':
+            end = data.index(b'>', end) + 1
+        token = data[self.pos:end].decode('utf-8')
+        self.pos = end
+        return token
+
+
+class Server(ThreadingTCPServer):
+    """A local in-process IMAP server stand-in, listening on a random port.
+
+    Configuration:
+    - ``capabilities``: The advertised capabilities, e.g. without ``IDLE``.
+                        (Default all supported capabilities)
+    - ``latency``: The delay in seconds before each command response. (Default 0)
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, store=None, **config):
+        ThreadingTCPServer.__init__(self, ('127.0.0.1', 0), Handler)
+        self.config = config
+        self.store = store or Store()
+
+    @property
+    def port(self):
+        """Returns the listening port number."""
+        return self.server_address[1]
+
+    def start(self):
+        """Starts serving on a background thread and returns the server."""
+        thread = Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        """Stops serving."""
+        self.shutdown()
+        self.server_close()
+
+
+class Store(object):
+    """All folders of the fake mailbox, shared by all connections."""
+
+    def __init__(self):
+        self.changed = Condition()
+        self.folders = {'INBOX': Folder('INBOX')}
+
+    def append(self, raw, folder='INBOX', flags=()):
+        """Appends given ``raw`` email message into given ``folder``, notifies idling
+        connections and returns its UID."""
+        with self.changed:
+            uid = self.folder(folder).append(raw, flags)
+            self.changed.notify_all()
+        return uid
+
+    def folder(self, name):
+        """Returns the folder of given ``name``, it is created when missing."""
+        name = 'INBOX' if name.upper() == 'INBOX' else name
+        if name not in self.folders:
+            self.folders[name] = Folder(name)
+        return self.folders[name]
+
+
+def _addresses(value):
+    """Returns IMAP ENVELOPE address list of given header ``value``."""
+    if not value:
+        return 'NIL'
+    items = []
+    for name, address in getaddresses([value]):
+        mailbox, _, host = address.partition('@')
+        items.append('(%s NIL %s %s)' % (_quote(name or None), _quote(mailbox), _quote(host)))
+    return '(%s)' % ''.join(items)
+
+
+def _body_structure(msg):
+    """Returns IMAP BODYSTRUCTURE of given email ``msg``."""
+    if msg.is_multipart():
+        parts = ''.join(_body_structure(part) for part in msg.get_payload())
+        return '(%s %s)' % (parts, _quote(msg.get_content_subtype()))
+    maintype = msg.get_content_maintype()
+    params = (msg.get_params() or [])[1:]
+    payload = msg.get_payload()
+    if not isinstance(payload, bytes):
+        payload = payload.encode('utf-8')
+    fields = [_quote(maintype), _quote(msg.get_content_subtype()), _parameters(params),
+              _quote(msg['Content-ID']), _quote(msg['Content-Description']),
+              _quote(msg['Content-Transfer-Encoding'] or '7BIT'), str(len(payload))]
+    if maintype == 'text':
+        fields.append(str(payload.count(b'\n')))
+    disposition = 'NIL'
+    if msg.get('Content-Disposition'):
+        value = msg.get_params(header='Content-Disposition')
+        disposition = '(%s %s)' % (_quote(value[0][0]), _parameters(value[1:]))
+    fields += ['NIL', disposition, 'NIL', 'NIL']
+    return '(%s)' % ' '.join(fields)
+
+
+def _compress(numbers):
+    """Returns the sequence set of given ``numbers``."""
+    ranges = []
+    for number in sorted(numbers):
+        if ranges and ranges[-1][1] + 1 == number:
+            ranges[-1][1] = number
+        else:
+            ranges.append([number, number])
+    return ','.join(str(start) if start == end else '%d:%d' % (start, end)
+                    for start, end in ranges)
+
+
+def _envelope(msg):
+    """Returns IMAP ENVELOPE of given email ``msg``."""
+    sender = msg['From']
+    return '(%s)' % ' '.join([
+        _quote(msg['Date']), _quote(msg['Subject']), _addresses(sender),
+        _addresses(msg['Sender'] or sender), _addresses(msg['Reply-To'] or sender),
+        _addresses(msg['To']), _addresses(msg['Cc']), _addresses(msg['Bcc']),
+        _quote(msg['In-Reply-To']), _quote(msg['Message-ID'])])
+
+
+def _flag(flag):
+    """Returns given system ``flag`` capitalized, e.g. ``\\Seen``, otherwise as is."""
+    return '\\' + flag[1:].capitalize() if flag.startswith('\\') else flag
+
+
+def _imap_date(value):
+    """Returns the epoch time of given IMAP date ``value``, e.g. ``01-Jan-2024``."""
+    day, month, year = value.split('-')
+    return timegm((int(year), MONTHS.index(month.capitalize()) + 1, int(day), 0, 0, 0))
+
+
+def _match_date(key, value, stamp):
+    """Returns boolean value whether the day of given epoch time ``stamp`` matches
+    given date ``key`` and ``value`` or not."""
+    day = stamp - stamp % 86400
+    if key == 'SINCE':
+        return day >= value
+    if key == 'BEFORE':
+        return day < value
+    return day == value
+
+
+def _parameters(params):
+    """Returns IMAP body parameter list of given ``(name, value)`` pairs."""
+    if not params:
+        return 'NIL'
+    return '(%s)' % ' '.join('%s %s' % (_quote(key), _quote(value)) for key, value in params)
+
+
+def _part(msg, path):
+    """Returns the email message part on given dotted ``path``, e.g. ``1.2``."""
+    for number in path.split('.'):
+        if msg.is_multipart():
+            msg = msg.get_payload()[int(number) - 1]
+        elif number != '1':
+            raise IndexError(path)
+    return msg
+
+
+def _quote(value):
+    """Returns IMAP quoted string, literal or NIL of given ``value``."""
+    if value is None:
+        return 'NIL'
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', 'replace')
+    if any(ord(char) > 127 or char in '\r\n' for char in value):
+        return '{%d}\r\n%s' % (len(value.encode('utf-8')), value)
+    return '"%s"' % value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def _section_data(message, section, decode=False):
+    """Returns the bytes of given body ``section`` of given ``message``."""
+    raw = message.raw
+    separator = b'\r\n\r\n' if b'\r\n\r\n' in raw else b'\n\n'
+    header, _, text = raw.partition(separator)
+    upper = section.upper()
+    if upper == '':
+        return raw
+    if upper == 'HEADER':
+        return header + b'\r\n\r\n'
+    if upper == 'TEXT':
+        return text
+    if upper.startswith('HEADER.FIELDS'):
+        names = [name.lower() for name in upper.split('(')[1].rstrip(')').split()]
+        return b''.join(('%s: %s\r\n' % (key, value)).encode('utf-8')
+                        for key, value in message.msg.items() if key.lower() in names) + b'\r\n'
+    numbers = section.split('.')
+    suffix = numbers.pop().upper() if not numbers[-1].isdigit() else ''
+    part = _part(message.msg, '.'.join(numbers))
+    if suffix in ('HEADER', 'MIME'):
+        return ''.join('%s: %s\r\n' % item for item in part.items()).encode('utf-8') + b'\r\n'
+    if decode:
+        return part.get_payload(decode=True)
+    payload = part.get_payload()
+    if isinstance(payload, list):
+        return part.as_bytes().partition(b'\n\n')[2]
+    return payload.encode('utf-8') if not isinstance(payload, bytes) else payload
+
+
+def _sequence(spec, largest):
+    """Returns the set of numbers of given sequence set ``spec``, ``*`` is ``largest``."""
+    numbers = set()
+    for item in spec.split(','):
+        start, _, end = item.partition(':')
+        start = largest if start == '*' else int(start)
+        end = start if not end else largest if end == '*' else int(end)
+        numbers.update(range(min(start, end), max(start, end) + 1))
+    return numbers
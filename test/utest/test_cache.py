@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright 2015-2016 Richard Huang <rickypc@users.noreply.github.com>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+IMAP Library - a IMAP email testing library.
+"""
+
+from sys import path
+path.append('src')
+from ImapLibrary.cache import MessageCache
+import unittest
+
+
+class MessageCacheTests(unittest.TestCase):
+    """Message cache test class."""
+
+    def setUp(self):
+        """Instantiate the message cache class."""
+        self.cache = MessageCache(max_bytes=10)
+
+    def test_should_count_hits_and_misses(self):
+        """Count cache hits and misses."""
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.put('a', b'1234')
+        self.assertEqual(self.cache.get('a').raw, b'1234')
+        self.assertIsNone(self.cache.get(None))
+        self.assertEqual(self.cache.statistics(),
+                         {'bytes': 4, 'hits': 1, 'messages': 1, 'misses': 2})
+
+    def test_should_parse_cached_message_once(self):
+        """Parse cached raw email message once."""
+        self.cache.max_bytes = 100
+        entry = self.cache.put('a', b'Subject: hi\r\n\r\nbody')
+        self.assertEqual(entry.message['Subject'], 'hi')
+        self.assertIs(entry.message, self.cache.get('a').message)
+
+    def test_should_decode_cached_message_body_once(self):
+        """Decode cached email message body once, from quoted-printable and its charset."""
+        self.cache.max_bytes = 100
+        entry = self.cache.put('a', b'Content-Type: text/plain; charset=iso-8859-1\r\n\r\n'
+                                    b'caf=E9 \xe9')
+        self.assertEqual(entry.body, u'caf\xe9 \xe9')
+        self.assertIs(entry.body, self.cache.get('a').body)
+
+    def test_should_evict_least_recently_used_messages(self):
+        """Evict least recently used messages over the size limit."""
+        self.cache.put('a', b'1234')
+        self.cache.put('b', b'1234')
+        self.cache.get('a')
+        self.cache.put('c', b'1234')
+        self.assertIsNone(self.cache.get('b'))
+        self.assertIsNotNone(self.cache.get('a'))
+        self.assertIsNotNone(self.cache.get('c'))
+        self.assertEqual(self.cache.size, 8)
+
+    def test_should_not_cache_oversized_message(self):
+        """Do not cache message bigger than the cache size."""
+        entry = self.cache.put('a', b'12345678901')
+        self.assertEqual(entry.raw, b'12345678901')
+        self.assertEqual(len(self.cache), 0)
+
+    def test_should_invalidate_message(self):
+        """Invalidate cached message."""
+        self.cache.put('a', b'1234')
+        self.cache.invalidate('a')
+        self.cache.invalidate('b')
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.size, 0)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright 2015-2016 Richard Huang <rickypc@users.noreply.github.com>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+IMAP Library - a IMAP email testing library.
+"""
+
+from sys import path
+path.append('src')
+from ImapLibrary.criteria import build_criteria, is_arrival_criteria, search_arguments
+import unittest
+
+
+class CriteriaTests(unittest.TestCase):
+    """IMAP SEARCH criteria test class."""
+
+    def test_should_default_to_unseen(self):
+        """Criteria without any filter should match unseen email messages."""
+        self.assertEqual(build_criteria(), ['UNSEEN'])
+        self.assertEqual(build_criteria(sender='a"b', status='SEEN'),
+                         ['FROM', '"a\\"b"', 'SEEN'])
+
+    def test_should_tell_arrival_criteria(self):
+        """Only criteria without flags, other than unseen, or keywords match arrivals only."""
+        self.assertTrue(is_arrival_criteria(build_criteria()))
+        self.assertTrue(is_arrival_criteria(build_criteria(subject='SEEN', status='ALL')))
+        self.assertFalse(is_arrival_criteria(build_criteria(status='SEEN')))
+        self.assertFalse(is_arrival_criteria(build_criteria(keyword='$Done')))
+        self.assertFalse(is_arrival_criteria(build_criteria(exclude={'status': 'FLAGGED'})))
+
+    def test_should_build_extended_criteria(self):
+        """Criteria should support dates, sizes, headers, UIDs and keywords."""
+        self.assertEqual(build_criteria(since='2024-01-05', sent_before='31-Dec-2024',
+                                        larger='1024', smaller=0, header='X-Campaign: 42',
+                                        uid='100:*', keyword='$Important',
+                                        gmail_raw='has:attachment'),
+                         ['HEADER', '"X-Campaign"', '"42"', 'SINCE', '05-Jan-2024',
+                          'SENTBEFORE', '31-Dec-2024', 'LARGER', '1024', 'SMALLER', '0',
+                          'KEYWORD', '$Important', 'UID', '100:*',
+                          'X-GM-RAW', '"has:attachment"'])
+        with self.assertRaises(ValueError):
+            build_criteria(uid='1:x')
+        with self.assertRaises(ValueError):
+            build_criteria(keyword='two words')
+
+    def test_should_compose_or_and_not_criteria(self):
+        """Criteria should combine alternatives with OR and exclusions with NOT."""
+        self.assertEqual(build_criteria(sender='a', any=[{'subject': 'x'}, {'subject': 'y'},
+                                                         {'status': 'FLAGGED'}],
+                                        exclude={'text': 'spam'}),
+                         ['FROM', '"a"', 'OR', '(SUBJECT "x")', 'OR', '(SUBJECT "y")',
+                          '(FLAGGED)', 'NOT', '(TEXT "spam")'])
+
+    def test_should_encode_non_ascii_criteria(self):
+        """Non-ASCII criteria should be sent with UTF-8 charset, as literals with LITERAL+."""
+        criteria = ['SUBJECT', u'"caf\xe9 \\"x\\""', 'UID', '5:*']
+        self.assertEqual(search_arguments(['SUBJECT', '"cafe"']), [None, 'SUBJECT', '"cafe"'])
+        self.assertEqual(search_arguments(criteria),
+                         ['UTF-8', b'SUBJECT', b'"caf\xc3\xa9 \\"x\\""', b'UID', b'5:*'])
+        self.assertEqual(search_arguments(criteria, literal_plus=True)[2],
+                         b'{9+}\r\ncaf\xc3\xa9 "x"')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright 2015-2016 Richard Huang <rickypc@users.noreply.github.com>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+IMAP Library - a IMAP email testing library.
+"""
+
+from sys import path, version_info
+path.append('src')
+import unittest
+if version_info[0] > 2:
+    import asyncio
+    from ImapLibrary.engine import AsyncImapClient, Engine
+    from ImapLibrary.response import parse_fetch
+
+
+class ScriptedServer(object):
+    """A scripted IMAP server with a search result per folder."""
+
+    def __init__(self, mails, capabilities=b'IMAP4rev1 IDLE'):
+        self.capabilities = capabilities
+        self.commands = []
+        self.mails = mails
+
+    async def handle(self, reader, writer):
+        """Serves one IMAP session."""
+        writer.write(b'* OK ready\r\n')
+        folder = None
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            tag, command = line.split()[:2]
+            self.commands.append(line.strip())
+            if command == b'CAPABILITY':
+                writer.write(b'* CAPABILITY ' + self.capabilities + b'\r\n')
+            elif command == b'SELECT':
+                folder = line.split()[2].strip(b'"')
+                writer.write(b'* OK [UIDVALIDITY 7] ok\r\n* OK [UIDNEXT 3] ok\r\n')
+            elif command == b'SEARCH':
+                writer.write(b'* SEARCH ' + b' '.join(self.mails.get(folder, [])) + b'\r\n')
+            elif command == b'FETCH':
+                writer.write(b'* 1 FETCH (UID 9 RFC822 {5}\r\nHello)\r\n')
+            elif command == b'IDLE':
+                writer.write(b'+ idling\r\n')
+                await reader.readline()
+            elif command == b'LOGOUT':
+                writer.write(b'* BYE\r\n')
+            writer.write(tag + b' OK done\r\n')
+            if command == b'LOGOUT':
+                break
+        writer.close()
+
+
+@unittest.skipIf(version_info[0] < 3, 'asyncio engine requires Python 3')
+class EngineTests(unittest.TestCase):
+    """Asyncio engine test class."""
+
+    def setUp(self):
+        """Instantiate the engine with a scripted IMAP server on its event loop."""
+        self.engine = Engine()
+        self.server = ScriptedServer({b'INBOX': [], b'Spam': [b'1', b'2']})
+        self.listener = self.engine.run(self._start())
+        self.account = ('127.0.0.1', self.listener.sockets[0].getsockname()[1],
+                        'user', 'secret', False)
+
+    def tearDown(self):
+        """Stops the scripted IMAP server and the engine."""
+        self.listener.close()
+        self.engine.run(self.listener.wait_closed())
+        self.engine.stop()
+
+    async def _start(self):
+        """Starts the scripted IMAP server."""
+        return await asyncio.start_server(self.server.handle, '127.0.0.1', 0)
+
+    def test_should_return_first_folder_with_matching_email(self):
+        """Engine should return the latest email index of the first matching folder."""
+        found = self.engine.run(self.engine.wait_for_email(
+            self.account, ['INBOX', 'Spam'], ['UNSEEN'], poll_frequency=0.05, timeout=5))
+        self.assertEqual(found, {'Spam': b'2'})
+        self.assertIn(b'A2 LOGIN "user" "secret"', self.server.commands)
+
+    def test_should_wait_for_all_folders_until_timeout(self):
+        """Engine should return matching folders only when all folders did not match in time."""
+        found = self.engine.run(self.engine.wait_for_email(
+            self.account, ['INBOX', 'Spam'], ['UNSEEN'], poll_frequency=0.05, timeout=0.3,
+            wait_all=True))
+        self.assertEqual(found, {'Spam': b'2'})
+        self.assertTrue(any(command.endswith(b'IDLE') for command in self.server.commands))
+
+    def test_should_read_literal_responses(self):
+        """Async client should read literal responses in imaplib format."""
+        async def fetch():
+            client = AsyncImapClient(*self.account[:2], is_secure=False)
+            await client.connect()
+            untagged = (await client.command('FETCH', '1', '(UID RFC822)'))[1]
+            await client.logout()
+            return client.capabilities, untagged
+        capabilities, untagged = self.engine.run(fetch())
+        self.assertEqual(capabilities, ('IMAP4REV1', 'IDLE'))
+        self.assertEqual(untagged['FETCH'], [(b'1 (UID 9 RFC822 {5}', b'Hello'), b')'])
+        self.assertEqual(parse_fetch(untagged['FETCH']),
+                         [(1, {'UID': b'9', 'RFC822': b'Hello'})])
+
+
+if __name__ == '__main__':
+    unittest.main()
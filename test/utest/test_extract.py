@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright 2015-2016 Richard Huang <rickypc@users.noreply.github.com>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+IMAP Library - a IMAP email testing library.
+"""
+
+from sys import path
+path.append('src')
+from ImapLibrary.cache import message_from_bytes
+from ImapLibrary.extract import MessageText, compile_pattern, decode_part, decode_text, \
+    find_links
+import mock
+import unittest
+
+MULTIPART = (b'Content-Type: multipart/alternative; boundary="b"\r\n\r\n'
+             b'--b\r\nContent-Type: text/plain; charset=utf-8\r\n\r\n'
+             b'Confirm at href=http://domain.com/plain code 1234\r\n'
+             b'--b\r\nContent-Type: text/html; charset=utf-8\r\n'
+             b'Content-Transfer-Encoding: base64\r\n\r\n'
+             b'PHA+PGEgY2xhc3M9ImJ0biIgaHJlZj0iaHR0cDovL2RvbWFpbi5jb20vY29uZmlybSI+PGI+Q29u\r\n'
+             b'ZmlybTwvYj4gJmFtcDsKIGdvPC9hPiBjb2RlIDU2Nzg8L3A+\r\n'
+             b'--b\r\nContent-Type: application/pdf\r\n\r\nhref=http://domain.com/ignored\r\n'
+             b'--b--\r\n')
+
+
+class ExtractTests(unittest.TestCase):
+    """Link and pattern extraction test class."""
+
+    def test_should_extract_links_of_all_text_parts_at_once(self):
+        """Message text should keep the links of text parts with anchor text and part index."""
+        text = MessageText(message_from_bytes(MULTIPART))
+        self.assertEqual([link.to_dict() for link in text.links], [
+            {'part': 1, 'text': None, 'url': 'http://domain.com/plain'},
+            {'part': 2, 'text': 'Confirm & go', 'url': 'http://domain.com/confirm'}])
+        self.assertEqual(text.findall(r'code (\d+)'), ['1234', '5678'])
+
+    def test_should_fallback_to_href_of_unclosed_anchor(self):
+        """Unclosed anchor should not swallow the next links."""
+        links = find_links('<a href="http://a.com/1">one <a href=\'http://a.com/2\'>two</a>'
+                           '<link href=http://a.com/3>', 4)
+        self.assertEqual([(link.url, link.text, link.part) for link in links], [
+            ('http://a.com/1', None, 4), ('http://a.com/2', 'two', 4), ('http://a.com/3', None, 4)])
+
+    def test_should_decode_part_payload_once(self):
+        """Part payload should be transfer decoded once, and charset decoded once."""
+        part = message_from_bytes(MULTIPART).get_payload(1)
+        with mock.patch.object(part, 'get_payload', wraps=part.get_payload) as get_payload:
+            text = decode_part(part)
+            self.assertIs(decode_part(part), text)
+            self.assertIn(u'Confirm</b> &amp;', decode_text(part))
+            get_payload.assert_called_once_with(decode=True)
+
+    def test_should_reuse_compiled_patterns(self):
+        """Compiled patterns should be reused."""
+        self.assertIs(compile_pattern(r'code (\d+)'), compile_pattern(r'code (\d+)'))
+
+
+if __name__ == '__main__':
+    unittest.main()
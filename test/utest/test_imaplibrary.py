@@ -19,10 +19,17 @@
 IMAP Library - a IMAP email testing library.
 """
 
+from collections import OrderedDict
+from shutil import rmtree
 from sys import path
+from tempfile import mkdtemp
+from threading import Event
 path.append('src')
 from ImapLibrary import ImapLibrary
+from ImapLibrary.pool import ConnectionPool
+import hashlib
 import mock
+import os
 import unittest
 
 
@@ -99,6 +106,63 @@ class ImapLibraryTests(unittest.TestCase):
         self.library._imap.login.assert_called_with(self.username, self.password)
         self.library._imap.select.assert_called_with()
 
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_switch_between_named_sessions(self, mock_imap):
+        """Open mailbox should keep a session per alias, switch mailbox should restore it."""
+        sender_imap, recipient_imap = mock.MagicMock(), mock.MagicMock()
+        mock_imap.side_effect = [sender_imap, recipient_imap]
+        self.library.open_mailbox(host=self.server, user='sender', password=self.password,
+                                  alias='sender')
+        self.library._mails = ['1']
+        self.library.open_mailbox(host=self.server, user='recipient', password=self.password,
+                                  alias='recipient')
+        self.assertIs(self.library._imap, recipient_imap)
+        self.assertEqual(self.library._mails, [])
+        self.assertEqual(self.library.switch_mailbox('sender'), 'recipient')
+        self.assertIs(self.library._imap, sender_imap)
+        self.assertEqual(self.library._mails, ['1'])
+        with self.assertRaises(ValueError):
+            self.library.switch_mailbox('unknown')
+        self.library.close_all_mailboxes()
+        sender_imap.logout.assert_called_once_with()
+        recipient_imap.logout.assert_called_once_with()
+        self.assertIsNone(self.library._imap)
+
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_run_keyword_in_mailboxes_concurrently(self, mock_imap):
+        """Run keyword in mailboxes should run the keyword in each session concurrently."""
+        sender_imap, recipient_imap = mock.MagicMock(), mock.MagicMock()
+        mock_imap.side_effect = [sender_imap, recipient_imap]
+        both_searching = Event()
+
+        def search(index):
+            """Returns given email index once the other session searches as well."""
+            def wait(*args):
+                if both_searching.is_set():
+                    return ['OK', [index]]
+                both_searching.set()
+                return ['OK', [index]] if both_searching.wait(5) else ['OK', [b'']]
+            return wait
+        for imap, index in ((sender_imap, b'3'), (recipient_imap, b'7')):
+            imap.select.return_value = ['OK', [b'9']]
+            imap.search.side_effect = search(index)
+        self.library.open_mailbox(host=self.server, user='sender', password=self.password,
+                                  alias='sender')
+        self.library.open_mailbox(host=self.server, user='recipient', password=self.password,
+                                  alias='recipient')
+        indexes = self.library.run_keyword_in_mailboxes('sender, recipient', 'Wait For Email',
+                                                        subject=self.subject, timeout=1)
+        self.assertEqual(indexes, {'sender': b'3', 'recipient': b'7'})
+        self.assertEqual(self.library._mails, [b'7'])
+        self.library.switch_mailbox('sender')
+        self.assertEqual(self.library._mails, [b'3'])
+        with self.assertRaises(ValueError):
+            self.library.run_keyword_in_mailboxes('sender', 'Close Mailbox')
+        sender_imap.search.side_effect = None
+        sender_imap.search.return_value = ['OK', [b'']]
+        with self.assertRaises(AssertionError):
+            self.library.run_keyword_in_mailboxes(['sender'], 'Wait For Email', timeout=0)
+
     @mock.patch('ImapLibrary.IMAP4_SSL')
     def test_should_return_email_index(self, mock_imap):
         """Returns email index from connected IMAP session."""
@@ -177,6 +241,71 @@ class ImapLibraryTests(unittest.TestCase):
                                                      self.subject)
         self.assertEqual(index, '0')
 
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_search_extended_and_non_ascii_filters(self, mock_imap):
+        """Search extended filters on the server, non-ASCII text with UTF-8 charset."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        self.library._imap.capabilities = ('IMAP4REV1', 'LITERAL+')
+        self.library._imap.select.return_value = ['OK', ['1']]
+        self.library._imap.search.return_value = ['OK', ['0']]
+        index = self.library.wait_for_email(subject=u'caf\xe9', since='2024-01-31',
+                                            exclude={'sender': 'spam@domain.com'})
+        self.library._imap.search.assert_called_with(
+            'UTF-8', b'SUBJECT', b'{5+}\r\ncaf\xc3\xa9', b'SINCE', b'31-Jan-2024', b'NOT',
+            b'(FROM "spam@domain.com")')
+        self.assertEqual(index, '0')
+
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_get_latest_email_and_count_with_esearch(self, mock_imap):
+        """Get latest email and count emails should only return the server side results."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        imap = self.library._imap
+        imap.capabilities = ('IMAP4REV1', 'ESEARCH', 'ESORT', 'SORT')
+        imap._simple_command.return_value = ('OK', [b'done'])
+        imap.select.return_value = ['OK', [b'50']]
+        esearch = [[b'(TAG "A4") MIN 42'], [b'(TAG "A5") COUNT 7']]
+        imap.response.side_effect = lambda code: \
+            (code, esearch.pop(0) if code == 'ESEARCH' else [None])
+        self.assertEqual(self.library.get_latest_email(sender=self.sender), '42')
+        self.assertEqual(self.library.count_emails(sender=self.sender), 7)
+        self.assertEqual(imap._simple_command.call_args_list, [
+            mock.call('SORT', 'RETURN', '(MIN)', '(REVERSE ARRIVAL)', 'UTF-8',
+                      'FROM', '"%s"' % self.sender),
+            mock.call('SEARCH', 'RETURN', '(COUNT)', 'FROM', '"%s"' % self.sender)])
+        self.assertEqual(self.library._mails, ['42'])
+        self.assertEqual(imap.select.call_count, 3)
+        self.assertFalse(imap.search.called)
+
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_get_latest_email_with_sort(self, mock_imap):
+        """Get latest email should take the first email index of a reverse arrival SORT."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        imap = self.library._imap
+        imap.capabilities = ('IMAP4REV1', 'SORT')
+        imap.select.return_value = ['OK', [b'50']]
+        imap.sort.return_value = ('OK', [b'12 4 9'])
+        self.assertEqual(self.library.get_latest_email(sender=self.sender), '12')
+        imap.sort.assert_called_once_with('(REVERSE ARRIVAL)', 'UTF-8',
+                                          'FROM', '"%s"' % self.sender)
+        self.assertEqual(imap.select.call_count, 2)
+        self.assertFalse(imap._simple_command.called)
+
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_get_latest_email_with_search_fallback(self, mock_imap):
+        """Get latest email should fallback to the highest email index found by search."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        self.library._imap.select.return_value = ['OK', [b'9']]
+        self.library._imap.search.return_value = ['OK', [b'3 9']]
+        self.assertEqual(self.library.get_latest_email(subject=self.subject), '9')
+        self.assertEqual(self.library.count_emails(subject=self.subject), 2)
+        self.library._imap.search.return_value = ['OK', [b'']]
+        with self.assertRaises(AssertionError):
+            self.library.get_latest_email(subject=self.subject)
+
     @mock.patch('ImapLibrary.IMAP4_SSL')
     def test_should_return_email_index_with_text_filter(self, mock_imap):
         """Returns email index from connected IMAP session with text filter."""
@@ -335,3 +464,744 @@ class ImapLibraryTests(unittest.TestCase):
                                   password=self.password)
         self.library.close_mailbox()
         self.library._imap.close.assert_called_with()
+        self.library._imap.logout.assert_called_with()
+
+    @mock.patch('ImapLibrary.POOL', new_callable=ConnectionPool)
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_reuse_pooled_session(self, mock_imap, mock_pool):
+        """Reuse authenticated session from the session pool."""
+        mock_imap.return_value.noop.return_value = ('OK', [b''])
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password, pool=True)
+        imap = self.library._imap
+        self.library.close_mailbox()
+        self.assertFalse(imap.logout.called)
+        self.assertEqual(len(mock_pool), 1)
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password, pool=True)
+        self.assertIs(self.library._imap, imap)
+        self.assertEqual(mock_imap.call_count, 1)
+        self.assertEqual(imap.login.call_count, 1)
+        self.assertEqual(imap.select.call_count, 2)
+
+    @mock.patch('ImapLibrary.select')
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_return_email_index_after_idle_notification(self, mock_imap, mock_select):
+        """Returns email index from connected IMAP session after IDLE notification."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        self.library._imap.capabilities = ('IMAP4REV1', 'IDLE')
+        self.library._imap._new_tag.return_value = b'A1'
+        self.library._imap.readline.side_effect = [b'+ idling\r\n', b'* 1 EXISTS\r\n',
+                                                   b'A1 OK IDLE terminated\r\n']
+        self.library._imap.sock.pending.return_value = 0
+        mock_select.return_value = ([self.library._imap.sock], [], [])
+        self.library._imap.select.return_value = ['OK', ['1']]
+        self.library._imap.search.side_effect = [['OK', ['']], ['OK', ['0']]]
+        index = self.library.wait_for_email(sender=self.sender, poll_frequency=5)
+        self.library._imap.send.assert_has_calls([mock.call(b'A1 IDLE\r\n'),
+                                                  mock.call(b'DONE\r\n')])
+        self.assertEqual(index, '0')
+
+    @mock.patch('ImapLibrary.select')
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_read_buffered_idle_notification(self, mock_imap, mock_select):
+        """IDLE notification already read ahead by imaplib should not wait on the socket."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        self.library._imap._new_tag.return_value = b'A1'
+        self.library._imap.readline.side_effect = [b'+ idling\r\n', b'* 1 EXISTS\r\n',
+                                                   b'A1 OK IDLE terminated\r\n']
+        self.library._imap.sock.pending.return_value = 0
+        self.library._imap.sock.gettimeout.return_value = None
+        self.library._imap.file.peek.return_value = b'* 1 EXISTS\r\n'
+        self.assertTrue(self.library._idle(5))
+        self.assertFalse(mock_select.called)
+        self.library._imap.sock.settimeout.assert_has_calls([mock.call(0), mock.call(None)])
+
+    @mock.patch('ImapLibrary.sleep')
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_poll_when_idle_is_disabled(self, mock_imap, mock_sleep):
+        """Poll mailbox when IDLE is disabled even if supported by the server."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        self.library._imap.capabilities = ('IMAP4REV1', 'IDLE')
+        self.library._imap.select.return_value = ['OK', ['1']]
+        self.library._imap.search.side_effect = [['OK', ['']], ['OK', ['0']]]
+        index = self.library.wait_for_email(sender=self.sender, poll_frequency=5,
+                                            idle='False')
+        mock_sleep.assert_called_with(5.0)
+        self.assertFalse(self.library._imap.send.called)
+        self.assertEqual(index, '0')
+
+    @mock.patch('ImapLibrary.time')
+    @mock.patch('ImapLibrary.sleep')
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_backoff_poll_within_timeout(self, mock_imap, mock_sleep, mock_time):
+        """Poll delay should backoff up to its maximum and never go past the timeout."""
+        clock = [100.0]
+        mock_time.side_effect = lambda: clock[0]
+        mock_sleep.side_effect = lambda delay: clock.__setitem__(0, clock[0] + delay)
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        self.library._imap.select.return_value = ['OK', ['1']]
+        self.library._imap.search.return_value = ['OK', [b'']]
+        with self.assertRaises(AssertionError):
+            self.library.wait_for_email(sender=self.sender, idle=False, timeout=20,
+                                        poll_frequency=1, poll_backoff='2', poll_max=6)
+        self.assertEqual([call[0][0] for call in mock_sleep.call_args_list],
+                         [1.0, 2.0, 4.0, 6.0, 6.0, 1.0])
+        self.assertEqual(self.library.get_wait_statistics(),
+                         {'elapsed': 20.0, 'polls': 7, 'time_to_match': None})
+
+    @mock.patch('ImapLibrary.sleep')
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_keep_polling_without_poll_delay(self, mock_imap, mock_sleep):
+        """Zero poll frequency should keep checking the mailbox until the timeout."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        self.library._imap.select.return_value = ['OK', ['1']]
+        self.library._imap.search.side_effect = [['OK', [b'']], ['OK', [b'']], ['OK', [b'1']]]
+        index = self.library.wait_for_email(sender=self.sender, idle=False, timeout=10,
+                                            poll_frequency=0)
+        self.assertFalse(mock_sleep.called)
+        self.assertEqual(self.library.get_wait_statistics()['polls'], 3)
+        self.assertEqual(index, b'1')
+
+    @mock.patch('ImapLibrary.time')
+    @mock.patch('ImapLibrary.sleep')
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_check_once_more_at_timeout(self, mock_imap, mock_sleep, mock_time):
+        """Email arrived during the last clamped poll delay should still be found."""
+        clock = [100.0]
+        mock_time.side_effect = lambda: clock[0]
+        mock_sleep.side_effect = lambda delay: clock.__setitem__(0, clock[0] + delay)
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        self.library._imap.select.return_value = ['OK', ['1']]
+        self.library._imap.search.side_effect = [['OK', [b'']], ['OK', [b'']], ['OK', [b'1']]]
+        index = self.library.wait_for_email(sender=self.sender, idle=False, timeout=3,
+                                            poll_frequency=2)
+        self.assertEqual([call[0][0] for call in mock_sleep.call_args_list], [2.0, 1.0])
+        self.assertEqual(index, b'1')
+
+    @mock.patch('ImapLibrary.sleep')
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_write_imap_statistics_per_keyword(self, mock_imap, mock_sleep):
+        """Get IMAP statistics should return and write the statistics of keyword calls."""
+        listener = self.library.ROBOT_LIBRARY_LISTENER
+        self.assertIn('get_imap_statistics', listener.keywords)
+        self.assertNotIn('ROBOT_LIBRARY_SCOPE', listener.keywords)
+        attrs = {'kwname': 'Open Mailbox', 'libname': 'ImapLibrary'}
+        listener.start_keyword('ImapLibrary.Open Mailbox', attrs)
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        listener.end_keyword('ImapLibrary.Open Mailbox', attrs)
+        self.library._imap.select.return_value = ['OK', ['1']]
+        self.library._imap.search.side_effect = [['OK', [b'']], ['OK', [b'1']]]
+        attrs = {'kwname': 'Wait For Email', 'libname': 'ImapLibrary'}
+        listener.start_keyword('ImapLibrary.Wait For Email', attrs)
+        self.library.wait_for_email(sender=self.sender, idle=False, timeout=10)
+        listener.end_keyword('ImapLibrary.Wait For Email', attrs)
+        directory = mkdtemp()
+        try:
+            output = os.path.join(directory, 'imap.prom')
+            statistics = self.library.get_imap_statistics(path=output,
+                                                          output_format='Prometheus', reset=True)
+            with open(output) as reader:
+                self.assertIn('imap_polls_total{keyword="Wait For Email"} 2\n', reader.read())
+        finally:
+            rmtree(directory)
+        self.assertEqual(list(statistics['keywords']), ['Open Mailbox', 'Wait For Email'])
+        self.assertEqual(statistics['total']['calls'], 2)
+        self.assertEqual(statistics['total']['commands']['CONNECT']['count'], 1)
+        self.assertEqual(statistics['cache']['messages'], 0)
+        self.assertEqual(self.library.get_imap_statistics()['total']['polls'], 0)
+        with self.assertRaises(ValueError):
+            self.library.get_imap_statistics(output_format='xml')
+
+    @mock.patch('ImapLibrary.sleep')
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_only_search_new_emails_after_first_check(self, mock_imap, mock_sleep):
+        """Search only email messages arrived after the previous mailbox check."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        responses = {'UIDVALIDITY': [[b'7'], [b'7'], [b'7']],
+                     'UIDNEXT': [[b'5'], [b'5'], [b'9']]}
+        self.library._imap.response.side_effect = lambda code: (code, responses[code].pop(0))
+        self.library._imap.select.return_value = ['OK', ['4']]
+        self.library._imap.search.side_effect = [['OK', [b'']], ['OK', [b'6']]]
+        index = self.library.wait_for_email(sender=self.sender, idle=False)
+        self.assertEqual(self.library._imap.search.call_args_list, [
+            mock.call(None, 'FROM', '"%s"' % self.sender),
+            mock.call(None, 'FROM', '"%s"' % self.sender, 'UID', '5:*')])
+        self.assertEqual(index, b'6')
+
+    @mock.patch('ImapLibrary.sleep')
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_search_whole_mailbox_on_flag_criteria(self, mock_imap, mock_sleep):
+        """Flag criteria should also match email messages flagged after their arrival."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        responses = {'UIDVALIDITY': [[b'7'], [b'7'], [b'7']],
+                     'UIDNEXT': [[b'5'], [b'5'], [b'5']]}
+        self.library._imap.response.side_effect = lambda code: (code, responses[code].pop(0))
+        self.library._imap.select.return_value = ['OK', ['4']]
+        self.library._imap.search.side_effect = [['OK', [b'']], ['OK', [b'1']]]
+        index = self.library.wait_for_email(status='SEEN', idle=False)
+        self.assertEqual(self.library._imap.search.call_args_list,
+                         [mock.call(None, 'SEEN'), mock.call(None, 'SEEN')])
+        self.assertEqual(index, b'1')
+
+    @mock.patch('ImapLibrary.sleep')
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_search_whole_mailbox_on_uidvalidity_change(self, mock_imap, mock_sleep):
+        """Search the whole mailbox again when the mailbox UIDVALIDITY changes."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        responses = {'UIDVALIDITY': [[b'7'], [b'8']], 'UIDNEXT': [[b'5'], [b'9']]}
+        self.library._imap.response.side_effect = lambda code: (code, responses[code].pop(0))
+        self.library._imap.select.return_value = ['OK', ['4']]
+        self.library._imap.search.side_effect = [['OK', [b'']], ['OK', [b'2']]]
+        index = self.library.wait_for_email(sender=self.sender, idle=False)
+        self.library._imap.search.assert_called_with(None, 'FROM', '"%s"' % self.sender)
+        self.assertEqual(index, b'2')
+
+    @mock.patch('ImapLibrary.sleep')
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_wait_for_all_criteria_sets(self, mock_imap, mock_sleep):
+        """Wait for multiple emails with one combined search per mailbox check."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        self.library._imap.select.return_value = ['OK', ['4']]
+        self.library._imap.search.side_effect = [
+            ['OK', [b'3']], ['OK', [b'3']], ['OK', [b'']],
+            ['OK', [b'3 4']], ['OK', [b'3']], ['OK', [b'4']]]
+        criteria = OrderedDict([('confirm', {'sender': self.sender, 'subject': 'Confirm'}),
+                                ('receipt', {'sender': 'billing@domain.com'})])
+        matches = self.library.wait_for_multiple_emails(criteria, idle=False)
+        self.assertEqual(matches, {'confirm': [b'3'], 'receipt': [b'4']})
+        self.assertEqual(self.library._imap.search.call_args_list[:3], [
+            mock.call(None, 'OR', '(FROM "%s" SUBJECT "Confirm")' % self.sender,
+                      '(FROM "billing@domain.com")'),
+            mock.call(None, '3', 'FROM', '"%s"' % self.sender, 'SUBJECT', '"Confirm"'),
+            mock.call(None, '3', 'FROM', '"billing@domain.com"')])
+        self.assertEqual(mock_sleep.call_count, 1)
+        self.assertEqual(self.library._mails, [b'3', b'4'])
+
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_wait_for_any_criteria_set(self, mock_imap):
+        """Wait for multiple emails should return once any criteria set matches."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        self.library._imap.select.return_value = ['OK', ['4']]
+        self.library._imap.search.side_effect = [
+            ['OK', [b'2']], ['OK', [b'']], ['OK', [b'']], ['OK', [b'2']]]
+        criteria = [{'subject': 'a'}, {'subject': 'b'}, {'subject': 'c'}]
+        matches = self.library.wait_for_multiple_emails(criteria, mode='any', idle=False)
+        self.assertEqual(matches, {0: [], 1: [], 2: [b'2']})
+        self.library._imap.search.assert_any_call(
+            None, 'OR', '(SUBJECT "a")', 'OR', '(SUBJECT "b")', '(SUBJECT "c")')
+
+    @mock.patch('ImapLibrary.Pipeline')
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_pipeline_select_and_search(self, mock_imap, mock_pipeline):
+        """Mailbox check should pipeline SELECT and SEARCH when pipelining is enabled."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password, pipelining='True')
+        mock_pipeline.return_value.execute.return_value = [['OK', ['4']], ['OK', [b'2 3']]]
+        index = self.library.wait_for_email(sender=self.sender, idle=False)
+        mock_pipeline.return_value.execute.assert_called_with(
+            ('select', ()), ('search', [None, 'FROM', '"%s"' % self.sender]))
+        self.assertFalse(self.library._imap.search.called)
+        self.assertEqual(index, b'3')
+
+    @mock.patch('ImapLibrary.Pipeline')
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_expunge_after_pipelined_stores_complete(self, mock_imap, mock_pipeline):
+        """Pipelined delete should only send EXPUNGE once its STORE commands completed."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password, pipelining='True')
+        self.library.STORE_CHUNK_SIZE = 2
+        self.library._mails = [b'1', b'2', b'3']
+        self.library.delete_all_emails()
+        self.assertEqual(mock_pipeline.return_value.execute.call_args_list, [
+            mock.call(('store', ('1:2', '+FLAGS', r'\DELETED')),
+                      ('store', ('3', '+FLAGS', r'\DELETED'))),
+            mock.call(('expunge', ()))])
+
+    @mock.patch('ImapLibrary.sleep')
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_only_search_after_noop_reports_new_emails(self, mock_imap, mock_sleep):
+        """Mailbox check should only search after NOOP reports new email messages."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password, change_detection='noop')
+        responses = {'EXISTS': [[None], [b'6']], 'EXPUNGE': [[None], [None]],
+                     'FETCH': [[None], [None]], 'RECENT': [[None], [None]]}
+        self.library._imap.response.side_effect = lambda code: \
+            (code, responses[code].pop(0) if code in responses else [None])
+        self.library._imap.select.return_value = ['OK', [b'4']]
+        self.library._imap.noop.return_value = ['OK', [b'done']]
+        self.library._imap.search.side_effect = [['OK', [b'']], ['OK', [b'6']]]
+        index = self.library.wait_for_email(sender=self.sender, idle=False)
+        self.assertEqual(self.library._imap.select.call_count, 2)
+        self.assertEqual(self.library._imap.noop.call_count, 2)
+        self.assertEqual(self.library._imap.search.call_args_list, [
+            mock.call(None, 'FROM', '"%s"' % self.sender),
+            mock.call(None, '5:*', 'FROM', '"%s"' % self.sender)])
+        self.assertEqual(index, b'6')
+
+    @mock.patch('ImapLibrary.select')
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_search_after_idle_reports_new_emails(self, mock_imap, mock_select):
+        """Mailbox check after IDLE should see the new email messages IDLE reported."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password, change_detection='noop')
+        untagged = {}
+        self.library._imap.capabilities = ('IMAP4REV1', 'IDLE')
+        self.library._imap._append_untagged.side_effect = lambda code, value: \
+            untagged.setdefault(code, []).append(value)
+        self.library._imap.response.side_effect = lambda code: \
+            (code, untagged.pop(code, [None]))
+        self.library._imap._new_tag.return_value = b'A1'
+        self.library._imap.readline.side_effect = [b'+ idling\r\n', b'* 5 EXISTS\r\n',
+                                                   b'A1 OK IDLE terminated\r\n']
+        self.library._imap.sock.pending.return_value = 0
+        mock_select.return_value = ([self.library._imap.sock], [], [])
+        self.library._imap.select.return_value = ['OK', [b'4']]
+        self.library._imap.noop.return_value = ['OK', [b'done']]
+        self.library._imap.search.side_effect = [['OK', [b'']], ['OK', [b'5']]]
+        index = self.library.wait_for_email(sender=self.sender, poll_frequency=5)
+        self.assertEqual(self.library._imap.select.call_count, 2)
+        self.assertEqual(self.library._imap.noop.call_count, 1)
+        self.assertEqual(self.library._imap.search.call_args_list, [
+            mock.call(None, 'FROM', '"%s"' % self.sender),
+            mock.call(None, '5:*', 'FROM', '"%s"' % self.sender)])
+        self.assertEqual(index, b'5')
+
+    @mock.patch('ImapLibrary.sleep')
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_only_search_after_status_uidnext_changes(self, mock_imap, mock_sleep):
+        """Mailbox check should use STATUS instead of SELECT on status change detection."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password, change_detection='status')
+        self.library._imap.response.return_value = ('EXPUNGE', [None])
+        self.library._imap.status.side_effect = [
+            ['OK', [b'"INBOX" (UIDNEXT 5 UIDVALIDITY 7)']],
+            ['OK', [b'"INBOX" (UIDNEXT 5 UIDVALIDITY 7)']],
+            ['OK', [b'"INBOX" (UIDNEXT 8 UIDVALIDITY 7)']]]
+        self.library._imap.search.side_effect = [['OK', [b'']], ['OK', [b'6']]]
+        index = self.library.wait_for_email(sender=self.sender, idle=False)
+        self.assertEqual(self.library._imap.select.call_count, 1)
+        self.library._imap.status.assert_called_with('"INBOX"', '(UIDNEXT UIDVALIDITY)')
+        self.assertEqual(self.library._imap.search.call_args_list, [
+            mock.call(None, 'FROM', '"%s"' % self.sender),
+            mock.call(None, 'FROM', '"%s"' % self.sender, 'UID', '5:*')])
+        self.assertEqual(index, b'6')
+
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_select_on_every_check_with_gmail_profile(self, mock_imap):
+        """Gmail profile should keep selecting the mailbox on every check."""
+        mock_imap.return_value.capabilities = ('IMAP4REV1', 'X-GM-EXT-1')
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password, change_detection='noop')
+        self.assertEqual(self.library._change_detection, 'select')
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password, change_detection='noop',
+                                  provider='other')
+        self.assertEqual(self.library._change_detection, 'noop')
+
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_search_emails_with_local_index(self, mock_imap):
+        """Search emails should only fetch new email messages into the local index."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        self.library._imap.select.return_value = ['OK', [b'2']]
+        envelope = b'%d (UID %d FLAGS () ENVELOPE (NIL "%s" ((NIL NIL "noreply" "domain.com")) ' \
+            b'NIL NIL NIL NIL NIL NIL NIL))'
+        self.library._imap.uid.side_effect = [
+            ['OK', [envelope % (1, 7, b'Welcome'), envelope % (2, 9, b'Receipt')]],
+            ['OK', [envelope % (2, 9, b'Receipt')]]]
+        self.assertEqual(self.library.search_emails(sender=self.sender), ['1', '2'])
+        self.assertEqual(self.library.search_emails(subject='receipt'), ['2'])
+        self.assertEqual(self.library._imap.uid.call_args_list, [
+            mock.call('FETCH', '1:*', self.library.FETCH_INDEX_ITEMS),
+            mock.call('FETCH', '10:*', self.library.FETCH_INDEX_ITEMS)])
+        self.assertFalse(self.library._imap.fetch.called)
+        self.assertEqual(self.library._mails, ['2'])
+
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_not_renumber_local_index_on_unknown_count(self, mock_imap):
+        """Search emails with NOOP should not take an unknown message count as expunged."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password, change_detection='noop')
+        self.library._imap.response.return_value = ('EXISTS', [None])
+        self.library._imap.noop.return_value = ['OK', [b'done']]
+        envelope = b'%d (UID %d FLAGS () ENVELOPE (NIL "%s" ((NIL NIL "noreply" "domain.com")) ' \
+            b'NIL NIL NIL NIL NIL NIL NIL))'
+        self.library._imap.uid.side_effect = [
+            ['OK', [envelope % (1, 7, b'Welcome'), envelope % (2, 9, b'Receipt')]],
+            ['OK', [envelope % (2, 9, b'Receipt')]]]
+        self.assertEqual(self.library.search_emails(sender=self.sender), ['1', '2'])
+        self.assertEqual(self.library.search_emails(subject='receipt'), ['2'])
+        self.assertEqual(self.library._imap.noop.call_count, 2)
+        self.assertFalse(self.library._imap.fetch.called)
+        self.assertEqual(self.library._exists, 2)
+
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_resync_local_index_with_qresync(self, mock_imap):
+        """Search emails should only fetch changes since the last modification sequence."""
+        mock_imap.return_value.capabilities = ('IMAP4REV1', 'ENABLE', 'CONDSTORE', 'QRESYNC')
+        responses = {'ENABLED': ['ENABLED', [b'CONDSTORE QRESYNC']],
+                     'VANISHED': ['VANISHED', [b'(EARLIER) 7']]}
+        mock_imap.return_value.response.side_effect = \
+            lambda code: responses.get(code, [code, [None]])
+        mock_imap.return_value._simple_command.return_value = ['OK', [b'Enabled']]
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        mock_imap.return_value._simple_command.assert_called_once_with(
+            'ENABLE', 'CONDSTORE', 'QRESYNC')
+        self.assertEqual(self.library._extensions, ('CONDSTORE', 'QRESYNC'))
+        self.library._imap.select.side_effect = [['OK', [b'2']], ['OK', [b'1']]]
+        envelope = b'%d (UID %d FLAGS () MODSEQ (%d) ENVELOPE (NIL "%s" NIL NIL NIL NIL NIL ' \
+            b'NIL NIL NIL))'
+        self.library._imap.uid.side_effect = [
+            ['OK', [envelope % (1, 7, 5, b'Welcome'), envelope % (2, 9, 6, b'Receipt')]],
+            ['OK', [envelope % (1, 9, 6, b'Receipt')]],
+            ['OK', [None]]]
+        self.assertEqual(self.library.search_emails(subject='receipt'), ['2'])
+        self.assertEqual(self.library.search_emails(subject='receipt'), ['1'])
+        self.assertEqual(self.library._imap.uid.call_args_list[-1], mock.call(
+            'FETCH', '1:9', '(UID FLAGS MODSEQ)', '(CHANGEDSINCE 6 VANISHED)'))
+        self.assertFalse(self.library._imap.fetch.called)
+
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_serve_emails_from_disk_cache(self, mock_imap):
+        """Fetch emails should only fetch UIDs of email messages cached on disk."""
+        directory = mkdtemp()
+        try:
+            cache_path = os.path.join(directory, 'mail.db')
+            self.library.open_mailbox(host=self.server, user=self.username,
+                                      password=self.password, cache_path=cache_path)
+            self.library._uidvalidity = 7
+            self.library._imap.fetch.return_value = [
+                'OK', [(b'1 (UID 9 RFC822 {14}', b'Subject: hi\r\n\r\n'), b')']]
+            self.library.fetch_emails(['1'])
+            library = ImapLibrary()
+            library.open_mailbox(host=self.server, user=self.username,
+                                 password=self.password, cache_path=cache_path)
+            library._uidvalidity = 7
+            library._imap.fetch.reset_mock()
+            library._imap.fetch.return_value = ['OK', [b'1 (UID 9)']]
+            messages = library.fetch_emails(['1'])
+            self.assertEqual(messages[0]['Subject'], 'hi')
+            library._imap.fetch.assert_called_once_with('1', '(UID)')
+            library.clear_mail_cache()
+            self.assertEqual(library._cache.statistics()['disk']['messages'], 0)
+            library._cache.store.close()
+            self.library._cache.store.close()
+        finally:
+            rmtree(directory)
+
+    def test_should_compress_email_indexes_into_sequence_sets(self):
+        """Compress email indexes into chunked IMAP sequence sets."""
+        indexes = [b'90', b'1', b'2', b'3', b'72', b'4', '5', 6, b'2']
+        self.assertEqual(self.library._sequence_sets(indexes, 50), ['1:6,72,90'])
+        self.assertEqual(self.library._sequence_sets(indexes, 3), ['1:3', '4:6', '72,90'])
+        self.assertEqual(self.library._sequence_sets([], 3), [])
+
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_fetch_emails_in_chunks(self, mock_imap):
+        """Fetch found email messages with one FETCH command per chunk."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        self.library._mails = [b'1', b'2', b'5']
+        self.library._imap.fetch.side_effect = [
+            ['OK', [(b'1 (UID 11 RFC822 {20}', b'Subject: one\r\n\r\nbody'), b')',
+                    (b'2 (RFC822 {20}', b'Subject: two\r\n\r\nbody'), b' UID 12)']],
+            ['OK', [(b'5 (UID 15 RFC822 {21}', b'Subject: five\r\n\r\nbody'), b')']]]
+        messages = self.library.fetch_emails(chunk_size=2)
+        self.assertEqual(self.library._imap.fetch.call_args_list,
+                         [mock.call('1:2', '(UID RFC822)'), mock.call('5', '(UID RFC822)')])
+        self.assertEqual([msg['Subject'] for msg in messages], ['one', 'two', 'five'])
+
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_raise_exception_on_fetch_error(self, mock_imap):
+        """Raise exception on imap fetch error."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        self.library._imap.fetch.return_value = ['NO', [b'failed']]
+        with self.assertRaises(Exception):
+            self.library.fetch_emails(['1'])
+
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_delete_all_emails_with_sequence_sets(self, mock_imap):
+        """Delete all emails with one STORE command per sequence set."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        self.library._mails = [b'1', b'2', b'3', b'7']
+        self.library.delete_all_emails()
+        self.library._imap.store.assert_called_once_with('1:3,7', '+FLAGS', r'\DELETED')
+        self.library._imap.expunge.assert_called_once_with()
+        self.assertEqual(self.library._mails, [])
+
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_delete_all_emails_with_uid_expunge(self, mock_imap):
+        """Delete all emails with UID EXPUNGE when UIDPLUS is supported."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        self.library._imap.capabilities = ('IMAP4REV1', 'UIDPLUS')
+        self.library._imap.fetch.return_value = ['OK', [b'1 (UID 11)', b'2 (UID 12)']]
+        self.library._mails = [b'1', b'2']
+        self.library.delete_all_emails()
+        self.library._imap.fetch.assert_called_once_with('1:2', '(UID)')
+        self.assertEqual(self.library._imap.uid.call_args_list,
+                         [mock.call('STORE', '11:12', '+FLAGS', r'\DELETED'),
+                          mock.call('EXPUNGE', '11:12')])
+        self.assertFalse(self.library._imap.expunge.called)
+
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_move_all_emails_to_trash(self, mock_imap):
+        """Move all emails to trash folder when MOVE is supported."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        self.library._imap.capabilities = ('IMAP4REV1', 'MOVE')
+        self.library._imap._simple_command.return_value = ['OK', [b'']]
+        self.library.STORE_CHUNK_SIZE = 2
+        self.library._mails = [b'1', b'2', b'3']
+        self.library.delete_all_emails(trash='Deleted Items')
+        self.assertEqual(self.library._imap._simple_command.call_args_list,
+                         [mock.call('MOVE', '3', '"Deleted Items"'),
+                          mock.call('MOVE', '1:2', '"Deleted Items"')])
+        self.assertFalse(self.library._imap.store.called)
+
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_copy_and_delete_email_to_trash(self, mock_imap):
+        """Copy and delete email when MOVE is not supported."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        self.library._imap.copy.return_value = ['OK', [b'']]
+        self.library.delete_email('4', trash='Trash')
+        self.library._imap.copy.assert_called_once_with('4', '"Trash"')
+        self.library._imap.store.assert_called_with('4', '+FLAGS', r'\DELETED')
+        self.library._imap.expunge.assert_called_with()
+
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_mark_all_emails_as_read_with_sequence_sets(self, mock_imap):
+        """Mark all emails as read with one STORE command per sequence set."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        self.library.STORE_CHUNK_SIZE = 2
+        self.library._mails = [b'1', b'2', b'3', b'9']
+        self.library.mark_all_emails_as_read()
+        self.assertEqual(self.library._imap.store.call_args_list,
+                         [mock.call('1:2', '+FLAGS', r'\SEEN'),
+                          mock.call('3,9', '+FLAGS', r'\SEEN')])
+
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_reuse_cached_email_message(self, mock_imap):
+        """Fetch email message once for body, links, matches and multipart keywords."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        self.library._uidvalidity = 7
+        raw = (b'Subject: hello\r\nContent-Type: text/html\r\n\r\n'
+               b'<a href=3D"http://domain.com/confirm">confirm</a> code 1234')
+        self.library._imap.fetch.return_value = ['OK', [(b'3 (UID 30 RFC822 {%d}' % len(raw),
+                                                          raw), b')']]
+        links = self.library.get_links_from_email('3')
+        matches = self.library.get_matches_from_email('3', r'code (\d+)')
+        self.library.walk_multipart_email('3')
+        self.assertEqual(self.library.get_multipart_content_type(), 'text/html')
+        self.library._imap.fetch.assert_called_once_with('3', '(UID RFC822)')
+        self.assertEqual(links, ['http://domain.com/confirm'])
+        self.assertEqual(matches, ['1234'])
+        self.assertEqual(self.library._cache.hits, 2)
+        self.assertEqual(self.library._cache.misses, 1)
+        statistics = self.library.get_imap_statistics()
+        self.assertEqual((statistics['total']['cache_hits'], statistics['total']['cache_misses']),
+                         (2, 1))
+
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_return_link_details_from_email(self, mock_imap):
+        """Returns links with their anchor text and email message part index."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        self.library._uidvalidity = 7
+        raw = (b'Content-Type: multipart/alternative; boundary="b"\r\n\r\n'
+               b'--b\r\nContent-Type: text/plain\r\n\r\nhref=http://domain.com/plain\r\n'
+               b'--b\r\nContent-Type: text/html\r\n\r\n'
+               b'<a href="http://domain.com/confirm"><b>Confirm</b></a>\r\n--b--\r\n')
+        self.library._imap.fetch.return_value = ['OK', [(b'3 (UID 30 RFC822 {%d}' % len(raw),
+                                                          raw), b')']]
+        self.assertEqual(self.library.get_links_from_email('3', details=True), [
+            {'part': 1, 'text': None, 'url': 'http://domain.com/plain'},
+            {'part': 2, 'text': 'Confirm', 'url': 'http://domain.com/confirm'}])
+        for _ in range(3):
+            self.library.walk_multipart_email('3')
+        self.assertEqual(self.library.get_links_from_email('3'), ['http://domain.com/confirm'])
+
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_get_email_part_by_index(self, mock_imap):
+        """Get part payload should return any part of one fetched email message."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        self.library._uidvalidity = 7
+        raw = (b'Content-Type: multipart/mixed; boundary="b"\r\n\r\n'
+               b'--b\r\nContent-Type: text/plain\r\n\r\nplain\r\n'
+               b'--b\r\nContent-Type: text/html; charset=utf-8\r\n'
+               b'Content-Transfer-Encoding: base64\r\n\r\nPHA+aHRtbDwvcD4=\r\n--b--\r\n')
+        self.library._imap.fetch.return_value = ['OK', [(b'3 (UID 30 RFC822 {%d}' % len(raw),
+                                                          raw), b')']]
+        parts = self.library.get_email_parts('3')
+        self.assertEqual([(part['index'], part['path'], part['content_type'])
+                          for part in parts],
+                         [(0, '', 'multipart/mixed'), (1, '1', 'text/plain'),
+                          (2, '2', 'text/html')])
+        index = self.library.find_part('3', content_type='text/html')
+        self.assertEqual(self.library.get_part_payload('3', index, decode=True), u'<p>html</p>')
+        self.assertEqual(self.library.get_part_payload('3', '2', start=0, length=4), 'PHA+')
+        self.library._imap.fetch.assert_called_once_with('3', '(UID RFC822)')
+        with self.assertRaises(AssertionError):
+            self.library.find_part('3', content_type='image/*')
+        with self.assertRaises(AssertionError):
+            self.library.get_part_payload('3', 3)
+
+    @mock.patch('ImapLibrary.HTTP_POOL')
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_open_all_links_from_email(self, mock_imap, mock_pool):
+        """Open all links from email should open each link on the HTTP pool."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        self.library._uidvalidity = 7
+        raw = (b'Content-Type: text/html\r\n\r\n<a href="http://domain.com/1">one</a>'
+               b'<a href="http://domain.com/2">two</a>')
+        self.library._imap.fetch.return_value = ['OK', [(b'3 (UID 30 RFC822 {%d}' % len(raw),
+                                                          raw), b')']]
+        mock_pool.open.side_effect = lambda url, **kwargs: mock.Mock(
+            error=None, status=200 if url.endswith('1') else 404, body=url,
+            to_dict=lambda: {'url': url, 'error': None, 'status': 200, 'bytes': 1,
+                             'latency': 0.1})
+        results = self.library.open_all_links_from_email('3', timeout='5', workers=2)
+        self.assertEqual([result['url'] for result in results],
+                         ['http://domain.com/1', 'http://domain.com/2'])
+        mock_pool.open.assert_any_call('http://domain.com/2', timeout=5.0,
+                                       max_bytes=self.library.LINK_MAX_BYTES)
+        self.assertEqual(self.library.open_link_from_email('3'), 'http://domain.com/1')
+        with self.assertRaises(AssertionError):
+            self.library.open_link_from_email('3', 1)
+
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_invalidate_cached_email_message_on_delete(self, mock_imap):
+        """Invalidate cached email message once it is deleted."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        self.library._uidvalidity = 7
+        raw = b'Subject: hello\r\n\r\nbody'
+        self.library._imap.fetch.return_value = ['OK', [(b'3 (UID 30 RFC822 {%d}' % len(raw),
+                                                          raw), b')']]
+        self.library.get_email_body('3')
+        self.assertEqual(len(self.library._cache), 1)
+        self.library.delete_email('3')
+        self.assertEqual(len(self.library._cache), 0)
+        self.assertEqual(self.library._uids, {})
+
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_walk_multipart_email_lazily(self, mock_imap):
+        """Fetch only headers and structure, then the requested part payload."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        self.library._imap.capabilities = ('IMAP4REV1',)
+        self.library._imap.fetch.return_value = ['OK', [
+            (b'1 (UID 9 BODY[HEADER] {16}', b'Subject: hello\r\n'),
+            b' BODYSTRUCTURE (("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "BASE64" 8 1 NIL NIL'
+            b' NIL NIL)("APPLICATION" "PDF" NIL NIL NIL "BASE64" 9000 NIL NIL NIL NIL)'
+            b' "MIXED" ("BOUNDARY" "b0") NIL NIL NIL))']]
+        self.library._imap.uid.return_value = ['OK', [(b'1 (UID 9 BODY[1] {8}', b'aGVsbG8='), b')']]
+        self.assertEqual(self.library.walk_multipart_email('1', lazy=True), 2)
+        self.library._imap.fetch.assert_called_once_with(
+            '1', '(UID BODY.PEEK[HEADER] BODYSTRUCTURE)')
+        self.assertEqual(self.library.get_multipart_field('Subject'), 'hello')
+        self.assertEqual(self.library.get_multipart_content_type(), 'multipart/mixed')
+        self.library.walk_multipart_email('1')
+        self.assertEqual(self.library.get_multipart_payload(decode=True), 'hello')
+        self.library._imap.uid.assert_called_once_with('FETCH', '9', '(BODY.PEEK[1])')
+        self.library.walk_multipart_email('1')
+        self.library._imap.uid.return_value = ['OK', [(b'1 (UID 9 BODY[2]<100> {4}', b'AAAA'),
+                                                      b')']]
+        self.assertEqual(self.library.get_multipart_payload(start=100, length=4), b'AAAA')
+        self.library._imap.uid.assert_called_with('FETCH', '9', '(BODY.PEEK[2]<100.4>)')
+
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_extract_links_during_lazy_walk(self, mock_imap):
+        """Links and matches of the current lazily fetched part should be extracted."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        self.library._imap.capabilities = ('IMAP4REV1',)
+        self.library._imap.fetch.return_value = ['OK', [
+            (b'1 (UID 9 BODY[HEADER] {16}', b'Subject: hello\r\n'),
+            b' BODYSTRUCTURE (("TEXT" "HTML" ("CHARSET" "utf-8") NIL NIL "QUOTED-PRINTABLE" 50'
+            b' 1 NIL NIL NIL NIL) "ALTERNATIVE" ("BOUNDARY" "b0") NIL NIL NIL))']]
+        html = b'<a href=3D"http://domain.com/confirm">confirm</a> code 1234'
+        self.library._imap.uid.return_value = ['OK', [(b'1 (UID 9 BODY[1] {%d}' % len(html),
+                                                       html), b')']]
+        self.library.walk_multipart_email('1', lazy=True)
+        self.assertEqual(self.library.get_links_from_email('1'), [])
+        self.library.walk_multipart_email('1')
+        self.assertEqual(self.library.get_links_from_email('1'), ['http://domain.com/confirm'])
+        self.assertEqual(self.library.get_matches_from_email('1', r'code (\d+)'), ['1234'])
+        self.library._imap.uid.assert_called_once_with('FETCH', '9', '(BODY.PEEK[1])')
+
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_save_attachment_in_chunks(self, mock_imap):
+        """Save attachment decoded from chunked partial fetches."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        self.library._imap.capabilities = ('IMAP4REV1',)
+        self.library._imap.fetch.return_value = ['OK', [
+            (b'1 (UID 9 BODY[HEADER] {16}', b'Subject: hello\r\n'),
+            b' BODYSTRUCTURE (("TEXT" "PLAIN" NIL NIL NIL "7BIT" 5 1 NIL NIL NIL NIL)'
+            b'("APPLICATION" "PDF" NIL NIL NIL "BASE64" 18 NIL ("ATTACHMENT" ("FILENAME"'
+            b' "doc.pdf")) NIL NIL) "MIXED" ("BOUNDARY" "b0") NIL NIL NIL))']]
+        encoded = b'aGVsbG8g\r\nd29ybGQ=\r\n'
+        self.library._imap.uid.side_effect = [
+            ['OK', [(b'1 (UID 9 BODY[2]<%d> {%d}' % (pos, len(encoded[pos:pos + 7])),
+                     encoded[pos:pos + 7]), b')']] for pos in (0, 7, 14, 20)]
+        directory = mkdtemp()
+        try:
+            result = self.library.save_attachment('1', directory, chunk_size=7)
+            with open(result['path'], 'rb') as reader:
+                self.assertEqual(reader.read(), b'hello world')
+        finally:
+            rmtree(directory)
+        self.assertEqual(result['path'], os.path.join(directory, 'doc.pdf'))
+        self.assertEqual(result['size'], 11)
+        self.assertEqual(result['digest'], hashlib.sha256(b'hello world').hexdigest())
+        self.library._imap.uid.assert_called_with('FETCH', '9', '(BODY.PEEK[2]<20.7>)')
+
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_raise_exception_on_missing_attachment(self, mock_imap):
+        """Raise exception when the attachment is not found."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        self.library._imap.fetch.return_value = ['OK', [
+            b'1 (UID 9 BODYSTRUCTURE ("TEXT" "PLAIN" NIL NIL NIL "7BIT" 5 1 NIL NIL NIL NIL))']]
+        with self.assertRaises(AssertionError):
+            self.library.save_attachment('1', 'unused', filename='doc.pdf')
+
+    @mock.patch('ImapLibrary.ENGINE')
+    @mock.patch('ImapLibrary.IMAP4_SSL')
+    def test_should_wait_for_email_in_folders(self, mock_imap, mock_engine):
+        """Wait for email in folders should watch the folders with the opened account."""
+        self.library.open_mailbox(host=self.server, user=self.username,
+                                  password=self.password)
+        mock_engine.run.return_value = {'Spam': b'2'}
+        found = self.library.wait_for_email_in_folders('INBOX, Spam', sender=self.sender,
+                                                       connections='2', timeout='5')
+        self.assertEqual(found, {'Spam': b'2'})
+        mock_engine.wait_for_email.assert_called_with(
+            (self.server, self.port_secure, self.username, self.password, True),
+            ['INBOX', 'Spam'], ['FROM', '"%s"' % self.sender], connections=2,
+            poll_frequency=10.0, timeout=5, wait_all=False)
+        mock_engine.run.return_value = {'Spam': b'2'}
+        with self.assertRaises(AssertionError):
+            self.library.wait_for_email_in_folders(['INBOX', 'Spam'], mode='all')
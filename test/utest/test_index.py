@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright 2015-2016 Richard Huang <rickypc@users.noreply.github.com>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+IMAP Library - a IMAP email testing library.
+"""
+
+from datetime import date
+from sys import path
+path.append('src')
+from ImapLibrary.index import IndexQuery, MailboxIndex
+from ImapLibrary.response import parse_fetch
+import unittest
+
+FETCH = [
+    b'1 (UID 10 FLAGS (\\Seen) RFC822.SIZE 1200 ENVELOPE ("Mon, 01 Jan 2024 10:00:00 +0000" '
+    b'"Order 42" (("Shop" NIL "noreply" "shop.com")) NIL NIL (("Me" NIL "me" "domain.com")) '
+    b'NIL NIL NIL "<1@shop.com>") BODYSTRUCTURE (("TEXT" "PLAIN" ("CHARSET" "UTF-8") NIL NIL '
+    b'"7BIT" 5 1 NIL NIL NIL NIL)("APPLICATION" "PDF" ("NAME" "invoice.pdf") NIL NIL "BASE64" '
+    b'400 NIL ("ATTACHMENT" ("FILENAME" "invoice.pdf")) NIL NIL) "MIXED" NIL NIL NIL NIL))',
+    b'2 (UID 11 FLAGS () RFC822.SIZE 300 ENVELOPE ("Tue, 02 Jan 2024 10:00:00 +0000" '
+    b'"=?utf-8?q?Caf=C3=A9?=" ((NIL NIL "news" "other.org")) NIL NIL ((NIL NIL "me" '
+    b'"domain.com")) (("Boss" NIL "boss" "domain.com")) NIL NIL "<2@other.org>") '
+    b'BODYSTRUCTURE ("TEXT" "PLAIN" ("CHARSET" "UTF-8") NIL NIL "7BIT" 5 1 NIL NIL NIL NIL))']
+
+
+class MailboxIndexTests(unittest.TestCase):
+    """Local mailbox index test class."""
+
+    def setUp(self):
+        """Instantiate the local mailbox index with two email messages."""
+        self.index = MailboxIndex()
+        for number, items in parse_fetch(FETCH):
+            self.index.add(number, items)
+
+    def _search(self, **kwargs):
+        """Returns the UIDs matching given filters."""
+        return [entry.uid for entry in self.index.search(IndexQuery(**kwargs))]
+
+    def test_should_index_envelope_and_structure(self):
+        """Index should keep the envelope, flags, size and attachments."""
+        first, second = self.index.search(IndexQuery(status='ALL'))
+        self.assertEqual(first.sender, ['Shop <noreply@shop.com>'])
+        self.assertEqual(first.attachments, ['invoice.pdf'])
+        self.assertEqual(first.content_type, 'multipart/mixed')
+        self.assertEqual(first.date, date(2024, 1, 1))
+        self.assertEqual(first.flags, ('\\SEEN',))
+        self.assertEqual(second.subject, u'Caf\xe9')
+        self.assertEqual(second.cc, ['Boss <boss@domain.com>'])
+        self.assertEqual(self.index.last_uid, 11)
+
+    def test_should_filter_in_memory(self):
+        """Index should filter by headers, regular expressions, dates and sizes."""
+        self.assertEqual(self._search(), [11])
+        self.assertEqual(self._search(sender='SHOP.com'), [10])
+        self.assertEqual(self._search(recipient='boss@'), [11])
+        self.assertEqual(self._search(subject_regex=r'^Order \d+$'), [10])
+        self.assertEqual(self._search(since='2024-01-02'), [11])
+        self.assertEqual(self._search(before='02-Jan-2024'), [10])
+        self.assertEqual(self._search(larger=500, attachment='.pdf'), [10])
+        self.assertEqual(self._search(status='seen', smaller=5000), [10])
+        with self.assertRaises(ValueError):
+            IndexQuery(text='body')
+
+    def test_should_renumber_after_removal(self):
+        """Index should renumber email messages and drop the removed ones."""
+        self.index.stale = True
+        self.index.renumber(parse_fetch([b'1 (UID 11 FLAGS (\\Seen))']))
+        entries = self.index.search(IndexQuery(status='ALL'))
+        self.assertEqual([(entry.uid, entry.number, entry.flags) for entry in entries],
+                         [(11, 1, ('\\SEEN',))])
+        self.assertFalse(self.index.stale)
+
+
+    def test_should_resync_changed_and_vanished_email_messages(self):
+        """Index should update changed flags, drop vanished UIDs and keep the highest MODSEQ."""
+        self.index.resync(parse_fetch([b'2 (UID 11 FLAGS (\\Flagged) MODSEQ (42))']),
+                          [b'(EARLIER) 3:10'])
+        entries = self.index.search(IndexQuery(status='ALL'))
+        self.assertEqual([(entry.uid, entry.number, entry.flags) for entry in entries],
+                         [(11, 1, ('\\FLAGGED',))])
+        self.assertEqual(self.index.modseq, 42)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright 2015-2016 Richard Huang <rickypc@users.noreply.github.com>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+IMAP Library - a IMAP email testing library.
+"""
+
+from email import message_from_string
+from sys import path
+path.append('src')
+from ImapLibrary.parts import LazyMessage, PartIndex, TransferDecoder, decode_transfer, \
+    parse_bodystructure
+from ImapLibrary.response import parse
+import mock
+import unittest
+
+BODYSTRUCTURE = (b'((("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 10 1 NIL NIL NIL NIL)'
+                 b'("TEXT" "HTML" ("CHARSET" "utf-8") NIL NIL "BASE64" 20 1 NIL NIL NIL NIL)'
+                 b' "ALTERNATIVE" ("BOUNDARY" "b1") NIL NIL NIL)'
+                 b'("APPLICATION" "PDF" ("NAME" "a.pdf") NIL NIL "BASE64" 3000 NIL'
+                 b' ("ATTACHMENT" ("FILENAME" "doc.pdf")) NIL NIL)'
+                 b' "MIXED" ("BOUNDARY" "b0") NIL NIL NIL)')
+
+
+class PartTests(unittest.TestCase):
+    """Email message part test class."""
+
+    def setUp(self):
+        """Parse the email message structure."""
+        self.loader = mock.Mock(return_value=b'payload')
+        self.root = parse_bodystructure(parse([BODYSTRUCTURE])[0], self.loader)
+
+    def test_should_describe_part_tree(self):
+        """Describe all parts in walk order with their IMAP part paths."""
+        parts = list(self.root.walk())
+        self.assertEqual([(part.path, part.get_content_type()) for part in parts], [
+            ('', 'multipart/mixed'), ('1', 'multipart/alternative'), ('1.1', 'text/plain'),
+            ('1.2', 'text/html'), ('2', 'application/pdf')])
+        self.assertEqual(parts[3].get_content_charset(), 'utf-8')
+        self.assertEqual(parts[3].encoding, 'base64')
+        self.assertEqual(parts[4].disposition, 'attachment')
+        self.assertEqual(parts[4].get_filename(), 'doc.pdf')
+        self.assertEqual(parts[4].size, 3000)
+
+    def test_should_index_parsed_email_message_like_bodystructure(self):
+        """Index parsed email message parts with the same descriptors as BODYSTRUCTURE."""
+        message = message_from_string(
+            'Content-Type: multipart/mixed; boundary="b0"\n\n'
+            '--b0\nContent-Type: multipart/alternative; boundary="b1"\n\n'
+            '--b1\nContent-Type: text/plain; charset=utf-8\n\nplain text\n'
+            '--b1\nContent-Type: text/html; charset=utf-8\nContent-Transfer-Encoding: base64\n\n'
+            'PHA+aHRtbDwvcD4=\n--b1--\n'
+            '--b0\nContent-Type: application/pdf; name=a.pdf\nContent-Transfer-Encoding: base64\n'
+            'Content-Disposition: attachment; filename=doc.pdf\n\nMTIz\n--b0--\n')
+        parts = PartIndex(message)
+        lazy_parts = PartIndex(LazyMessage(None, self.root))
+        self.assertEqual([(part.path, part.content_type, part.get_content_charset(),
+                           part.encoding, part.disposition, part.filename)
+                          for part in parts.descriptors],
+                         [(part.path, part.content_type, part.get_content_charset(),
+                           part.encoding, part.disposition, part.get_filename())
+                          for part in lazy_parts.descriptors])
+        self.assertEqual(parts.descriptors[2].size, len('plain text'))
+        self.assertIs(parts.parts[3], message.get_payload(0).get_payload(1))
+        self.assertIs(lazy_parts.parts[3], lazy_parts.descriptors[3])
+        self.assertEqual(parts.find(content_type='TEXT/*'), 2)
+        self.assertEqual(parts.find(filename='*.pdf', disposition='Attachment'), 4)
+        self.assertIsNone(parts.find(content_type='image/*'))
+
+    def test_should_load_payload_once(self):
+        """Load part payload on demand and only once."""
+        part = self.root.get_payload(1)
+        self.assertFalse(self.loader.called)
+        self.assertEqual(part.get_payload(decode=True), b'payload')
+        self.assertEqual(part.get_payload(decode=True), b'payload')
+        self.loader.assert_called_once_with(part, True, None, None)
+        part.get_payload(start=10, length=5)
+        self.loader.assert_called_with(part, False, 10, 5)
+
+    def test_should_number_single_part_body(self):
+        """Number single part email message body as part 1."""
+        root = parse_bodystructure(parse([b'("TEXT" "PLAIN" NIL NIL NIL "7BIT" 4 1)'])[0])
+        self.assertEqual(root.path, '1')
+        self.assertFalse(root.is_multipart())
+
+    def test_should_decode_content_transfer_encoding(self):
+        """Decode base64 and quoted-printable payloads."""
+        self.assertEqual(decode_transfer(b'aGVs\r\nbG8=\r\n', 'BASE64'), b'hello')
+        self.assertEqual(decode_transfer(b'a=3Db=\r\nc', 'quoted-printable'), b'a=bc')
+        self.assertEqual(decode_transfer(b'plain', '7bit'), b'plain')
+
+    def test_should_decode_chunks_incrementally(self):
+        """Decode payload chunks split at arbitrary offsets."""
+        for encoded, encoding in ((b'aGVsbG8g\r\nd29ybGQ=\r\n', 'base64'),
+                                  (b'hello =\r\nw=6Frld\r\n', 'quoted-printable')):
+            for size in range(1, len(encoded) + 1):
+                decoder = TransferDecoder(encoding)
+                decoded = b''.join(decoder.decode(encoded[pos:pos + size])
+                                   for pos in range(0, len(encoded), size))
+                self.assertEqual((decoded + decoder.flush()).strip(), b'hello world')
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright 2015-2016 Richard Huang <rickypc@users.noreply.github.com>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+IMAP Library - a IMAP email testing library.
+"""
+
+from sys import path
+path.append('src')
+from imaplib import IMAP4
+from ImapLibrary.pipeline import Pipeline
+import mock
+import unittest
+
+
+class PipelineTests(unittest.TestCase):
+    """Pipelined IMAP commands test class."""
+
+    def setUp(self):
+        """Instantiate mocked imaplib session."""
+        self.imap = mock.Mock()
+        self.imap.abort = IMAP4.abort
+        self.imap.error = IMAP4.error
+        self.imap._command.side_effect = ['A1', 'A2', 'A3']
+        self.imap.untagged_responses = {}
+
+    def test_should_send_all_commands_before_reading_responses(self):
+        """Pipeline should send every command before reading the first response."""
+        events = []
+        self.imap._command.side_effect = lambda name, *args: events.append(name) or name
+        def complete(name, tag):
+            events.append('complete %s' % tag)
+            self.imap.untagged_responses = {'EXISTS': [b'4']} if name == 'SELECT' else {}
+            return 'OK', [b'done']
+        self.imap._command_complete.side_effect = complete
+        self.imap._untagged_response.return_value = ('OK', [b'1 2'])
+        results = Pipeline(self.imap).execute(('select', ()), ('search', (None, 'UNSEEN')))
+        self.assertEqual(events, ['SELECT', 'SEARCH', 'complete SELECT', 'complete SEARCH'])
+        self.assertEqual(results, [('OK', [b'4']), ('OK', [b'1 2'])])
+        self.assertEqual(self.imap.state, 'SELECTED')
+        self.imap._command.assert_any_call('SELECT', 'INBOX')
+        self.imap._untagged_response.assert_called_with('OK', [b'done'], 'SEARCH')
+
+    def test_should_map_imaplib_methods_to_commands(self):
+        """Pipeline should send the same commands as imaplib methods."""
+        self.imap._command_complete.return_value = ('OK', [None])
+        Pipeline(self.imap).execute(('search', ('UTF-8', 'TEXT', 'x')),
+                                    ('uid', ('fetch', '9', '(UID)')),
+                                    ('store', ('1:3', '+FLAGS', r'\SEEN')))
+        self.assertEqual(self.imap._command.call_args_list, [
+            mock.call('SEARCH', 'CHARSET', 'UTF-8', 'TEXT', 'x'),
+            mock.call('UID', 'FETCH', '9', '(UID)'),
+            mock.call('STORE', '1:3', '+FLAGS', r'\SEEN')])
+        self.assertEqual([call[0][2] for call in self.imap._untagged_response.call_args_list],
+                         ['SEARCH', 'FETCH', 'FETCH'])
+
+    def test_should_read_all_responses_before_raising_error(self):
+        """Pipeline should read every response before raising a command error."""
+        self.imap._command_complete.side_effect = [
+            ('OK', [None]), IMAP4.error('BAD'), ('OK', [None])]
+        with self.assertRaises(IMAP4.error):
+            Pipeline(self.imap).execute(*[('fetch', ('%d' % i, '(UID)')) for i in range(3)])
+        self.assertEqual(self.imap._command_complete.call_count, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright 2015-2016 Richard Huang <rickypc@users.noreply.github.com>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+IMAP Library - a IMAP email testing library.
+"""
+
+from sys import path
+path.append('src')
+from imaplib import IMAP4
+from ImapLibrary.pool import ConnectionPool
+import mock
+import unittest
+
+
+class ConnectionPoolTests(unittest.TestCase):
+    """Connection pool test class."""
+
+    def setUp(self):
+        """Instantiate the connection pool class."""
+        self.key = ('my.imap', 993, 'username', True)
+        self.pool = ConnectionPool(max_size=2, idle_timeout=60)
+
+    @staticmethod
+    def _session(noop='OK'):
+        """Returns mocked IMAP session."""
+        imap = mock.Mock()
+        imap.noop.return_value = (noop, [b''])
+        return imap
+
+    def test_should_return_none_on_empty_pool(self):
+        """Returns None when there is no idle session."""
+        self.assertIsNone(self.pool.acquire(self.key))
+
+    def test_should_reuse_released_session(self):
+        """Returns healthy released session of the same key."""
+        imap = self._session()
+        self.pool.release(self.key, imap)
+        self.assertIsNone(self.pool.acquire(('other.imap', 993, 'username', True)))
+        self.assertIs(self.pool.acquire(self.key), imap)
+        imap.noop.assert_called_with()
+        self.assertEqual(len(self.pool), 0)
+
+    def test_should_discard_unhealthy_session(self):
+        """Logout and discard session failing the health check."""
+        broken = self._session()
+        broken.noop.side_effect = IMAP4.abort('socket error: EOF')
+        self.pool.release(self.key, broken)
+        self.assertIsNone(self.pool.acquire(self.key))
+        broken.logout.assert_called_with()
+
+    def test_should_evict_oldest_session_over_max_size(self):
+        """Logout oldest session when the pool is full."""
+        sessions = [self._session() for _ in range(3)]
+        for imap in sessions:
+            self.pool.release(self.key, imap)
+        self.assertEqual(len(self.pool), 2)
+        sessions[0].logout.assert_called_with()
+        self.assertFalse(sessions[2].logout.called)
+
+    @mock.patch('ImapLibrary.pool.time')
+    def test_should_evict_expired_session(self, mock_time):
+        """Logout session idle for longer than idle timeout."""
+        imap = self._session()
+        mock_time.return_value = 100
+        self.pool.release(self.key, imap)
+        mock_time.return_value = 161
+        self.assertIsNone(self.pool.acquire(self.key))
+        imap.logout.assert_called_with()
+
+    def test_should_logout_all_sessions_on_clear(self):
+        """Logout all idle sessions on clear."""
+        sessions = [self._session() for _ in range(2)]
+        for imap in sessions:
+            self.pool.release(self.key, imap)
+        self.pool.clear()
+        self.assertEqual(len(self.pool), 0)
+        for imap in sessions:
+            imap.logout.assert_called_with()
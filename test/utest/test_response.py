@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright 2015-2016 Richard Huang <rickypc@users.noreply.github.com>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+IMAP Library - a IMAP email testing library.
+"""
+
+from sys import path
+path.append('src')
+from ImapLibrary.response import parse, parse_fetch
+import unittest
+
+
+class ResponseParserTests(unittest.TestCase):
+    """IMAP response parser test class."""
+
+    def test_should_parse_nested_lists(self):
+        """Parse nested lists, quoted strings, and NIL."""
+        self.assertEqual(parse([b'(("a b" NIL) x\\Seen "q\\"uote")']),
+                         [[[b'a b', None], b'x\\Seen', b'q"uote']])
+
+    def test_should_parse_fetch_responses_with_literals(self):
+        """Parse FETCH responses with literals split by imaplib."""
+        data = [(b'1 (UID 11 BODY[HEADER] {12}', b'Subject: a\r\n'),
+                (b' BODY[2]<0> {3}', b'abc'), b' FLAGS (\\Seen))',
+                b'2 (UID 12 FLAGS ())']
+        self.assertEqual(parse_fetch(data), [
+            (1, {'UID': b'11', 'BODY[HEADER]': b'Subject: a\r\n', 'BODY[2]<0>': b'abc',
+                 'FLAGS': [b'\\Seen']}),
+            (2, {'UID': b'12', 'FLAGS': []})])
+
+    def test_should_parse_section_with_header_fields(self):
+        """Parse FETCH item name with spaces inside its section."""
+        data = [(b'3 (BODY[HEADER.FIELDS (FROM TO)] {4}', b'x\r\n\r'), b')']
+        self.assertEqual(parse_fetch(data), [(3, {'BODY[HEADER.FIELDS (FROM TO)]': b'x\r\n\r'})])
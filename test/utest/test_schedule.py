@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright 2015-2016 Richard Huang <rickypc@users.noreply.github.com>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+IMAP Library - a IMAP email testing library.
+"""
+
+from itertools import islice
+from sys import path
+path.append('src')
+from ImapLibrary.schedule import PollSchedule
+import unittest
+
+
+class PollScheduleTests(unittest.TestCase):
+    """Poll schedule test class."""
+
+    def test_should_keep_fixed_delay_by_default(self):
+        """Poll schedule should keep the initial delay without backoff."""
+        self.assertEqual(list(islice(PollSchedule(5).delays(), 3)), [5, 5, 5])
+
+    def test_should_backoff_exponentially_up_to_maximum(self):
+        """Poll schedule should grow the delay exponentially up to its maximum."""
+        delays = PollSchedule(1, backoff=2, maximum=10).delays()
+        self.assertEqual(list(islice(delays, 6)), [1, 2, 4, 8, 10, 10])
+
+    def test_should_add_random_jitter(self):
+        """Poll schedule should add random jitter within its fraction of the delay."""
+        delays = list(islice(PollSchedule(10, jitter=0.5).delays(), 50))
+        self.assertTrue(all(5 <= delay <= 15 for delay in delays))
+        self.assertGreater(len(set(delays)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright 2015-2016 Richard Huang <rickypc@users.noreply.github.com>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+IMAP Library - a IMAP email testing library.
+"""
+
+from imaplib import IMAP4
+from sys import path
+path.append('src')
+from ImapLibrary.stats import ImapStatistics, StatisticsListener, instrument
+import unittest
+
+
+class Session(IMAP4):
+    """An imaplib session replaying a canned response without a connection."""
+
+    def __init__(self):
+        self.sent = []
+
+    def _command(self, name, *args):
+        self.send(b'A1 ' + name.encode('ascii') + b'\r\n')
+        return b'A1'
+
+    def _command_complete(self, name, tag):
+        return 'OK', [self.readline()]
+
+    def read(self, size):
+        return b'x' * size
+
+    def readline(self):
+        return b'A1 OK done\r\n'
+
+    def send(self, data):
+        self.sent.append(data)
+
+
+class ImapStatisticsTests(unittest.TestCase):
+    """IMAP statistics test class."""
+
+    def setUp(self):
+        """Instantiate the statistics with its keyword listener."""
+        self.statistics = ImapStatistics()
+        self.listener = StatisticsListener(self.statistics, ['open_mailbox', 'wait_for_email'])
+
+    def test_should_record_commands_and_bytes_of_instrumented_session(self):
+        """Instrumented session should record command round-trips and bytes transferred."""
+        session = instrument(Session(), self.statistics)
+        self.assertIs(instrument(session, self.statistics), session)
+        session._simple_command('NOOP')
+        session.read(5)
+        total = self.statistics.snapshot()['total']
+        self.assertEqual(total['commands']['NOOP']['count'], 1)
+        self.assertGreaterEqual(total['commands']['NOOP']['max_seconds'], 0.0)
+        self.assertEqual(total['bytes_out'], len(b'A1 NOOP\r\n'))
+        self.assertEqual(total['bytes_in'], len(b'A1 OK done\r\n') + 5)
+        self.assertEqual(session.sent, [b'A1 NOOP\r\n'])
+
+    def test_should_record_statistics_per_library_keyword(self):
+        """Listener should only record the library keyword calls."""
+        attrs = {'kwname': 'Wait For Email', 'libname': 'ImapLibrary'}
+        self.listener.start_keyword('ImapLibrary.Wait For Email', attrs)
+        self.statistics.poll()
+        self.statistics.cache(True)
+        self.statistics.command('SEARCH', 0.25)
+        self.listener.end_keyword('ImapLibrary.Wait For Email', attrs)
+        for name, attrs in (('BuiltIn.Log', {'kwname': 'Log', 'libname': 'BuiltIn'}),
+                            ('Other.Wait For Email', {'kwname': 'Wait For Email',
+                                                      'libname': 'Other'})):
+            self.listener.start_keyword(name, attrs)
+            self.statistics.poll()
+            self.listener.end_keyword(name, attrs)
+        snapshot = self.statistics.snapshot()
+        self.assertEqual(list(snapshot['keywords']), ['Wait For Email'])
+        keyword = snapshot['keywords']['Wait For Email']
+        self.assertEqual((keyword['calls'], keyword['polls'], keyword['cache_hits']), (1, 1, 1))
+        self.assertEqual(keyword['commands'], {'SEARCH': {'count': 1, 'max_seconds': 0.25,
+                                                          'seconds': 0.25}})
+        self.assertEqual(snapshot['total']['polls'], 3)
+        self.statistics.reset()
+        self.assertEqual(self.statistics.snapshot()['total']['polls'], 0)
+
+    def test_should_format_prometheus_text(self):
+        """Statistics should be written in Prometheus text exposition format."""
+        self.statistics.start_keyword('Open "Mailbox"')
+        self.statistics.command('LOGIN', 0.5)
+        self.statistics.end_keyword()
+        text = self.statistics.to_prometheus()
+        self.assertIn('# TYPE imap_commands_total counter\n', text)
+        self.assertIn('imap_keyword_calls_total{keyword="Open \\"Mailbox\\""} 1\n', text)
+        self.assertIn('imap_command_seconds_max{keyword="Open \\"Mailbox\\"",command="LOGIN"} '
+                      '0.5\n', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
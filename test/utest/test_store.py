@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright 2015-2016 Richard Huang <rickypc@users.noreply.github.com>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+IMAP Library - a IMAP email testing library.
+"""
+
+from os.path import join
+from shutil import rmtree
+from sys import path
+from tempfile import mkdtemp
+path.append('src')
+from ImapLibrary.cache import MessageCache
+from ImapLibrary.store import DiskStore
+import unittest
+
+
+class DiskStoreTests(unittest.TestCase):
+    """On-disk message store test class."""
+
+    def setUp(self):
+        """Instantiate the on-disk store in a temporary directory."""
+        self.directory = mkdtemp()
+        self.path = join(self.directory, 'mail.db')
+        self.mailbox = ('my.imap', 993, 'username', 'INBOX')
+
+    def tearDown(self):
+        """Removes the temporary directory."""
+        rmtree(self.directory)
+
+    def test_should_keep_messages_across_instances(self):
+        """Stored email messages should be served by the next store instance."""
+        store = DiskStore(self.path)
+        store.put((self.mailbox, 7, 1), b'raw one')
+        store.close()
+        store = DiskStore(self.path)
+        self.assertEqual(store.get((self.mailbox, 7, 1)), b'raw one')
+        self.assertIsNone(store.get((self.mailbox, 8, 1)))
+        self.assertEqual(store.statistics(),
+                         {'bytes': 7, 'hits': 1, 'messages': 1, 'misses': 1})
+        store.close()
+
+    def test_should_evict_least_recently_used_messages(self):
+        """Store should evict the least recently used email messages beyond its size."""
+        store = DiskStore(self.path, max_bytes=10)
+        store.put((self.mailbox, 7, 1), b'aaaa')
+        store.put((self.mailbox, 7, 2), b'bbbb')
+        store.get((self.mailbox, 7, 1))
+        store.put((self.mailbox, 7, 3), b'cccc')
+        self.assertIsNone(store.get((self.mailbox, 7, 2)))
+        self.assertEqual(store.get((self.mailbox, 7, 1)), b'aaaa')
+        store.max_bytes = 4
+        store.evict()
+        self.assertEqual(len(store), 1)
+        store.close()
+
+    def test_should_serve_cache_misses_from_store(self):
+        """Message cache should serve memory misses from its store and clear both."""
+        store = DiskStore(self.path)
+        store.put((self.mailbox, 7, 1), b'From: a\r\n\r\nbody')
+        cache = MessageCache(store=store)
+        self.assertEqual(cache.get((self.mailbox, 7, 1)).message['From'], 'a')
+        self.assertEqual(cache.statistics()['messages'], 1)
+        cache.invalidate((self.mailbox, 7, 1))
+        self.assertEqual(len(store), 0)
+        cache.put((self.mailbox, 7, 2), b'raw')
+        cache.clear()
+        self.assertEqual((len(cache), len(store)), (0, 0))
+        store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
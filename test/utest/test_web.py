@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright 2015-2016 Richard Huang <rickypc@users.noreply.github.com>
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+
+"""
+IMAP Library - a IMAP email testing library.
+"""
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from sys import path
+from threading import Thread
+path.append('src')
+from ImapLibrary.web import HttpPool, decode_body
+import unittest
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Keep-alive HTTP request handler counting the connections it serves."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Serves the test pages."""
+        self.server.peers.add(self.client_address)
+        if self.path == '/redirect':
+            self._reply(302, b'', Location='/page?a=1')
+        elif self.path == '/large':
+            self._reply(200, b'x' * 100000, **{'Content-Type': 'text/plain'})
+        else:
+            self._reply(200, self.path.encode('utf-8'),
+                        **{'Content-Type': 'text/html; charset=utf-8'})
+
+    def log_message(self, *args):
+        """Does not log requests."""
+
+    def _reply(self, status, body, **headers):
+        """Sends a response of given ``status``, ``body`` and ``headers``."""
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class HttpPoolTests(unittest.TestCase):
+    """HTTP connection pool test class."""
+
+    def setUp(self):
+        """Starts a local HTTP server."""
+        self.server = HTTPServer(('127.0.0.1', 0), Handler)
+        self.server.peers = set()
+        self.thread = Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.pool = HttpPool()
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+
+    def tearDown(self):
+        """Stops the local HTTP server."""
+        self.pool.clear()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_should_reuse_keep_alive_connection(self):
+        """Open should reuse the idle connection of the same host."""
+        first = self.pool.open(self.url + '/one')
+        second = self.pool.open(self.url + '/redirect')
+        self.assertEqual((first.status, first.body, first.bytes), (200, u'/one', 4))
+        self.assertEqual((second.status, second.body), (200, u'/page?a=1'))
+        self.assertEqual(len(self.server.peers), 1)
+        self.assertEqual(len(self.pool), 1)
+
+    def test_should_truncate_large_response(self):
+        """Open should stop reading the response body after max bytes."""
+        result = self.pool.open(self.url + '/large', max_bytes=1000)
+        self.assertEqual((result.bytes, result.truncated), (1000, True))
+        self.assertEqual(len(self.pool), 0)
+
+    def test_should_record_connection_error(self):
+        """Open should return the connection error instead of raising it."""
+        self.assertIn('ValueError', self.pool.open('ftp://127.0.0.1/file').error)
+        self.server.server_close()
+        result = self.pool.open('http://127.0.0.1:1/', timeout=1)
+        self.assertIsNone(result.status)
+        self.assertIsNotNone(result.error)
+
+    def test_should_decode_body_with_charset(self):
+        """Decode body should use the content type charset, UTF-8 by default."""
+        self.assertEqual(decode_body(b'caf\xe9', 'text/html; charset="ISO-8859-1"'), u'caf\xe9')
+        self.assertEqual(decode_body(b'caf\xc3\xa9', 'text/html'), u'caf\xe9')
+        self.assertEqual(decode_body(b'caf\xc3\xa9', None), b'caf\xc3\xa9')
+
+
+if __name__ == '__main__':
+    unittest.main()